@@ -1,7 +1,28 @@
-from fastapi import APIRouter, HTTPException
-from app.schemas.route import RoutePlanRequest, RoutePlanResponse, CurlCommandResponse
-from app.services.routing import plan_optimized_route
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from app.schemas.route import (
+    BatchRoutePlanRequest,
+    BatchRoutePlanResponse,
+    CurlCommandResponse,
+    PlanJobResponse,
+    PlanPatchRequest,
+    RouteGeometryRequest,
+    RouteGeometryResponse,
+    RoutePlanRequest,
+    RoutePlanResponse,
+)
+from app.services.routing import plan_optimized_route_async, stream_optimized_route_async
 from app.services.curl_generator import generate_curl_commands
+from app.services.geocode_cache import geocode_cache
+from app.services.circuit_breaker import circuit_breaker_states
+from app.services.plan_cache import plan_cache, plan_cache_key
+from app.services.plan_jobs import JobQueueFullError, plan_job_manager
+from app.services.plan_store import apply_plan_changes, own_plan
+from app.services.batch_planning import plan_routes_batch
+from app.services.route_geometry import get_route_geometry
+from app.services.travel_matrix import travel_leg_cache
+from app.services.travel_model import travel_time_model
+from app.core.config import settings
 from app.core.logging import get_logger
 
 router = APIRouter()
@@ -11,25 +32,139 @@ logger = get_logger(__name__)
 def ping():
     return {"message": "pong"}
 
+@router.get("/health/providers")
+def provider_health():
+    return {"providers": circuit_breaker_states()}
+
+@router.get("/geocode-cache/stats")
+def geocode_cache_stats():
+    return geocode_cache.stats()
+
+@router.get("/travel-leg-cache/stats")
+def travel_leg_cache_stats():
+    return travel_leg_cache.stats()
+
+@router.get("/travel-model/stats")
+def travel_model_stats():
+    return travel_time_model.stats()
+
+@router.get("/plan-cache/stats")
+def plan_cache_stats():
+    return plan_cache.stats()
+
 @router.post("/plan-route", response_model=RoutePlanResponse)
-def plan_route(request: RoutePlanRequest):
+async def plan_route(request: RoutePlanRequest):
     try:
         if not request.houses:
             raise HTTPException(status_code=400, detail="houses must not be empty")
         logger.info(f"Received route planning request for {len(request.houses)} houses")
         logger.debug(f"Request.details: {request.model_dump()}")
         
-        result = plan_optimized_route(
+        async def compute_plan():
+            return await plan_optimized_route_async(
+                houses=request.houses,
+                start_address=request.start_address,
+                destination_address=request.destination_address,
+                global_start_time=request.global_start_time,
+                global_end_time=request.global_end_time,
+                deadline_sec=request.deadline_seconds
+            )
+
+        if settings.PLAN_CACHE_ENABLED:
+            result = await plan_cache.get_or_compute_async(plan_cache_key(request), compute_plan, share=own_plan)
+        else:
+            result = await compute_plan()
+        logger.info("Successfully generated route plan")
+        return result
+    except Exception as e:
+        logger.error(f"Error planning route: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.patch("/plans/{plan_id}", response_model=RoutePlanResponse)
+def patch_plan(plan_id: str, request: PlanPatchRequest):
+    """
+    Insert, remove or re-window stops of a plan returned by /plan-route by repairing its
+    route locally. The result is a new plan with its own plan_id
+    """
+    try:
+        result = apply_plan_changes(plan_id, request.changes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error updating plan {plan_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Plan not found")
+    return result
+
+@router.post("/plan-route/stream")
+async def plan_route_stream(request: RoutePlanRequest, http_request: Request):
+    """
+    Stream progressively better plans as NDJSON (default) or Server-Sent Events
+    (Accept: text/event-stream). See PlanStreamEvent for the event format.
+    """
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+    logger.info(f"Received streaming route planning request for {len(request.houses)} houses")
+
+    async def events():
+        async for event in stream_optimized_route_async(
             houses=request.houses,
             start_address=request.start_address,
             destination_address=request.destination_address,
             global_start_time=request.global_start_time,
-            global_end_time=request.global_end_time
-        )
-        logger.info("Successfully generated route plan")
-        return result
+            global_end_time=request.global_end_time,
+            deadline_sec=request.deadline_seconds
+        ):
+            payload = event.model_dump_json(exclude_none=True)
+            yield f"event: {event.event}\ndata: {payload}\n\n" if use_sse else payload + "\n"
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type)
+
+@router.post("/plan-routes:batch", response_model=BatchRoutePlanResponse)
+def plan_routes_batch_endpoint(request: BatchRoutePlanRequest):
+    if len(request.requests) > settings.BATCH_PLAN_MAX_TOURS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_PLAN_MAX_TOURS} tours per batch")
+    try:
+        logger.info(f"Received batch planning request for {len(request.requests)} tours")
+        results = plan_routes_batch(request.requests, max_parallel=request.max_parallel)
+        return BatchRoutePlanResponse(results=results)
     except Exception as e:
-        logger.error(f"Error planning route: {str(e)}", exc_info=True)
+        logger.error(f"Error planning route batch: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/plan-jobs", response_model=PlanJobResponse, status_code=202)
+def create_plan_job(request: RoutePlanRequest):
+    if not request.houses:
+        raise HTTPException(status_code=400, detail="houses must not be empty")
+    try:
+        return plan_job_manager.submit(request)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/plan-jobs/{job_id}", response_model=PlanJobResponse)
+def get_plan_job(job_id: str):
+    job = plan_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Plan job not found")
+    return job
+
+@router.delete("/plan-jobs/{job_id}", response_model=PlanJobResponse)
+def cancel_plan_job(job_id: str):
+    job = plan_job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Plan job not found")
+    return job
+
+@router.post("/route-geometry", response_model=RouteGeometryResponse)
+def route_geometry(request: RouteGeometryRequest):
+    """Map geometry for a planned route, fetched lazily and simplified for the requested zoom"""
+    try:
+        return get_route_geometry(request.addresses, zoom=request.zoom, tolerance_m=request.tolerance_meters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error fetching route geometry: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/generate-curl-commands", response_model=CurlCommandResponse)
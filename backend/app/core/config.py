@@ -16,7 +16,122 @@ class Settings(BaseSettings):
     GOOGLE_CLOUD_PROJECT_ID: Optional[str] = None
     GOOGLE_SERVICE_ACCOUNT_KEY: str = ""
     GOOGLE_SERVICE_ACCOUNT_KEY_PATH: str = ""
-    
+
+    # Persistent geocode cache (stored in the app database)
+    GEOCODE_CACHE_ENABLED: bool = True
+    GEOCODE_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+    GEOCODE_CACHE_MAX_ENTRIES: int = 50000
+    # Offline gazetteer (CSV or Parquet with address, lat, lng columns) consulted before Google
+    LOCAL_GEOCODER_PATH: str = ""
+    # Upper bound on concurrent geocoding requests per plan
+    GEOCODE_MAX_WORKERS: int = 8
+
+    # Travel-time matrix used by the local optimizers: "haversine" (calibrated estimates, no network),
+    # "osm" (offline road network) or "google" (paid computeRouteMatrix calls, opt-in)
+    TRAVEL_MATRIX_PROVIDER: str = "haversine"
+    TRAVEL_MATRIX_COORD_DECIMALS: int = 4  # coordinates are quantized to ~11 m for leg cache keys
+    TRAVEL_MATRIX_MAX_PARALLEL: int = 4  # concurrent computeRouteMatrix requests
+    TRAVEL_MATRIX_MAX_FETCH_POINTS: int = 100  # larger matrices (n^2 legs) use estimates instead of Google
+    TRAVEL_LEG_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    TRAVEL_LEG_CACHE_MAX_ENTRIES: int = 1000000
+    # Offline road network for the "osm" provider: an .osm XML extract (.pbf needs the osmium package).
+    # The contracted graph is cached at OSM_GRAPH_CACHE_PATH (default: next to the extract)
+    OSM_EXTRACT_PATH: str = ""
+    OSM_GRAPH_CACHE_PATH: str = ""
+    OSM_MAX_SNAP_KM: float = 1.0  # points farther than this from a road fall back to estimates
+    # Local travel-time estimates calibrated from observed Google legs per region cell and time of day
+    TRAVEL_MODEL_ENABLED: bool = True
+    TRAVEL_MODEL_CELL_DEGREES: float = 0.05  # ~5 km grid cells
+    TRAVEL_MODEL_BUCKET_HOURS: int = 1  # time-of-day buckets (UTC)
+    TRAVEL_MODEL_MIN_OBSERVATIONS: int = 20  # legs a table needs before it replaces a coarser one
+    ROUTE_MATRIX_TIMEOUT_SEC: float = 30.0
+
+    # Shared HTTP transport for Google clients
+    GOOGLE_HTTP_POOL_CONNECTIONS: int = 10  # number of per-host pools kept alive
+    GOOGLE_HTTP_POOL_MAXSIZE: int = 20  # keep-alive connections per host
+    GOOGLE_HTTP_ASYNC_MAX_CONNECTIONS: int = 200  # total connections for the async client
+    GOOGLE_HTTP_MAX_RETRIES: int = 3  # retries for 429/5xx responses and connection errors
+    GOOGLE_HTTP_BACKOFF_BASE_SEC: float = 0.5
+    GOOGLE_HTTP_BACKOFF_MAX_SEC: float = 8.0
+    GOOGLE_HTTP_CONNECT_TIMEOUT_SEC: float = 5.0
+    # Routes API intermediate waypoint cap; larger tours are split into segments optimized concurrently
+    ROUTES_API_MAX_INTERMEDIATES: int = 25
+    # Route Optimization API solve time limit: base + per-stop, capped, and scaled down for a warm start
+    ROUTE_OPTIMIZATION_SOLVE_BASE_SEC: float = 5.0
+    ROUTE_OPTIMIZATION_SOLVE_PER_STOP_SEC: float = 1.0
+    ROUTE_OPTIMIZATION_SOLVE_MAX_SEC: float = 60.0
+    # Inject the local solver's route as the Route Optimization API's first solution
+    ROUTE_OPTIMIZATION_WARM_START: bool = True
+    ROUTE_OPTIMIZATION_WARM_START_FACTOR: float = 0.25  # share of the time limit kept for a fully feasible warm start
+    # Service endpoints (overridable to point at a local stand-in server)
+    ROUTE_OPTIMIZATION_BASE_URL: str = "https://routeoptimization.googleapis.com"
+    GCS_BASE_URL: str = "https://storage.googleapis.com"
+    # batchOptimizeTours reads models from and writes results to this GCS bucket; unset disables batching
+    ROUTE_OPTIMIZATION_BATCH_GCS_BUCKET: str = ""
+    ROUTE_OPTIMIZATION_BATCH_MIN_TOURS: int = 2
+    ROUTE_OPTIMIZATION_BATCH_POLL_INITIAL_SEC: float = 2.0
+    ROUTE_OPTIMIZATION_BATCH_POLL_MAX_SEC: float = 30.0
+    ROUTE_OPTIMIZATION_BATCH_TIMEOUT_SEC: float = 1800.0
+
+    # Cached OAuth access tokens are refreshed this many seconds before they expire
+    OAUTH_TOKEN_REFRESH_MARGIN_SEC: int = 300
+    OAUTH_BACKGROUND_REFRESH: bool = True
+    # Per-endpoint read timeouts
+    GEOCODING_TIMEOUT_SEC: float = 15.0
+    ROUTES_API_TIMEOUT_SEC: float = 30.0
+    ROUTE_OPTIMIZATION_TIMEOUT_SEC: float = 60.0
+
+    # From this many stops on, local solvers find neighbouring stops with a spatial index
+    SPATIAL_INDEX_MIN_STOPS: int = 200
+    # Tours with at most this many stops are solved exactly (Held-Karp) before any other method
+    EXACT_SOLVER_MAX_STOPS: int = 12
+    # Local time-window solver (insertion + local search) caps
+    LOCAL_SOLVER_TIME_LIMIT_SEC: float = 0.1
+    LOCAL_SOLVER_MAX_ITERATIONS: int = 5000
+    LOCAL_SOLVER_NEIGHBORS: int = 10  # candidate moves per stop are limited to its nearest neighbours
+    LOCAL_SOLVER_INSERTION_MAX_STOPS: int = 150  # cheapest insertion is ~O(n^3); more stops are seeded nearest-neighbour
+    # Multi-start local search on a process pool (one perturbation chain per worker)
+    LOCAL_SOLVER_PARALLEL: bool = False
+    LOCAL_SOLVER_PARALLEL_WORKERS: Optional[int] = None  # defaults to the number of CPU cores
+    LOCAL_SOLVER_PARALLEL_TIME_LIMIT_SEC: float = 1.0
+    LOCAL_SOLVER_PARALLEL_MIN_STOPS: int = 20
+
+    # Default per-request latency budget for route planning; unset runs providers strictly in sequence
+    ROUTE_PLAN_DEADLINE_SEC: Optional[float] = None
+
+    # In-memory cache of complete route plans keyed on the canonical request
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_TTL_SECONDS: int = 600
+    PLAN_CACHE_MAX_ENTRIES: int = 512
+
+    # Route geometry (POST /route-geometry): full-resolution polylines and their simplified variants
+    ROUTE_GEOMETRY_CACHE_TTL_SECONDS: int = 24 * 3600
+    ROUTE_GEOMETRY_CACHE_MAX_ENTRIES: int = 1024
+    ROUTE_GEOMETRY_TOLERANCE_PX: float = 1.0  # simplification tolerance in screen pixels at the requested zoom
+
+    # Stored plans that PATCH /plans/{plan_id} repairs incrementally
+    PLAN_STORE_TTL_SECONDS: int = 7 * 24 * 3600
+    PLAN_STORE_PURGE_INTERVAL_SEC: int = 300  # expired plans are deleted at most this often
+    PLAN_REPAIR_TIME_LIMIT_SEC: float = 0.05  # local search after inserting or removing stops
+
+    # Background plan jobs (POST /plan-jobs)
+    PLAN_JOB_WORKERS: int = 2
+    PLAN_JOB_MAX_QUEUED: int = 100  # jobs waiting for a worker before new submissions are rejected
+    PLAN_JOB_LEASE_SECONDS: int = 120  # running jobs not renewed for this long are taken over by another process
+
+    # Batch planning (POST /plan-routes:batch)
+    BATCH_PLAN_MAX_PARALLEL: int = 8  # tours optimized concurrently
+    BATCH_PLAN_MAX_TOURS: int = 500
+
+    # Per-provider circuit breakers for the remote optimizers
+    CIRCUIT_BREAKER_CONSECUTIVE_FAILURES: int = 3  # open after this many failures in a row
+    CIRCUIT_BREAKER_FAILURE_RATE: float = 0.5  # ...or when this share of the recent window failed
+    CIRCUIT_BREAKER_WINDOW_SIZE: int = 20
+    CIRCUIT_BREAKER_MIN_CALLS: int = 5  # calls in the window before the failure rate is considered
+    CIRCUIT_BREAKER_SLOW_CALL_SEC: Optional[float] = None  # successful calls slower than this count as failures
+    CIRCUIT_BREAKER_OPEN_SECONDS: float = 30.0  # time before a half-open probe is allowed
+    CIRCUIT_BREAKER_MIN_BUDGET_SEC: float = 10.0  # calls that run out of a shorter caller budget are not counted as failures
+
     def get_service_account_key(self):
         """Get service account key from file path or direct JSON string"""
         if self.GOOGLE_SERVICE_ACCOUNT_KEY_PATH:
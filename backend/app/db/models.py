@@ -0,0 +1,56 @@
+from sqlalchemy import Boolean, Column, Float, Integer, String, Text
+from app.db.base import Base
+
+class GeocodeCacheEntry(Base):
+    """Geocoding result keyed by normalized address"""
+    __tablename__ = "geocode_cache"
+
+    normalized_address = Column(String, primary_key=True)
+    lat = Column(Float, nullable=False)
+    lng = Column(Float, nullable=False)
+    created_at = Column(Integer, nullable=False)
+    last_accessed_at = Column(Integer, nullable=False, index=True)
+
+class TravelLegCacheEntry(Base):
+    """Travel time between quantized coordinates for one departure-hour bucket"""
+    __tablename__ = "travel_leg_cache"
+
+    leg_key = Column(String, primary_key=True)
+    duration_sec = Column(Integer, nullable=False)
+    distance_meters = Column(Integer, nullable=True)
+    created_at = Column(Integer, nullable=False, index=True)
+
+class TravelModelStats(Base):
+    """Running sums of observed legs for one travel model table (region cell, time-of-day bucket)"""
+    __tablename__ = "travel_model_stats"
+
+    cell = Column(String, primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+    sum_km = Column(Float, nullable=False)
+    sum_sec = Column(Float, nullable=False)
+    sum_km_sq = Column(Float, nullable=False)
+    sum_km_sec = Column(Float, nullable=False)
+
+class PlanJob(Base):
+    """Asynchronous route planning job and its persisted outcome"""
+    __tablename__ = "plan_jobs"
+
+    id = Column(String, primary_key=True)
+    status = Column(String, nullable=False, index=True)
+    request_json = Column(Text, nullable=False)
+    result_json = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(Integer, nullable=False)
+    updated_at = Column(Integer, nullable=False)
+    owner = Column(String, nullable=True)  # worker process running the job
+    lease_expires_at = Column(Integer, nullable=True)  # owner must renew before this or the job is re-queued
+
+class StoredRoutePlan(Base):
+    """Geocoded stops and visit order of a planned route, kept for incremental changes"""
+    __tablename__ = "route_plans"
+
+    id = Column(String, primary_key=True)
+    state_json = Column(Text, nullable=False)
+    created_at = Column(Integer, nullable=False, index=True)
@@ -1,12 +1,30 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.router import api_router
 from app.core.config import settings
 from app.core.logging import setup_logging
+from app.services.google import async_transport
+from app.services.parallel_search import local_search_pool
+from app.services.plan_jobs import plan_job_manager
+from app.services.road_network import preload_road_network
 
 setup_logging()
 
-app = FastAPI(title="Realtor Planning App")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    plan_job_manager.resume_pending()
+    if settings.LOCAL_SOLVER_PARALLEL:
+        local_search_pool.start()
+    # Build the road network before serving instead of inside the first osm request
+    await asyncio.to_thread(preload_road_network)
+    yield
+    plan_job_manager.shutdown()
+    local_search_pool.shutdown()
+    await async_transport.aclose()
+
+app = FastAPI(title="Realtor Planning App", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -22,6 +22,7 @@ class RoutePlanRequest(BaseModel):
     houses: List[HouseVisit]
     global_start_time: datetime
     global_end_time: datetime
+    deadline_seconds: Optional[float] = None  # Latency budget; enables hedged optimization
 
 class StopAssignment(BaseModel):
     address: str
@@ -34,8 +35,57 @@ class StopAssignment(BaseModel):
 class RoutePlanResponse(BaseModel):
     route: List[StopAssignment]
     optimization_method: str
+    plan_id: Optional[str] = None  # pass to PATCH /plans/{plan_id} to change stops without replanning
+
+class PlanChange(BaseModel):
+    op: str  # "insert", "remove" or "update_window"
+    house: Optional[HouseVisit] = None  # the house to insert
+    address: Optional[str] = None  # the stop to remove or update
+    start_time: Optional[datetime] = None  # new window for update_window
+    end_time: Optional[datetime] = None
+
+class PlanPatchRequest(BaseModel):
+    changes: List[PlanChange]
+
+class PlanStreamEvent(BaseModel):
+    event: str  # "plan" for each improved schedule, "done" at the end, "error" on failure
+    optimization_method: Optional[str] = None
+    cost: Optional[float] = None
+    route: Optional[List[StopAssignment]] = None
+    detail: Optional[str] = None
 
 class CurlCommandResponse(BaseModel):
     route_optimization_api: str
     routes_api: str
-    setup_instructions: Dict[str, Dict[str, str]]
\ No newline at end of file
+    setup_instructions: Dict[str, Dict[str, str]]
+
+class BatchRoutePlanRequest(BaseModel):
+    requests: List[RoutePlanRequest]
+    max_parallel: Optional[int] = None  # defaults to, and is capped at, BATCH_PLAN_MAX_PARALLEL
+
+class BatchRoutePlanItem(BaseModel):
+    index: int
+    result: Optional[RoutePlanResponse] = None
+    error: Optional[str] = None
+
+class BatchRoutePlanResponse(BaseModel):
+    results: List[BatchRoutePlanItem]
+
+class PlanJobResponse(BaseModel):
+    job_id: str
+    status: str
+    created_at: datetime
+    updated_at: datetime
+    result: Optional[RoutePlanResponse] = None
+    error: Optional[str] = None
+
+class RouteGeometryRequest(BaseModel):
+    addresses: List[str]  # start, stops in visit order, destination
+    zoom: Optional[int] = None  # map zoom level the geometry is drawn at
+    tolerance_meters: Optional[float] = None  # explicit simplification tolerance; overrides zoom
+
+class RouteGeometryResponse(BaseModel):
+    encoded_polyline: str
+    point_count: int
+    original_point_count: int
+    tolerance_meters: float
@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.schemas.route import BatchRoutePlanItem, RouteOptimizationParams, RoutePlanResponse
+from app.services.geocoding import geocode_unique_addresses
+from app.services.circuit_breaker import call_with_circuit_breaker
+from app.services.google.route_optimization_api import batch_optimize_routes, get_oauth_token
+from app.services.plan_cache import plan_cache, plan_cache_key
+from app.services.plan_store import own_plan, plan_store
+from app.services.routing import (
+    _assemble_route_stops,
+    _route_stop_addresses,
+    run_hedged_optimizers,
+    run_sequential_optimizers,
+)
+
+logger = get_logger(__name__)
+
+ROUTE_OPTIMIZATION_METHOD = "Google Route Optimization API"
+BATCH_OPTIMIZATION_METHOD = "Google Route Optimization API (batch)"
+
+def _tour_params(request, coordinates):
+    start_location, destination_location, locations = _assemble_route_stops(
+        request.houses, request.destination_address, coordinates
+    )
+    return RouteOptimizationParams(
+        locations=locations,
+        start_location=start_location,
+        destination_location=destination_location,
+        global_start_time=request.global_start_time,
+        global_end_time=request.global_end_time
+    )
+
+def _optimize_tour(request, optimization_params, method_kwargs):
+    deadline_sec = request.deadline_seconds or settings.ROUTE_PLAN_DEADLINE_SEC
+    if deadline_sec:
+        result = run_hedged_optimizers(optimization_params, deadline_sec, method_kwargs=method_kwargs)
+    else:
+        result = run_sequential_optimizers(optimization_params, method_kwargs=method_kwargs)
+    result.plan_id = plan_store.save(optimization_params, result)
+    return result
+
+def _batch_optimize(tour_params, auth_token):
+    """
+    Solve tours with a single batchOptimizeTours operation.
+    Returns index -> RoutePlanResponse (stored in the plan store) for the tours that came
+    back with a route; the rest are left for the per-tour optimizer chain.
+    """
+    indexes = list(tour_params)
+    try:
+        outcomes = call_with_circuit_breaker(
+            BATCH_OPTIMIZATION_METHOD, batch_optimize_routes, [tour_params[i] for i in indexes], auth_token=auth_token
+        )
+    except Exception as e:
+        logger.warning(f"batchOptimizeTours failed, planning tours individually: {str(e)}")
+        return {}
+
+    planned = {}
+    for i, outcome in zip(indexes, outcomes):
+        if outcome and not isinstance(outcome, Exception):
+            planned[i] = RoutePlanResponse(route=outcome, optimization_method=ROUTE_OPTIMIZATION_METHOD)
+            planned[i].plan_id = plan_store.save(tour_params[i], planned[i])
+    logger.info(f"batchOptimizeTours planned {len(planned)}/{len(indexes)} tours")
+    return planned
+
+def plan_routes_batch(requests, max_parallel=None):
+    """
+    Plan many tours in one call.
+    Every distinct address across the batch is geocoded once, one OAuth token is shared by
+    all Route Optimization API calls, and tours are optimized concurrently on a bounded
+    pool. With ROUTE_OPTIMIZATION_BATCH_GCS_BUCKET set, the tours are first solved together
+    in one batchOptimizeTours operation and only tours it could not solve go through the
+    per-tour chain. Returns one BatchRoutePlanItem per request, in input order; a failing
+    tour carries its error instead of failing the batch.
+    """
+    items = [BatchRoutePlanItem(index=i) for i in range(len(requests))]
+    cache_keys = [plan_cache_key(r) for r in requests]
+
+    # Serve unchanged tours from the plan cache and validate the rest
+    pending = []
+    for i, request in enumerate(requests):
+        if not request.houses:
+            items[i].error = "houses must not be empty"
+            continue
+        cached = plan_cache.get(cache_keys[i]) if settings.PLAN_CACHE_ENABLED else None
+        if cached is not None:
+            items[i].result = own_plan(cached)
+            continue
+        pending.append(i)
+
+    if not pending:
+        return items
+
+    addresses = [a for i in pending for a in _route_stop_addresses(requests[i].houses, requests[i].start_address, requests[i].destination_address)]
+    geocoded, failures = geocode_unique_addresses(addresses)
+    logger.info(f"Batch of {len(requests)} tours: geocoded {len(geocoded)} unique addresses, {len(failures)} failed")
+
+    tour_params = {}
+    for i in pending:
+        request = requests[i]
+        tour_addresses = _route_stop_addresses(request.houses, request.start_address, request.destination_address)
+        tour_failures = {a: failures[a] for a in tour_addresses if a in failures}
+        if tour_failures:
+            details = "; ".join(f"{a}: {e}" for a, e in tour_failures.items())
+            items[i].error = f"Geocoding failed for {len(tour_failures)} address(es): {details}"
+            continue
+        tour_params[i] = _tour_params(request, [geocoded[a] for a in tour_addresses])
+
+    auth_token = get_oauth_token()
+    method_kwargs = {ROUTE_OPTIMIZATION_METHOD: {"auth_token": auth_token}} if auth_token else {}
+
+    if settings.ROUTE_OPTIMIZATION_BATCH_GCS_BUCKET and auth_token and len(tour_params) >= settings.ROUTE_OPTIMIZATION_BATCH_MIN_TOURS:
+        for i, plan in _batch_optimize(tour_params, auth_token).items():
+            items[i].result = plan
+            if settings.PLAN_CACHE_ENABLED:
+                plan_cache.set(cache_keys[i], plan)
+            del tour_params[i]
+
+    def plan_one(i):
+        request = requests[i]
+        def compute_plan():
+            return _optimize_tour(request, tour_params[i], method_kwargs)
+
+        try:
+            if settings.PLAN_CACHE_ENABLED:
+                # Identical tours in the same batch coalesce onto one optimization
+                items[i].result = plan_cache.get_or_compute(cache_keys[i], compute_plan, share=own_plan)
+            else:
+                items[i].result = compute_plan()
+        except Exception as e:
+            logger.warning(f"Batch tour {i} failed: {str(e)}")
+            items[i].error = str(e)
+
+    if tour_params:
+        # Clients may ask for less parallelism than BATCH_PLAN_MAX_PARALLEL, never more
+        limit = settings.BATCH_PLAN_MAX_PARALLEL
+        workers = max(1, min(max_parallel or limit, limit, len(tour_params)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-plan") as executor:
+            list(executor.map(plan_one, list(tour_params)))
+
+    succeeded = sum(1 for item in items if item.result is not None)
+    logger.info(f"Batch planning finished: {succeeded}/{len(requests)} tours planned")
+    return items
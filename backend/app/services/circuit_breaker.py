@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# A failed call that used this share of its caller's budget (timeout_sec) ran out of budget
+BUDGET_SPENT_SHARE = 0.9
+
+class CircuitOpenError(Exception):
+    """Raised when a provider is skipped because its circuit breaker is open"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one remote provider.
+    Opens after consecutive failures or a high failure rate over a sliding window of
+    recent calls, rejects calls while open, and after open_seconds lets a single
+    half-open probe through: success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, name: str, consecutive_failures: Optional[int] = None, failure_rate: Optional[float] = None,
+                 window_size: Optional[int] = None, min_calls: Optional[int] = None,
+                 slow_call_sec: Optional[float] = None, open_seconds: Optional[float] = None):
+        self.name = name
+        self.consecutive_failures_threshold = consecutive_failures if consecutive_failures is not None else settings.CIRCUIT_BREAKER_CONSECUTIVE_FAILURES
+        self.failure_rate_threshold = failure_rate if failure_rate is not None else settings.CIRCUIT_BREAKER_FAILURE_RATE
+        self.min_calls = min_calls if min_calls is not None else settings.CIRCUIT_BREAKER_MIN_CALLS
+        self.slow_call_sec = slow_call_sec if slow_call_sec is not None else settings.CIRCUIT_BREAKER_SLOW_CALL_SEC
+        self.open_seconds = open_seconds if open_seconds is not None else settings.CIRCUIT_BREAKER_OPEN_SECONDS
+
+        self.state = CLOSED
+        self.opened_at: Optional[float] = None
+        self.consecutive_failures = 0
+        self.outcomes = deque(maxlen=window_size if window_size is not None else settings.CIRCUIT_BREAKER_WINDOW_SIZE)  # (ok, latency_sec)
+        self.rejected_calls = 0
+        self.last_error: Optional[str] = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Return True if a call may proceed; moves an expired open circuit to half-open"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                logger.info(f"Circuit breaker '{self.name}' half-open; probing provider")
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected_calls += 1
+            return False
+
+    def record_success(self, latency_sec: float):
+        if self.slow_call_sec is not None and latency_sec > self.slow_call_sec:
+            self.record_failure(latency_sec, f"slow call ({latency_sec:.1f}s)")
+            return
+        with self._lock:
+            if self.state == OPEN:
+                # A call admitted before the circuit opened; only the half-open probe may close it
+                return
+            self.outcomes.append((True, latency_sec))
+            self.consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                logger.info(f"Circuit breaker '{self.name}' closed after successful probe")
+                self.state = CLOSED
+                self.outcomes.clear()
+                self.outcomes.append((True, latency_sec))
+            self._probe_in_flight = False
+
+    def record_failure(self, latency_sec: float, error: Optional[str] = None):
+        with self._lock:
+            self.outcomes.append((False, latency_sec))
+            self.consecutive_failures += 1
+            self.last_error = error
+            self._probe_in_flight = False
+
+            if self.state == HALF_OPEN:
+                self._open("half-open probe failed")
+                return
+            if self.state == CLOSED:
+                failures = sum(1 for ok, _ in self.outcomes if not ok)
+                if self.consecutive_failures >= self.consecutive_failures_threshold:
+                    self._open(f"{self.consecutive_failures} consecutive failures")
+                elif len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate_threshold:
+                    self._open(f"failure rate {failures}/{len(self.outcomes)}")
+
+    def record_cancelled(self):
+        """A call was abandoned before it finished; release the half-open probe slot without an outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _open(self, reason: str):
+        logger.warning(f"Circuit breaker '{self.name}' opened: {reason}")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict:
+        """State and recent statistics for health reporting"""
+        with self._lock:
+            latencies = sorted(latency for _, latency in self.outcomes)
+            failures = sum(1 for ok, _ in self.outcomes if not ok)
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+            return {
+                "state": self.state,
+                "recent_calls": len(self.outcomes),
+                "failure_rate": failures / len(self.outcomes) if self.outcomes else 0.0,
+                "consecutive_failures": self.consecutive_failures,
+                "avg_latency_sec": sum(latencies) / len(latencies) if latencies else None,
+                "p95_latency_sec": latencies[int(0.95 * (len(latencies) - 1))] if latencies else None,
+                "rejected_calls": self.rejected_calls,
+                "retry_in_sec": retry_in,
+                "last_error": self.last_error,
+            }
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Return the process-wide circuit breaker for a provider, creating it on first use"""
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+def circuit_breaker_states() -> Dict[str, Dict]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+def _caller_budget_spent(timeout_sec: Optional[float], latency_sec: float) -> bool:
+    """
+    True when a failed call ran out of a caller latency budget (timeout_sec) shorter than
+    CIRCUIT_BREAKER_MIN_BUDGET_SEC: the timeout says more about the caller than the provider
+    """
+    return (timeout_sec is not None and timeout_sec < settings.CIRCUIT_BREAKER_MIN_BUDGET_SEC
+            and latency_sec >= timeout_sec * BUDGET_SPENT_SHARE)
+
+def _record_error(breaker: CircuitBreaker, latency_sec: float, error: Exception, timeout_sec: Optional[float]):
+    if _caller_budget_spent(timeout_sec, latency_sec):
+        logger.debug(f"{breaker.name} ran out of its {timeout_sec:.1f}s caller budget; not counted as a failure")
+        breaker.record_cancelled()
+    else:
+        breaker.record_failure(latency_sec, str(error))
+
+def call_with_circuit_breaker(name: str, func, *args, **kwargs):
+    """
+    Call func through the named provider's breaker; raises CircuitOpenError if the circuit is open.
+    A timeout_sec keyword argument is the caller's latency budget, see _caller_budget_spent.
+    """
+    breaker = get_circuit_breaker(name)
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"Circuit breaker open for {name}; skipping provider")
+    started = time.monotonic()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        _record_error(breaker, time.monotonic() - started, e, kwargs.get("timeout_sec"))
+        raise
+    if not result:
+        breaker.record_failure(time.monotonic() - started, "empty result")
+        return result
+    breaker.record_success(time.monotonic() - started)
+    return result
+
+async def call_with_circuit_breaker_async(name: str, func, *args, **kwargs):
+    """Async call_with_circuit_breaker for coroutine functions; cancellation records no outcome"""
+    breaker = get_circuit_breaker(name)
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"Circuit breaker open for {name}; skipping provider")
+    started = time.monotonic()
+    try:
+        result = await func(*args, **kwargs)
+    except asyncio.CancelledError:
+        breaker.record_cancelled()
+        raise
+    except Exception as e:
+        _record_error(breaker, time.monotonic() - started, e, kwargs.get("timeout_sec"))
+        raise
+    if not result:
+        breaker.record_failure(time.monotonic() - started, "empty result")
+        return result
+    breaker.record_success(time.monotonic() - started)
+    return result
@@ -1,8 +1,10 @@
 import json
 from datetime import datetime, timezone
 from app.core.config import settings
-from app.services.geocoding import geocode_address
+from app.services.routing import geocode_route_stops
 from app.services.google.route_optimization_api import build_payload as build_route_optimization_payload
+from app.services.google.route_optimization_api import optimize_tours_url, warm_start_route
+from app.services.google.routes_api import FIELD_MASK as ROUTES_API_FIELD_MASK
 from app.services.google.routes_api import build_payload as build_routes_api_payload
 from app.schemas.route import RouteOptimizationParams
 from app.core.logging import get_logger
@@ -19,31 +21,8 @@ def generate_curl_commands(request_data):
         start_address = request_data.start_address
         destination_address = request_data.destination_address
         
-        # Geocode addresses
-        start_lat, start_lng = geocode_address(start_address)
-        start_location = {"lat": start_lat, "lng": start_lng}
-        
-        destination_location = None
-        if destination_address:
-            dest_lat, dest_lng = geocode_address(destination_address)
-            destination_location = {"lat": dest_lat, "lng": dest_lng}
-        
-        # Build locations array (same format used by both APIs)
-        locations = []
-        for h in houses:
-            lat, lng = geocode_address(h.address)
-            # Convert datetime objects to timestamps
-            start_ts = int(h.start_time.timestamp())
-            end_ts = int(h.end_time.timestamp())
-            locations.append({
-                "lat": lat,
-                "lng": lng,
-                "start_ts": start_ts,
-                "end_ts": end_ts,
-                "visit_duration_sec": h.duration_minutes * 60,
-                "original_index": len(locations),
-                "house_data": h
-            })
+        # Geocode all addresses concurrently (same format used by both APIs)
+        start_location, destination_location, locations = geocode_route_stops(houses, start_address, destination_address)
         
         # Create optimization parameters object
         optimization_params = RouteOptimizationParams(
@@ -55,9 +34,9 @@ def generate_curl_commands(request_data):
         )
         
         # Generate Route Optimization API curl command
-        route_optimization_payload = build_route_optimization_payload(optimization_params)
+        route_optimization_payload = build_route_optimization_payload(optimization_params, initial_route=warm_start_route(optimization_params))
         
-        route_optimization_curl = f"""curl -X POST "https://routeoptimization.googleapis.com/v1/projects/{settings.GOOGLE_CLOUD_PROJECT_ID}:optimizeTours" \\
+        route_optimization_curl = f"""curl -X POST "{optimize_tours_url()}" \\
   -H "Content-Type: application/json" \\
   -H "Authorization: Bearer YOUR_OAUTH_TOKEN" \\
   -d '{json.dumps(route_optimization_payload, indent=2)}'"""
@@ -68,7 +47,7 @@ def generate_curl_commands(request_data):
         routes_api_curl = f"""curl -X POST "https://routes.googleapis.com/directions/v2:computeRoutes" \\
   -H "Content-Type: application/json" \\
   -H "X-Goog-Api-Key: YOUR_GOOGLE_MAPS_API_KEY" \\
-  -H "X-Goog-FieldMask: routes.duration,routes.distanceMeters,routes.legs.duration,routes.legs.distanceMeters,routes.legs.steps,routes.optimizedIntermediateWaypointIndex" \\
+  -H "X-Goog-FieldMask: {ROUTES_API_FIELD_MASK}" \\
   -d '{json.dumps(routes_api_payload, indent=2)}'"""
         
         return {
@@ -0,0 +1,43 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometers"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lng = math.radians(lng2 - lng1)
+
+    a = (math.sin(delta_lat / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng / 2) ** 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+def haversine_km_matrix(origins, destinations=None) -> np.ndarray:
+    """
+    Pairwise great-circle distances in kilometers, computed in one vectorized pass.
+    origins and destinations are sequences (or arrays) of (lat, lng); destinations
+    defaults to origins. Returns an array of shape (len(origins), len(destinations)).
+    """
+    origins = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    destinations = origins if destinations is None else np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+    lat1 = origins[:, 0][:, np.newaxis]
+    lng1 = origins[:, 1][:, np.newaxis]
+    lat2 = destinations[:, 0][np.newaxis, :]
+    lng2 = destinations[:, 1][np.newaxis, :]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_km_pairs(origins, destinations) -> np.ndarray:
+    """Great-circle distances in kilometers between origins[i] and destinations[i], element-wise"""
+    origins = np.radians(np.asarray(origins, dtype=np.float64).reshape(-1, 2))
+    destinations = np.radians(np.asarray(destinations, dtype=np.float64).reshape(-1, 2))
+    lat1, lng1 = origins[:, 0], origins[:, 1]
+    lat2, lng2 = destinations[:, 0], destinations[:, 1]
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
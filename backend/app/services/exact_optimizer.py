@@ -0,0 +1,114 @@
+import time
+from typing import Optional
+import numpy as np
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.vrptw_optimizer import build_problem, schedule_route
+from app.schemas.route import RouteOptimizationParams
+
+logger = get_logger(__name__)
+
+INFEASIBLE = np.iinfo(np.int64).max // 4
+
+def held_karp(travel, ready, due, service, start_ts):
+    """
+    Exact time-window TSP over the solver-core arrays (node 0 start, 1..n stops, n + 1 end).
+    dp[mask, k] is the earliest service start at stop k after visiting exactly the stops in
+    mask on time. Waiting never helps a later stop arrive earlier, so keeping only the
+    earliest time per (mask, last stop) is exact. States that would be late are dropped, as
+    are transitions into a stop before every stop that has to precede it was visited.
+    Returns the stop order with the earliest arrival at the end, or None if no order keeps
+    every visit on time.
+    """
+    travel = np.asarray(travel, dtype=np.int64)
+    ready = np.asarray(ready, dtype=np.int64)
+    due = np.asarray(due, dtype=np.int64)
+    service = np.asarray(service, dtype=np.int64)
+    n = len(travel) - 2
+    end = n + 1
+    if n == 0:
+        return []
+
+    stop_travel = travel[1:end, 1:end]
+    stop_ready, stop_due, stop_service = ready[1:end], due[1:end], service[1:end]
+
+    # predecessors[k]: stops that must be visited before k, because even leaving k as early
+    # as its window allows reaches them after their window closes
+    predecessors = [0] * n
+    for k in range(n):
+        for j in range(n):
+            if j != k and stop_ready[k] + stop_service[k] + stop_travel[k, j] > stop_due[j]:
+                predecessors[k] |= 1 << j
+
+    full = (1 << n) - 1
+    masks = np.arange(1 << n, dtype=np.int64)
+    popcount = np.zeros(1 << n, dtype=np.int64)
+    for k in range(n):
+        popcount += (masks >> k) & 1
+
+    dp = np.full((1 << n, n), INFEASIBLE, dtype=np.int64)
+    first = np.maximum(start_ts + travel[0, 1:end], stop_ready)
+    for k in range(n):
+        if first[k] <= stop_due[k] and not predecessors[k]:
+            dp[1 << k, k] = first[k]
+
+    for size in range(1, n):
+        layer = masks[popcount == size]
+        for j in range(n):
+            begin = dp[layer, j]
+            reachable = begin < INFEASIBLE
+            if not reachable.any():
+                continue
+            from_masks, departures = layer[reachable], begin[reachable] + stop_service[j]
+            for k in range(n):
+                # k is not visited yet and every stop that has to come before k already is
+                candidates = ((from_masks >> k) & 1 == 0) & ((~from_masks & predecessors[k]) == 0)
+                if not candidates.any():
+                    continue
+                arrival = np.maximum(departures[candidates] + stop_travel[j, k], stop_ready[k])
+                on_time = arrival <= stop_due[k]
+                if not on_time.any():
+                    continue
+                np.minimum.at(dp[:, k], from_masks[candidates][on_time] | (1 << k), arrival[on_time])
+
+    finish = np.where(dp[full] < INFEASIBLE, dp[full] + stop_service + travel[1:end, end], INFEASIBLE)
+    finish = np.where(finish <= due[end], finish, INFEASIBLE)
+    last = int(np.argmin(finish))
+    if finish[last] >= INFEASIBLE:
+        return None
+
+    # Walk back through the table to recover the order
+    order = [last]
+    mask = full
+    while mask != 1 << last:
+        previous_mask = mask & ~(1 << last)
+        for j in range(n):
+            begin = dp[previous_mask, j]
+            if begin < INFEASIBLE and max(begin + stop_service[j] + stop_travel[j, last], stop_ready[last]) == dp[mask, last]:
+                break
+        else:
+            raise Exception("Held-Karp table is inconsistent")
+        order.append(j)
+        mask, last = previous_mask, j
+    return [k + 1 for k in reversed(order)]
+
+def optimize_route(params: RouteOptimizationParams, deadline: Optional[float] = None):
+    """
+    Optimal route for small tours (at most EXACT_SOLVER_MAX_STOPS stops) with time windows and
+    an optional fixed destination. Raises if the tour is too large or no on-time order exists,
+    so the next method in the chain takes over.
+    """
+    stop_count = len(params.locations)
+    if stop_count > settings.EXACT_SOLVER_MAX_STOPS:
+        raise Exception(f"{stop_count} stops exceeds EXACT_SOLVER_MAX_STOPS ({settings.EXACT_SOLVER_MAX_STOPS})")
+    if not stop_count:
+        return []
+
+    started = time.perf_counter()
+    travel, ready, due, service, start_ts = build_problem(params, deadline)
+    order = held_karp(travel, ready, due, service, start_ts)
+    if order is None:
+        raise Exception("No order visits every stop within its time window")
+
+    logger.info(f"Exact solver planned {stop_count} stops in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return schedule_route(order, params, travel, ready, due, service, start_ts)
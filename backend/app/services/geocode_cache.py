@@ -0,0 +1,139 @@
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from sqlalchemy import func
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db.models import GeocodeCacheEntry
+from app.db.session import SessionLocal, init_db
+
+logger = get_logger(__name__)
+
+# Unit designators that do not change the geocoded point ("Apt 4B", "Suite 200", "#12")
+_UNIT_SUFFIX_RE = re.compile(r"\b(?:apt|apartment|unit|suite|ste|rm|room)\b\.?\s*#?\s*[\w-]+\b|#\s*[\w-]+")
+_PUNCTUATION_RE = re.compile(r"[.,;]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_address(address: str) -> str:
+    """Normalize an address so case, whitespace and unit-suffix variants share a cache key"""
+    normalized = address.lower()
+    normalized = _UNIT_SUFFIX_RE.sub(" ", normalized)
+    normalized = _PUNCTUATION_RE.sub(" ", normalized)
+    return _WHITESPACE_RE.sub(" ", normalized).strip()
+
+class GeocodeCache:
+    """
+    Persistent geocode cache backed by the app database.
+    Entries expire after ttl_seconds; when the table grows past max_entries
+    the least recently used entries are evicted.
+    """
+
+    def __init__(self, session_factory=SessionLocal, ttl_seconds: Optional[int] = None, max_entries: Optional[int] = None):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.GEOCODE_CACHE_TTL_SECONDS
+        self.max_entries = max_entries if max_entries is not None else settings.GEOCODE_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _ensure_schema(self):
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    session = self.session_factory()
+                    try:
+                        init_db(bind=session.get_bind())
+                    finally:
+                        session.close()
+                    self._schema_ready = True
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, address: str) -> Optional[Tuple[float, float]]:
+        """Return cached (lat, lng) for address, or None on a miss or expired entry"""
+        self._ensure_schema()
+        key = normalize_address(address)
+        now = int(time.time())
+        session = self.session_factory()
+        try:
+            entry = session.get(GeocodeCacheEntry, key)
+            if entry is None:
+                self._count(hit=False)
+                return None
+            if now - entry.created_at > self.ttl_seconds:
+                logger.debug(f"Geocode cache entry expired: {key}")
+                session.delete(entry)
+                session.commit()
+                self._count(hit=False)
+                return None
+            entry.last_accessed_at = now
+            session.commit()
+            self._count(hit=True)
+            return entry.lat, entry.lng
+        finally:
+            session.close()
+
+    def set(self, address: str, lat: float, lng: float):
+        """Store (lat, lng) for address and evict least recently used entries over the size bound"""
+        self._ensure_schema()
+        key = normalize_address(address)
+        now = int(time.time())
+        session = self.session_factory()
+        try:
+            session.merge(GeocodeCacheEntry(
+                normalized_address=key,
+                lat=lat,
+                lng=lng,
+                created_at=now,
+                last_accessed_at=now
+            ))
+            session.commit()
+
+            overflow = session.query(func.count(GeocodeCacheEntry.normalized_address)).scalar() - self.max_entries
+            if overflow > 0:
+                stale_keys = [
+                    row[0] for row in session.query(GeocodeCacheEntry.normalized_address)
+                    .order_by(GeocodeCacheEntry.last_accessed_at.asc())
+                    .limit(overflow)
+                ]
+                session.query(GeocodeCacheEntry).filter(
+                    GeocodeCacheEntry.normalized_address.in_(stale_keys)
+                ).delete(synchronize_session=False)
+                session.commit()
+                with self._lock:
+                    self.evictions += len(stale_keys)
+                logger.debug(f"Evicted {len(stale_keys)} geocode cache entries")
+        finally:
+            session.close()
+
+    def clear(self):
+        """Remove every entry and reset counters"""
+        self._ensure_schema()
+        session = self.session_factory()
+        try:
+            session.query(GeocodeCacheEntry).delete()
+            session.commit()
+        finally:
+            session.close()
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+geocode_cache = GeocodeCache()
@@ -1,12 +1,155 @@
-import requests
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.geocode_cache import geocode_cache
+from app.services.google import async_transport, transport
+from app.services.local_geocoder import get_local_geocoder
 
-def geocode_address(address: str):
-    url = "https://maps.googleapis.com/maps/api/geocode/json"
-    params = {"address": address, "key": settings.GOOGLE_MAPS_API_KEY}
-    response = requests.get(url, params=params, timeout=(5, 15)).json()
+logger = get_logger(__name__)
+
+GEOCODING_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+def _parse_geocode_response(response):
     if response["status"] == "OK":
         loc = response["results"][0]["geometry"]["location"]
         return loc["lat"], loc["lng"]
     else:
-        raise Exception(f"Geocoding failed: {response['status']}")
\ No newline at end of file
+        raise Exception(f"Geocoding failed: {response['status']}")
+
+def fetch_geocode(address: str):
+    """Geocode an address with the Google Geocoding API (no caching)"""
+    params = {"address": address, "key": settings.GOOGLE_MAPS_API_KEY}
+    http_response = transport.get(GEOCODING_URL, params=params, timeout=transport.endpoint_timeout(settings.GEOCODING_TIMEOUT_SEC))
+    http_response.raise_for_status()
+    return _parse_geocode_response(http_response.json())
+
+async def fetch_geocode_async(address: str):
+    """Non-blocking fetch_geocode using the shared async client"""
+    params = {"address": address, "key": settings.GOOGLE_MAPS_API_KEY}
+    http_response = await async_transport.get(GEOCODING_URL, params=params, timeout=async_transport.endpoint_timeout(settings.GEOCODING_TIMEOUT_SEC))
+    http_response.raise_for_status()
+    return _parse_geocode_response(http_response.json())
+
+def _lookup_local(address: str):
+    try:
+        local_geocoder = get_local_geocoder()
+        if local_geocoder:
+            local = local_geocoder.lookup(address)
+            if local:
+                logger.debug(f"Local gazetteer hit: {address}")
+                return local
+    except Exception as e:
+        logger.warning(f"Local gazetteer lookup failed for {address}: {e}")
+    return None
+
+def _lookup_cache(address: str):
+    if settings.GEOCODE_CACHE_ENABLED:
+        try:
+            cached = geocode_cache.get(address)
+            if cached:
+                logger.debug(f"Geocode cache hit: {address}")
+                return cached
+        except Exception as e:
+            logger.warning(f"Geocode cache lookup failed for {address}: {e}")
+    return None
+
+def _store_cache(address: str, lat: float, lng: float):
+    if settings.GEOCODE_CACHE_ENABLED:
+        try:
+            geocode_cache.set(address, lat, lng)
+        except Exception as e:
+            logger.warning(f"Geocode cache store failed for {address}: {e}")
+
+def geocode_address(address: str):
+    """
+    Geocode an address. The offline gazetteer (if configured) is tried first, then the
+    persistent geocode cache, and the Google Geocoding API only on a miss in both.
+    """
+    found = _lookup_local(address) or _lookup_cache(address)
+    if found:
+        return found
+
+    lat, lng = fetch_geocode(address)
+    _store_cache(address, lat, lng)
+    return lat, lng
+
+async def geocode_address_async(address: str):
+    """Async geocode_address; cache database access runs in a worker thread"""
+    found = _lookup_local(address) or await asyncio.to_thread(_lookup_cache, address)
+    if found:
+        return found
+
+    lat, lng = await fetch_geocode_async(address)
+    await asyncio.to_thread(_store_cache, address, lat, lng)
+    return lat, lng
+
+class GeocodingError(Exception):
+    """Raised when one or more addresses in a batch could not be geocoded"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        details = "; ".join(f"{address}: {error}" for address, error in failures.items())
+        super().__init__(f"Geocoding failed for {len(failures)} address(es): {details}")
+
+def geocode_unique_addresses(addresses, max_workers=None):
+    """
+    Geocode each distinct address once on a bounded thread pool.
+    Returns (results, failures): address -> (lat, lng) and address -> error message.
+    """
+    unique_addresses = list(dict.fromkeys(addresses))
+    results = {}
+    failures = {}
+    if not unique_addresses:
+        return results, failures
+
+    workers = max(1, min(max_workers or settings.GEOCODE_MAX_WORKERS, len(unique_addresses)))
+    logger.info(f"Geocoding {len(unique_addresses)} unique addresses with {workers} workers")
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geocode") as executor:
+        futures = {executor.submit(geocode_address, address): address for address in unique_addresses}
+        for future in as_completed(futures):
+            address = futures[future]
+            try:
+                results[address] = future.result()
+            except Exception as e:
+                failures[address] = str(e)
+    return results, failures
+
+def geocode_addresses(addresses, max_workers=None):
+    """
+    Geocode addresses concurrently on a bounded thread pool.
+    Identical addresses are only geocoded once. Returns (lat, lng) tuples in input order,
+    or raises GeocodingError listing every address that failed.
+    """
+    results, failures = geocode_unique_addresses(addresses, max_workers=max_workers)
+    if failures:
+        raise GeocodingError(failures)
+    return [results[address] for address in addresses]
+
+async def geocode_addresses_async(addresses, max_concurrency=None):
+    """Async geocode_addresses: same ordering, dedupe and error reporting, bounded by a semaphore"""
+    unique_addresses = list(dict.fromkeys(addresses))
+    if not unique_addresses:
+        return []
+
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or settings.GEOCODE_MAX_WORKERS))
+
+    async def geocode_bounded(address):
+        async with semaphore:
+            return await geocode_address_async(address)
+
+    logger.info(f"Geocoding {len(unique_addresses)} unique addresses asynchronously")
+    outcomes = await asyncio.gather(*(geocode_bounded(a) for a in unique_addresses), return_exceptions=True)
+
+    results = {}
+    failures = {}
+    for address, outcome in zip(unique_addresses, outcomes):
+        if isinstance(outcome, Exception):
+            failures[address] = str(outcome)
+        else:
+            results[address] = outcome
+
+    if failures:
+        raise GeocodingError(failures)
+    return [results[address] for address in addresses]
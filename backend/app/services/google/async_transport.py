@@ -0,0 +1,71 @@
+import asyncio
+import time
+import httpx
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.google.transport import RETRY_STATUS_CODES, backoff_delay, redact
+
+logger = get_logger(__name__)
+
+_client = None
+_client_loop = None
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the shared non-blocking client for the running event loop"""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.GOOGLE_HTTP_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GOOGLE_HTTP_POOL_MAXSIZE
+            )
+        )
+        _client_loop = loop
+    return _client
+
+async def aclose():
+    """Close the shared client (called on application shutdown)"""
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+def endpoint_timeout(read_timeout_sec: float) -> httpx.Timeout:
+    """Build an httpx timeout with the shared connect timeout and an endpoint read timeout"""
+    return httpx.Timeout(read_timeout_sec, connect=min(settings.GOOGLE_HTTP_CONNECT_TIMEOUT_SEC, read_timeout_sec))
+
+async def request(method: str, url: str, timeout=None, max_retries=None, deadline=None, **kwargs) -> httpx.Response:
+    """
+    Async counterpart of transport.request: same retry policy (429/5xx and connection
+    failures, jittered exponential backoff, bounded by deadline) without blocking the loop.
+    """
+    client = get_async_client()
+    retries = settings.GOOGLE_HTTP_MAX_RETRIES if max_retries is None else max_retries
+
+    for attempt in range(retries + 1):
+        try:
+            response = await client.request(method, url, timeout=timeout, **kwargs)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            delay = backoff_delay(attempt)
+            if attempt >= retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                raise
+            logger.warning(f"{method} {redact(url)} connection failed ({redact(e)}); retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+            return response
+
+        delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return response
+        logger.warning(f"{method} {redact(url)} returned {response.status_code}; retrying in {delay:.2f}s (attempt {attempt + 1}/{retries})")
+        await asyncio.sleep(delay)
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+async def post(url: str, **kwargs) -> httpx.Response:
+    return await request("POST", url, **kwargs)
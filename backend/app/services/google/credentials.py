@@ -0,0 +1,136 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.google import transport
+
+logger = get_logger(__name__)
+
+CLOUD_PLATFORM_SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+# Backoff between attempts to load a missing or unreadable service account key
+KEY_RETRY_BASE_SEC = 5.0
+KEY_RETRY_MAX_SEC = 300.0
+# Background refreshes closer together than this are skipped; callers refresh on demand instead
+MIN_BACKGROUND_REFRESH_SEC = 30.0
+
+def _utcnow():
+    # google-auth stores expiry as a naive UTC datetime
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class CredentialsManager:
+    """
+    Process-wide service account credentials.
+    The key is parsed once, the access token is reused until refresh_margin_sec before it
+    expires, a background timer refreshes it ahead of expiry, and a lock makes sure
+    concurrent callers never trigger more than one refresh.
+    """
+
+    def __init__(self, key_loader=None, scopes=CLOUD_PLATFORM_SCOPES, refresh_margin_sec: Optional[int] = None,
+                 background_refresh: Optional[bool] = None):
+        self.key_loader = key_loader or settings.get_service_account_key
+        self.scopes = scopes
+        self.refresh_margin_sec = refresh_margin_sec if refresh_margin_sec is not None else settings.OAUTH_TOKEN_REFRESH_MARGIN_SEC
+        self.background_refresh = background_refresh if background_refresh is not None else settings.OAUTH_BACKGROUND_REFRESH
+        self.refresh_count = 0
+        self._credentials = None
+        self._key_failures = 0
+        self._key_retry_at = 0.0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def _seconds_left(self, credentials) -> float:
+        if not credentials.token or not credentials.expiry:
+            return 0.0
+        return (credentials.expiry - _utcnow()).total_seconds()
+
+    def cached_token(self) -> Optional[str]:
+        """Return the current token if it is still outside the refresh margin, without blocking"""
+        credentials = self._credentials
+        if credentials is not None and self._seconds_left(credentials) > self.refresh_margin_sec:
+            return credentials.token
+        return None
+
+    def _load_locked(self):
+        """Parse the key once it loads; failed or empty loads are retried with exponential backoff"""
+        if self._credentials is not None or time.monotonic() < self._key_retry_at:
+            return self._credentials
+        try:
+            service_account_info = self.key_loader()
+            if service_account_info:
+                self._credentials = service_account.Credentials.from_service_account_info(
+                    service_account_info,
+                    scopes=self.scopes
+                )
+                self._key_failures = 0
+                return self._credentials
+            logger.warning("No service account credentials found for Route Optimization API")
+        except Exception as e:
+            logger.error(f"Could not load service account key: {e}")
+        self._key_retry_at = time.monotonic() + min(KEY_RETRY_MAX_SEC, KEY_RETRY_BASE_SEC * 2 ** self._key_failures)
+        self._key_failures += 1
+        return None
+
+    def _refresh_locked(self, credentials):
+        credentials.refresh(Request(session=transport.get_session()))
+        self.refresh_count += 1
+        logger.info(f"Refreshed OAuth token; valid for {self._seconds_left(credentials):.0f}s")
+        self._schedule_background_refresh(credentials)
+
+    def _schedule_background_refresh(self, credentials):
+        if not self.background_refresh:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        # Fire a little before the refresh margin so request threads keep hitting the cached token
+        lead = self.refresh_margin_sec + random.uniform(0, min(60, self.refresh_margin_sec))
+        delay = self._seconds_left(credentials) - lead
+        if delay < MIN_BACKGROUND_REFRESH_SEC:
+            # Token lifetime is inside the refresh margin; re-arming would refresh in a tight loop
+            logger.debug("OAuth token lifetime is within the refresh margin; skipping background refresh")
+            self._timer = None
+            return
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                credentials = self._credentials
+                if credentials is not None:
+                    self._refresh_locked(credentials)
+        except Exception as e:
+            logger.error(f"Background OAuth token refresh failed: {e}")
+
+    def get_token(self) -> Optional[str]:
+        """Return a valid access token, refreshing it (once, under the lock) only when needed"""
+        token = self.cached_token()
+        if token:
+            return token
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            token = self.cached_token()
+            if token:
+                return token
+            credentials = self._load_locked()
+            if credentials is None:
+                return None
+            self._refresh_locked(credentials)
+            return credentials.token
+
+    def reset(self):
+        """Forget the parsed key and token (e.g. after rotating the service account key)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._credentials = None
+            self._key_failures = 0
+            self._key_retry_at = 0.0
+
+credentials_manager = CredentialsManager()
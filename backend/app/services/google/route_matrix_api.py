@@ -0,0 +1,82 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from app.core.logging import get_logger
+from app.core.config import settings
+from app.services.google import transport
+
+logger = get_logger(__name__)
+
+COMPUTE_ROUTE_MATRIX_URL = "https://routes.googleapis.com/distanceMatrix/v2:computeRouteMatrix"
+FIELD_MASK = "originIndex,destinationIndex,duration,distanceMeters,condition"
+# computeRouteMatrix accepts at most 625 elements per traffic-aware request
+MAX_SIDE_PER_REQUEST = 25
+
+def _waypoint(point):
+    return {"waypoint": {"location": {"latLng": {"latitude": point[0], "longitude": point[1]}}}}
+
+def _call_api(origins, destinations, departure_ts=None, timeout_sec=None):
+    payload = {
+        "origins": [_waypoint(p) for p in origins],
+        "destinations": [_waypoint(p) for p in destinations],
+        "travelMode": "DRIVE",
+        "routingPreference": "TRAFFIC_AWARE",
+    }
+    # Traffic-aware departure times must not be in the past
+    if departure_ts and departure_ts > time.time():
+        payload["departureTime"] = datetime.fromtimestamp(departure_ts, timezone.utc).isoformat()
+
+    if timeout_sec is not None and timeout_sec <= 0:
+        raise Exception("No time left for computeRouteMatrix")
+    timeout_sec = min(timeout_sec, settings.ROUTE_MATRIX_TIMEOUT_SEC) if timeout_sec is not None else settings.ROUTE_MATRIX_TIMEOUT_SEC
+    response = transport.post(
+        COMPUTE_ROUTE_MATRIX_URL,
+        headers={
+            "Content-Type": "application/json",
+            "X-Goog-Api-Key": settings.GOOGLE_MAPS_API_KEY,
+            "X-Goog-FieldMask": FIELD_MASK
+        },
+        data=json.dumps(payload, separators=(",", ":")),
+        timeout=transport.endpoint_timeout(timeout_sec),
+        deadline=time.monotonic() + timeout_sec
+    )
+    response.raise_for_status()
+    return response.json()
+
+def fetch_route_matrix(origins, destinations, departure_ts=None, timeout_sec=None):
+    """
+    Driving durations between (lat, lng) origins and destinations with computeRouteMatrix.
+    Large matrices are split into requests of at most MAX_SIDE_PER_REQUEST origins and
+    destinations, sent concurrently, all within timeout_sec when given. Returns
+    {(origin index, destination index): (duration sec, distance meters)} for every pair with a route.
+    """
+    if not settings.GOOGLE_MAPS_API_KEY:
+        raise Exception("GOOGLE_MAPS_API_KEY is not configured")
+
+    deadline = time.monotonic() + timeout_sec if timeout_sec is not None else None
+    blocks = [
+        (o, d)
+        for o in range(0, len(origins), MAX_SIDE_PER_REQUEST)
+        for d in range(0, len(destinations), MAX_SIDE_PER_REQUEST)
+    ]
+
+    def fetch_block(block):
+        o, d = block
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        elements = _call_api(origins[o:o + MAX_SIDE_PER_REQUEST], destinations[d:d + MAX_SIDE_PER_REQUEST], departure_ts, remaining)
+        legs = {}
+        for element in elements:
+            if element.get("condition") != "ROUTE_EXISTS" or "duration" not in element:
+                continue
+            key = (o + element.get("originIndex", 0), d + element.get("destinationIndex", 0))
+            legs[key] = (int(str(element["duration"]).rstrip("s")), element.get("distanceMeters"))
+        return legs
+
+    logger.info(f"Fetching {len(origins)}x{len(destinations)} travel matrix in {len(blocks)} request(s)")
+    workers = max(1, min(settings.TRAVEL_MATRIX_MAX_PARALLEL, len(blocks)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="route-matrix") as executor:
+        results = {}
+        for legs in executor.map(fetch_block, blocks):
+            results.update(legs)
+    return results
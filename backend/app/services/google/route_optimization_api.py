@@ -1,39 +1,117 @@
+import asyncio
 import json
+import random
+import time
+import uuid
+import httpx
 import requests
 from datetime import datetime, timezone, timedelta
+from urllib.parse import quote
 from app.core.logging import get_logger
-from google.auth.transport.requests import Request
-from google.oauth2 import service_account
 from app.core.config import settings
+from app.services.google import async_transport, transport
+from app.services.google.credentials import credentials_manager
+from app.services.vrptw_optimizer import optimize_route as vrptw_optimize
 from app.schemas.route import RouteOptimizationParams
 
 logger = get_logger(__name__)
 
+# Seconds of a latency budget reserved for auth, upload and response transfer
+SOLVE_TIMEOUT_HEADROOM_SEC = 2
+
+def optimize_tours_url():
+    return f"{settings.ROUTE_OPTIMIZATION_BASE_URL}/v1/projects/{settings.GOOGLE_CLOUD_PROJECT_ID}:optimizeTours"
+
+def _resolve_timeout(timeout_sec=None):
+    if timeout_sec is None:
+        return settings.ROUTE_OPTIMIZATION_TIMEOUT_SEC
+    if timeout_sec <= 0:
+        raise Exception("Latency budget spent before calling the Route Optimization API")
+    return min(timeout_sec, settings.ROUTE_OPTIMIZATION_TIMEOUT_SEC)
+
+def _time_left(deadline):
+    """Seconds until deadline, raising once it has passed, so no request outlives the budget"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise Exception("Latency budget spent before calling the Route Optimization API")
+    return remaining
+
+def _remaining_timeout(timeout_sec, started):
+    """timeout_sec less the time spent since started (a time.monotonic() value)"""
+    return None if timeout_sec is None else timeout_sec - (time.monotonic() - started)
+
 def get_oauth_token():
-    """Get OAuth 2.0 token for Google Route Optimization API"""
+    """Get OAuth 2.0 token for Google Route Optimization API (cached by the process-wide credentials manager)"""
     try:
-        # Try to use service account credentials
-        service_account_info = settings.get_service_account_key()
-        if service_account_info:
-            credentials = service_account.Credentials.from_service_account_info(
-                service_account_info,
-                scopes=['https://www.googleapis.com/auth/cloud-platform']
-            )
-        else:
-            logger.warning("No service account credentials found for Route Optimization API")
-            return None
-            
-        credentials.refresh(Request())
-        return credentials.token
+        return credentials_manager.get_token()
     except Exception as e:
         logger.error(f"Error getting OAuth token: {e}")
         return None
 
-def build_payload(params: RouteOptimizationParams):
+def solve_timeout_seconds(timeout_sec=None, stop_count=None, warm_start_violations=None):
+    """
+    Solver time limit for the payload. It grows with the number of stops and shrinks when a
+    local warm start was computed, by less the more of its stops miss their time windows
+    (warm_start_violations). It always leaves headroom for the HTTP round-trip within timeout_sec.
+    """
+    limit = settings.ROUTE_OPTIMIZATION_SOLVE_MAX_SEC
+    if stop_count:
+        limit = min(limit, settings.ROUTE_OPTIMIZATION_SOLVE_BASE_SEC + settings.ROUTE_OPTIMIZATION_SOLVE_PER_STOP_SEC * stop_count)
+        if warm_start_violations is not None:
+            infeasible_share = min(1.0, warm_start_violations / stop_count)
+            factor = settings.ROUTE_OPTIMIZATION_WARM_START_FACTOR
+            limit *= factor + (1 - factor) * infeasible_share
+    if timeout_sec:
+        limit = min(limit, timeout_sec - SOLVE_TIMEOUT_HEADROOM_SEC)
+    return max(1, int(limit))
+
+def warm_start_route(params: RouteOptimizationParams, deadline=None):
+    """
+    Local time-window-aware route used as the solver's first solution, or None if it cannot be
+    computed. deadline (a time.monotonic() value) bounds its travel matrix lookups.
+    """
+    if not settings.ROUTE_OPTIMIZATION_WARM_START or not params.locations:
+        return None
+    try:
+        return vrptw_optimize(params, deadline=deadline)
+    except Exception as e:
+        logger.warning(f"No warm start for Route Optimization API: {str(e)}")
+        return None
+
+def _shipment_order(params: RouteOptimizationParams, initial_route):
+    """Shipment indexes in the order a local route plan visits them; None unless it visits every shipment exactly once"""
+    shipment_index = {loc["original_index"]: i for i, loc in enumerate(params.locations)}
+    order = [shipment_index.get(stop["original_order"]) for stop in initial_route]
+    if None in order or sorted(order) != list(range(len(params.locations))):
+        return None
+    return order
+
+def _injected_route(params: RouteOptimizationParams, initial_route):
+    """
+    Map a local route plan onto shipment indexes; None unless it visits every shipment
+    exactly once within its time window, since the service may reject an infeasible
+    injected solution outright
+    """
+    order = _shipment_order(params, initial_route)
+    if order is None:
+        logger.warning("Ignoring warm start that does not visit every shipment exactly once")
+        return None
+    violations = sum(1 for stop in initial_route if stop.get("time_window_violation"))
+    if violations:
+        logger.info(f"Not injecting warm start with {violations} time window violations")
+        return None
+    return {
+        "vehicleIndex": 0,
+        "visits": [{"shipmentIndex": i, "isPickup": False} for i in order]
+    }
+
+def build_payload(params: RouteOptimizationParams, timeout_sec=None, initial_route=None):
     """
     Build payload for Google Route Optimization API
     Args:
         params: RouteOptimizationParams containing locations, start_location, destination_location, global_start_time, global_end_time
+        timeout_sec: overall latency budget for the call; the solver timeout is derived from it
+        initial_route: optional local route plan injected as the solver's first solution
     """
     locations_with_windows = params.locations
     start_location = params.start_location
@@ -86,7 +164,13 @@ def build_payload(params: RouteOptimizationParams):
     global_start_time = params.global_start_time.isoformat()
     global_end_time = params.global_end_time.isoformat()
 
-    return {
+    injected_route = _injected_route(params, initial_route) if initial_route else None
+    # Counted before injection is ruled out, so the time limit follows the warm start's feasibility
+    warm_start_violations = None
+    if initial_route and _shipment_order(params, initial_route) is not None:
+        warm_start_violations = sum(1 for stop in initial_route if stop.get("time_window_violation"))
+
+    payload = {
         "parent": f"projects/{settings.GOOGLE_CLOUD_PROJECT_ID}",
         "model": {
             "globalStartTime": global_start_time,
@@ -95,16 +179,26 @@ def build_payload(params: RouteOptimizationParams):
             "vehicles": [vehicle]
         },
         "searchMode": 1,  # GLOBAL_MODE for best optimization
-        "timeout": "60s"  # Allow up to 60 seconds for optimization
+        # Scales with the stop count and warm start quality, within the remaining budget
+        "timeout": f"{solve_timeout_seconds(timeout_sec, len(shipments), warm_start_violations)}s"
     }
+    if injected_route:
+        payload["injectedFirstSolutionRoutes"] = [injected_route]
+    return payload
 
-def call_api(request_payload):
-    """Call Google Route Optimization API"""
+def call_api(request_payload, timeout_sec=None, auth_token=None):
+    """
+    Call Google Route Optimization API
+    timeout_sec overrides ROUTE_OPTIMIZATION_TIMEOUT_SEC and also bounds retries;
+    auth_token lets batch callers share one OAuth token across calls
+    """
     try:
+        timeout_sec = _resolve_timeout(timeout_sec)
+        deadline = time.monotonic() + timeout_sec
         logger.info("Calling Google Route Optimization API")
         
         # Get OAuth token
-        auth_token = get_oauth_token()
+        auth_token = auth_token or get_oauth_token()
         if not auth_token:
             raise Exception("No OAuth token available for Route Optimization API")
         
@@ -113,11 +207,12 @@ def call_api(request_payload):
             "Authorization": f"Bearer {auth_token}"
         }
         
-        response = requests.post(
-            f"https://routeoptimization.googleapis.com/v1/projects/{settings.GOOGLE_CLOUD_PROJECT_ID}:optimizeTours",
+        response = transport.post(
+            optimize_tours_url(),
             headers=headers,
             data=json.dumps(request_payload),
-            timeout=(5, 60)
+            timeout=transport.endpoint_timeout(_time_left(deadline)),
+            deadline=deadline
         )
         response.raise_for_status()
         result = response.json()
@@ -129,6 +224,41 @@ def call_api(request_payload):
             logger.error(f"API Error details: {e.response.text}")
         raise
 
+async def get_oauth_token_async():
+    """get_oauth_token without blocking the event loop (a needed refresh runs in a worker thread)"""
+    return credentials_manager.cached_token() or await asyncio.to_thread(get_oauth_token)
+
+async def call_api_async(request_payload, timeout_sec=None):
+    """Non-blocking call_api using the shared async client"""
+    try:
+        timeout_sec = _resolve_timeout(timeout_sec)
+        deadline = time.monotonic() + timeout_sec
+        logger.info("Calling Google Route Optimization API (async)")
+
+        auth_token = await get_oauth_token_async()
+        if not auth_token:
+            raise Exception("No OAuth token available for Route Optimization API")
+
+        response = await async_transport.post(
+            optimize_tours_url(),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {auth_token}"
+            },
+            content=json.dumps(request_payload),
+            timeout=async_transport.endpoint_timeout(_time_left(deadline)),
+            deadline=deadline
+        )
+        response.raise_for_status()
+        result = response.json()
+        logger.info("Successfully received optimized route from Route Optimization API")
+        return result
+    except httpx.HTTPError as e:
+        logger.error(f"Route Optimization API failed: {str(e)}", exc_info=True)
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"API Error details: {e.response.text}")
+        raise
+
 def process_response(raw_response, locations):
     """Process Route Optimization API response"""
     route_plan = []
@@ -171,22 +301,142 @@ def process_response(raw_response, locations):
     
     return route_plan
 
-def optimize_route(params: RouteOptimizationParams):
+def _build_route_plan(raw_response, params: RouteOptimizationParams):
+    route_plan = process_response(raw_response, params.locations)
+    
+    if not route_plan:
+        raise Exception("No route plan generated from Route Optimization API")
+        
+    logger.info("Successfully created optimized route plan using Route Optimization API")
+    return route_plan
+
+def optimize_route(params: RouteOptimizationParams, timeout_sec=None, auth_token=None):
     """
     Optimize route using Google Route Optimization API
     Returns optimized route plan or raises exception if failed
     """
     try:
-        payload = build_payload(params)
-        raw_response = call_api(payload)
-        route_plan = process_response(raw_response, params.locations)
-        
-        if not route_plan:
-            raise Exception("No route plan generated from Route Optimization API")
-            
-        logger.info("Successfully created optimized route plan using Route Optimization API")
-        return route_plan
+        started = time.monotonic()
+        initial_route = warm_start_route(params, started + timeout_sec if timeout_sec else None)
+        payload = build_payload(params, timeout_sec=_remaining_timeout(timeout_sec, started), initial_route=initial_route)
+        raw_response = call_api(payload, timeout_sec=_remaining_timeout(timeout_sec, started), auth_token=auth_token)
+        return _build_route_plan(raw_response, params)
         
     except Exception as e:
         logger.error(f"Route Optimization API optimization failed: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+async def optimize_route_async(params: RouteOptimizationParams, timeout_sec=None):
+    """Async optimize_route: the API call does not block the event loop"""
+    try:
+        started = time.monotonic()
+        initial_route = await asyncio.to_thread(warm_start_route, params, started + timeout_sec if timeout_sec else None)
+        payload = build_payload(params, timeout_sec=_remaining_timeout(timeout_sec, started), initial_route=initial_route)
+        raw_response = await call_api_async(payload, timeout_sec=_remaining_timeout(timeout_sec, started))
+        return _build_route_plan(raw_response, params)
+
+    except Exception as e:
+        logger.error(f"Route Optimization API optimization failed: {str(e)}")
+        raise
+
+def _gcs_upload(bucket, object_name, body, headers):
+    response = transport.post(
+        f"{settings.GCS_BASE_URL}/upload/storage/v1/b/{bucket}/o",
+        params={"uploadType": "media", "name": object_name},
+        headers={**headers, "Content-Type": "application/json"},
+        data=body,
+        timeout=transport.endpoint_timeout(settings.ROUTE_OPTIMIZATION_TIMEOUT_SEC)
+    )
+    response.raise_for_status()
+
+def _gcs_download(bucket, object_name, headers):
+    response = transport.get(
+        f"{settings.GCS_BASE_URL}/storage/v1/b/{bucket}/o/{quote(object_name, safe='')}",
+        params={"alt": "media"},
+        headers=headers,
+        timeout=transport.endpoint_timeout(settings.ROUTE_OPTIMIZATION_TIMEOUT_SEC)
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+def _auth_headers(fallback_token=None):
+    """
+    Authorization header with the manager's current token, fetched per call because a batch
+    can outlive a token; fallback_token is used when the manager has none
+    """
+    auth_token = get_oauth_token() or fallback_token
+    if not auth_token:
+        raise Exception("No OAuth token available for Route Optimization API")
+    return {"Authorization": f"Bearer {auth_token}"}
+
+def _poll_operation(operation, auth_token=None):
+    """Poll a long-running operation with jittered exponential backoff until it is done"""
+    deadline = time.monotonic() + settings.ROUTE_OPTIMIZATION_BATCH_TIMEOUT_SEC
+    delay = settings.ROUTE_OPTIMIZATION_BATCH_POLL_INITIAL_SEC
+    while not operation.get("done"):
+        if time.monotonic() + delay > deadline:
+            raise Exception(f"batchOptimizeTours operation {operation.get('name')} did not finish in time")
+        time.sleep(random.uniform(delay / 2, delay))
+        delay = min(delay * 2, settings.ROUTE_OPTIMIZATION_BATCH_POLL_MAX_SEC)
+        response = transport.get(
+            f"{settings.ROUTE_OPTIMIZATION_BASE_URL}/v1/{operation['name']}",
+            headers=_auth_headers(auth_token),
+            timeout=transport.endpoint_timeout(settings.ROUTE_OPTIMIZATION_TIMEOUT_SEC)
+        )
+        response.raise_for_status()
+        operation = response.json()
+        logger.debug(f"batchOptimizeTours operation {operation.get('name')} done={operation.get('done', False)}")
+
+    if "error" in operation:
+        raise Exception(f"batchOptimizeTours failed: {operation['error'].get('message', operation['error'])}")
+    return operation
+
+def batch_optimize_routes(params_list, auth_token=None):
+    """
+    Optimize many tours with one batchOptimizeTours long-running operation.
+    Each tour's build_payload model is uploaded to ROUTE_OPTIMIZATION_BATCH_GCS_BUCKET,
+    the operation is polled with backoff, and every result is unpacked with the same
+    processing as optimize_route. Returns a list aligned with params_list holding a route
+    plan, or the Exception for tours without a usable result. Objects are left in the
+    bucket for its lifecycle rules to expire.
+    """
+    bucket = settings.ROUTE_OPTIMIZATION_BATCH_GCS_BUCKET
+    if not bucket:
+        raise Exception("ROUTE_OPTIMIZATION_BATCH_GCS_BUCKET is not configured")
+
+    prefix = f"realplanner/batch/{uuid.uuid4().hex}"
+    model_configs = []
+    for i, params in enumerate(params_list):
+        payload = build_payload(params, initial_route=warm_start_route(params))
+        payload.pop("parent", None)  # the batch request carries the parent
+        input_name = f"{prefix}/input-{i}.json"
+        _gcs_upload(bucket, input_name, json.dumps(payload), _auth_headers(auth_token))
+        model_configs.append({
+            "displayName": f"tour-{i}",
+            "inputConfig": {"gcsSource": {"uri": f"gs://{bucket}/{input_name}"}, "dataFormat": "JSON"},
+            "outputConfig": {"gcsDestination": {"uri": f"gs://{bucket}/{prefix}/output-{i}.json"}, "dataFormat": "JSON"}
+        })
+
+    logger.info(f"Calling batchOptimizeTours for {len(model_configs)} tours")
+    response = transport.post(
+        f"{settings.ROUTE_OPTIMIZATION_BASE_URL}/v1/projects/{settings.GOOGLE_CLOUD_PROJECT_ID}:batchOptimizeTours",
+        headers={**_auth_headers(auth_token), "Content-Type": "application/json"},
+        data=json.dumps({"modelConfigs": model_configs}),
+        timeout=transport.endpoint_timeout(settings.ROUTE_OPTIMIZATION_TIMEOUT_SEC)
+    )
+    response.raise_for_status()
+    _poll_operation(response.json(), auth_token)
+
+    results = []
+    for i, params in enumerate(params_list):
+        try:
+            raw_response = _gcs_download(bucket, f"{prefix}/output-{i}.json", _auth_headers(auth_token))
+            if raw_response is None:
+                raise Exception("No batchOptimizeTours output for tour")
+            results.append(_build_route_plan(raw_response, params))
+        except Exception as e:
+            logger.warning(f"Batch tour {i} has no usable Route Optimization API result: {str(e)}")
+            results.append(e)
+    return results
@@ -1,13 +1,46 @@
+import asyncio
 import json
+import math
+import time
+import httpx
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from app.core.logging import get_logger
 from app.core.config import settings
-from app.services.time_windows import compute_schedule_with_time_windows
+from app.services.google import async_transport, transport
+from app.services import polyline
+from app.services.distance import haversine_km
+from app.services.greedy_optimizer import optimize_route as greedy_optimize
+from app.services.time_windows import VIOLATION_PENALTY_SEC, compute_schedule_with_time_windows
+from app.services.travel_model import observe_legs
 from app.schemas.route import RouteOptimizationParams
 
 logger = get_logger(__name__)
 
+COMPUTE_ROUTES_URL = "https://routes.googleapis.com/directions/v2:computeRoutes"
+# Planning only reads leg durations and the optimized order; geometry is fetched separately
+FIELD_MASK = "routes.legs.duration,routes.optimizedIntermediateWaypointIndex"
+GEOMETRY_FIELD_MASK = "routes.polyline.encodedPolyline"
+
+def _request_headers(field_mask=FIELD_MASK):
+    return {
+        "Content-Type": "application/json",
+        "X-Goog-Api-Key": settings.GOOGLE_MAPS_API_KEY,
+        "X-Goog-FieldMask": field_mask
+    }
+
+def _resolve_timeout(timeout_sec=None):
+    if timeout_sec is None:
+        return settings.ROUTES_API_TIMEOUT_SEC
+    if timeout_sec <= 0:
+        raise Exception("Latency budget spent before calling the Routes API")
+    return min(timeout_sec, settings.ROUTES_API_TIMEOUT_SEC)
+
+def _remaining_timeout(timeout_sec, started):
+    """timeout_sec less the time spent since started (a time.monotonic() value)"""
+    return None if timeout_sec is None else timeout_sec - (time.monotonic() - started)
+
 def build_payload(params: RouteOptimizationParams):
     """
     Build payload for Google Routes API with waypoint optimization
@@ -68,27 +101,27 @@ def build_payload(params: RouteOptimizationParams):
         "optimizeWaypointOrder": True  # Enable waypoint optimization
     }
 
-def call_api(request_payload):
-    """Call Google Routes API with waypoint optimization"""
+def call_api(request_payload, timeout_sec=None):
+    """
+    Call Google Routes API with waypoint optimization
+    timeout_sec overrides ROUTES_API_TIMEOUT_SEC and also bounds retries
+    """
     try:
         logger.info("Calling Google Routes API with waypoint optimization")
-        logger.warning("Note: Routes API does NOT support time window constraints - will validate manually")
-        logger.debug(f"Request payload: {json.dumps(request_payload, indent=2)}")
-        
-        response = requests.post(
-            "https://routes.googleapis.com/directions/v2:computeRoutes",
-            headers={
-                "Content-Type": "application/json",
-                "X-Goog-Api-Key": settings.GOOGLE_MAPS_API_KEY,
-                "X-Goog-FieldMask": "routes.duration,routes.distanceMeters,routes.legs.duration,routes.legs.distanceMeters,routes.legs.steps,routes.optimizedIntermediateWaypointIndex"
-            },
-            data=json.dumps(request_payload),
-            timeout=(5, 30)
+        logger.debug(f"Routes API request with {len(request_payload['intermediates'])} intermediates")
+
+        timeout_sec = _resolve_timeout(timeout_sec)
+        response = transport.post(
+            COMPUTE_ROUTES_URL,
+            headers=_request_headers(),
+            data=json.dumps(request_payload, separators=(",", ":")),
+            timeout=transport.endpoint_timeout(timeout_sec),
+            deadline=time.monotonic() + timeout_sec
         )
         response.raise_for_status()
         result = response.json()
         logger.info("Successfully received optimized route from Routes API")
-        logger.debug(f"API Response: {json.dumps(result, indent=2)}")
+        logger.debug(f"Routes API response: {len(response.content)} bytes")
         return result
     except requests.exceptions.RequestException as e:
         logger.error(f"Routes API failed: {str(e)}", exc_info=True)
@@ -96,18 +129,103 @@ def call_api(request_payload):
             logger.error(f"API Error details: {e.response.text}")
         raise
 
+async def call_api_async(request_payload, timeout_sec=None):
+    """Non-blocking call_api using the shared async client"""
+    try:
+        logger.info("Calling Google Routes API with waypoint optimization (async)")
+        logger.debug(f"Routes API request with {len(request_payload['intermediates'])} intermediates")
+
+        timeout_sec = _resolve_timeout(timeout_sec)
+        response = await async_transport.post(
+            COMPUTE_ROUTES_URL,
+            headers=_request_headers(),
+            content=json.dumps(request_payload, separators=(",", ":")),
+            timeout=async_transport.endpoint_timeout(timeout_sec),
+            deadline=time.monotonic() + timeout_sec
+        )
+        response.raise_for_status()
+        result = response.json()
+        logger.info("Successfully received optimized route from Routes API")
+        logger.debug(f"Routes API response: {len(response.content)} bytes")
+        return result
+    except httpx.HTTPError as e:
+        logger.error(f"Routes API failed: {str(e)}", exc_info=True)
+        if isinstance(e, httpx.HTTPStatusError):
+            logger.error(f"API Error details: {e.response.text}")
+        raise
+
+def _waypoint(lat, lng):
+    return {"location": {"latLng": {"latitude": lat, "longitude": lng}}}
+
+def _fetch_segment_polyline(coordinates, timeout_sec=None):
+    """Encoded polyline of one computeRoutes request through coordinates; only the geometry field is requested"""
+    payload = {
+        "origin": _waypoint(*coordinates[0]),
+        "destination": _waypoint(*coordinates[-1]),
+        "intermediates": [_waypoint(lat, lng) for lat, lng in coordinates[1:-1]],
+        "travelMode": "DRIVE",
+        "routingPreference": "TRAFFIC_UNAWARE",
+        "polylineQuality": "HIGH_QUALITY"
+    }
+    timeout_sec = _resolve_timeout(timeout_sec)
+    response = transport.post(
+        COMPUTE_ROUTES_URL,
+        headers=_request_headers(GEOMETRY_FIELD_MASK),
+        data=json.dumps(payload, separators=(",", ":")),
+        timeout=transport.endpoint_timeout(timeout_sec),
+        deadline=time.monotonic() + timeout_sec
+    )
+    response.raise_for_status()
+    routes = response.json().get("routes") or []
+    if not routes:
+        raise Exception("No route geometry returned from Routes API")
+    return routes[0]["polyline"]["encodedPolyline"]
+
+def fetch_route_polyline(coordinates, timeout_sec=None):
+    """
+    Encoded polyline of the driving route through coordinates ((lat, lng) pairs) in the
+    given order, first to last. Routes with more than ROUTES_API_MAX_INTERMEDIATES stops
+    in between are fetched concurrently as segments sharing their end points, and the
+    decoded segments are joined.
+    """
+    if len(coordinates) < 2:
+        raise Exception("A route needs at least two points")
+    step = settings.ROUTES_API_MAX_INTERMEDIATES + 1
+    if len(coordinates) <= step + 1:
+        return _fetch_segment_polyline(coordinates, timeout_sec)
+
+    started = time.monotonic()
+    segments = [coordinates[i:i + step + 1] for i in range(0, len(coordinates) - 1, step)]
+    logger.info(f"Fetching route geometry through {len(coordinates)} points as {len(segments)} Routes API segments")
+
+    def fetch_segment(segment):
+        return polyline.decode(_fetch_segment_polyline(segment, _remaining_timeout(timeout_sec, started)))
+
+    with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix="routes-geometry") as executor:
+        decoded = list(executor.map(fetch_segment, segments))
+    points = decoded[0]
+    for segment_points in decoded[1:]:
+        # Each segment starts where the previous one ended
+        points.extend(segment_points[1:])
+    return polyline.encode(points)
+
 def validate_time_windows(route_plan, locations, start_ts):
     return compute_schedule_with_time_windows(route_plan, start_ts)
 
-def process_response(raw_response, locations, start_ts):
-    """Process Routes API response"""
+def process_response(raw_response, locations, start_ts, start_location=None):
+    """
+    Process Routes API response. With the start location, the timed legs are also fed to
+    the local travel model.
+    """
     route_plan = []
+    observed_legs = []
+    previous, clock = start_location, start_ts
     if "routes" in raw_response and len(raw_response["routes"]) > 0:
         route = raw_response["routes"][0]
         
         # Get the optimized waypoint order
         optimized_order = route.get("optimizedIntermediateWaypointIndex", list(range(len(locations))))
-        logger.info(f"Optimized waypoint order: {optimized_order}")
+        logger.debug(f"Optimized waypoint order: {optimized_order}")
         
         # Reorder locations based on optimization
         optimized_locations = [locations[i] for i in optimized_order]
@@ -131,29 +249,235 @@ def process_response(raw_response, locations, start_ts):
                     "location_data": location,  # Store the full location data for validation
                     "travel_duration_sec": leg_duration
                 })
-                logger.debug(f"Processed optimized visit: {house_data.address} (original: {location['original_index']}, optimized: {i})")
+                if previous is not None:
+                    observed_legs.append(((previous["lat"], previous["lng"]), (location["lat"], location["lng"]), clock, leg_duration))
+                    previous = location
+                    clock += leg_duration + location["visit_duration_sec"]
 
+    if observed_legs:
+        observe_legs(observed_legs)
     return route_plan
 
-def optimize_route(params: RouteOptimizationParams):
+def _build_route_plan(raw_response, params: RouteOptimizationParams):
+    route_plan = process_response(raw_response, params.locations, int(params.global_start_time.timestamp()), params.start_location)
+    
+    if not route_plan:
+        raise Exception("No route plan generated from Routes API")
+    
+    # Validate time windows and add warnings
+    corrected_route = validate_time_windows(route_plan, params.locations, int(params.global_start_time.timestamp()))
+    
+    logger.info("Successfully created optimized route plan using Routes API (with time window validation)")
+    return corrected_route
+
+# Stops on each side of a segment seam considered by the boundary repair pass
+BOUNDARY_REPAIR_WINDOW = 4
+# Speed used for legs the API has not timed (calibrated against the legs it has)
+ESTIMATE_SPEED_KMH = 40.0
+
+def _split_sizes(stop_count, cap):
+    """
+    Balanced segment sizes. Every segment but the last ends on an anchored stop sent as its
+    destination, so it may hold cap + 1 stops; the last segment's stops are all intermediates.
+    """
+    segment_count = max(1, math.ceil(stop_count / (cap + 1)))
+    while True:
+        base, extra = divmod(stop_count, segment_count)
+        sizes = [base + 1] * extra + [base] * (segment_count - extra)
+        if sizes[0] <= cap + 1 and sizes[-1] <= cap:
+            return sizes
+        segment_count += 1
+
+def _plan_segments(params: RouteOptimizationParams, cap):
+    """
+    Split the tour into segments along the greedy nearest-neighbour order. Segment k starts
+    at the stop segment k - 1 ends on, so segments can be optimized independently and
+    stitched without gaps.
+    """
+    greedy_plan = greedy_optimize(params)
+    by_index = {loc["original_index"]: loc for loc in params.locations}
+    ordered = [by_index[stop["original_order"]] for stop in greedy_plan]
+    departures = {stop["original_order"]: stop["departure_time"] for stop in greedy_plan}
+
+    segments = []
+    origin = params.start_location
+    departure = params.global_start_time
+    position = 0
+    sizes = _split_sizes(len(ordered), cap)
+    for k, size in enumerate(sizes):
+        chunk = ordered[position:position + size]
+        position += size
+        last = k == len(sizes) - 1
+        anchor = None if last else chunk[-1]
+        anchor_point = {"lat": anchor["lat"], "lng": anchor["lng"]} if anchor else None
+        segments.append({
+            "params": RouteOptimizationParams(
+                locations=chunk if last else chunk[:-1],
+                start_location=origin,
+                destination_location=(params.destination_location or params.start_location) if last else anchor_point,
+                global_start_time=departure,
+                global_end_time=params.global_end_time
+            ),
+            "anchor": anchor
+        })
+        if anchor:
+            origin = anchor_point
+            departure = departures[anchor["original_index"]]
+    return segments
+
+def _segment_stops(raw_response, segment):
+    """(location, travel seconds from the previous stop) in the order the API chose for a segment"""
+    routes = raw_response.get("routes") or []
+    if not routes:
+        raise Exception("No route returned for Routes API segment")
+    route = routes[0]
+    intermediates = segment["params"].locations
+    order = route.get("optimizedIntermediateWaypointIndex", list(range(len(intermediates))))
+    visits = [intermediates[i] for i in order] + ([segment["anchor"]] if segment["anchor"] else [])
+    legs = route.get("legs", [])
+    if len(legs) < len(visits):
+        raise Exception(f"Routes API segment returned {len(legs)} legs for {len(visits)} stops")
+    return [(location, int(str(leg["duration"]).replace("s", ""))) for location, leg in zip(visits, legs)]
+
+def _stop_key(location, default):
+    return location.get("original_index", default) if location else default
+
+def repair_boundaries(stops, seams, params: RouteOptimizationParams):
+    """
+    Local 2-opt pass over the stops around each segment seam.
+    Legs the API timed keep their duration; any other leg is estimated from distance,
+    scaled by how the API's timed legs compare to the same estimate. Returns the repaired
+    (location, travel seconds) list.
+    """
+    start_ts = int(params.global_start_time.timestamp())
+    end_location = params.destination_location or params.start_location
+
+    def estimate(a, b):
+        return haversine_km(a["lat"], a["lng"], b["lat"], b["lng"]) / ESTIMATE_SPEED_KMH * 3600
+
+    observed = {}
+    estimated_total = 0.0
+    previous = params.start_location
+    for location, travel_sec in stops:
+        observed[(_stop_key(previous, "start"), _stop_key(location, "start"))] = travel_sec
+        estimated_total += estimate(previous, location)
+        previous = location
+    scale = sum(observed.values()) / estimated_total if estimated_total > 0 else 1.0
+
+    def travel(a, b, a_default="start", b_default="end"):
+        key = (_stop_key(a, a_default), _stop_key(b, b_default))
+        return observed[key] if key in observed else estimate(a, b) * scale
+
+    def cost(sequence):
+        current, violations, previous = start_ts, 0, params.start_location
+        for location in sequence:
+            arrival = current + travel(previous, location)
+            if arrival < location["start_ts"] or arrival > location["end_ts"]:
+                violations += 1
+            current = arrival + location["visit_duration_sec"]
+            previous = location
+        current += travel(previous, end_location, b_default="end")
+        return current - start_ts + VIOLATION_PENALTY_SEC * violations
+
+    sequence = [location for location, _ in stops]
+    best = cost(sequence)
+    improved = True
+    while improved:
+        improved = False
+        for seam in seams:
+            low = max(0, seam - BOUNDARY_REPAIR_WINDOW)
+            high = min(len(sequence), seam + BOUNDARY_REPAIR_WINDOW)
+            for i in range(low, high - 1):
+                for j in range(i + 1, high):
+                    candidate = sequence[:i] + sequence[i:j + 1][::-1] + sequence[j + 1:]
+                    candidate_cost = cost(candidate)
+                    if candidate_cost < best:
+                        sequence, best, improved = candidate, candidate_cost, True
+
+    repaired = []
+    previous = params.start_location
+    for location in sequence:
+        repaired.append((location, int(round(travel(previous, location)))))
+        previous = location
+    return repaired
+
+def _stitch_segments(segments, segment_stops, params: RouteOptimizationParams):
+    stops = [stop for part in segment_stops for stop in part]
+    seams = []
+    for part in segment_stops[:-1]:
+        seams.append((seams[-1] if seams else 0) + len(part))
+    stops = repair_boundaries(stops, seams, params)
+
+    route_plan = []
+    start_ts = int(params.global_start_time.timestamp())
+    for i, (location, travel_sec) in enumerate(stops):
+        route_plan.append({
+            "address": location["house_data"].address,
+            "arrival_time": datetime.fromtimestamp(start_ts, timezone.utc),  # placeholder; validator computes the schedule
+            "departure_time": datetime.fromtimestamp(start_ts + location["visit_duration_sec"], timezone.utc),
+            "original_order": location["original_index"],
+            "optimized_order": i,
+            "location_data": location,
+            "travel_duration_sec": travel_sec
+        })
+    corrected_route = validate_time_windows(route_plan, params.locations, start_ts)
+    logger.info(f"Stitched {len(segments)} Routes API segments into a {len(route_plan)}-stop route")
+    return corrected_route
+
+def optimize_route_decomposed(params: RouteOptimizationParams, timeout_sec=None):
+    """
+    Optimize a tour with more stops than ROUTES_API_MAX_INTERMEDIATES: cap-sized segments
+    are optimized concurrently, stitched at their anchored boundaries and repaired locally.
+    """
+    started = time.monotonic()
+    segments = _plan_segments(params, settings.ROUTES_API_MAX_INTERMEDIATES)
+    logger.info(f"Splitting {len(params.locations)} stops into {len(segments)} Routes API segments")
+
+    def optimize_segment(segment):
+        return _segment_stops(call_api(build_payload(segment["params"]), timeout_sec=_remaining_timeout(timeout_sec, started)), segment)
+
+    with ThreadPoolExecutor(max_workers=len(segments), thread_name_prefix="routes-segment") as executor:
+        segment_stops = list(executor.map(optimize_segment, segments))
+    return _stitch_segments(segments, segment_stops, params)
+
+async def optimize_route_decomposed_async(params: RouteOptimizationParams, timeout_sec=None):
+    """Async optimize_route_decomposed: segments are requested concurrently on the event loop"""
+    started = time.monotonic()
+    segments = await asyncio.to_thread(_plan_segments, params, settings.ROUTES_API_MAX_INTERMEDIATES)
+    logger.info(f"Splitting {len(params.locations)} stops into {len(segments)} Routes API segments")
+
+    async def optimize_segment(segment):
+        raw_response = await call_api_async(build_payload(segment["params"]), timeout_sec=_remaining_timeout(timeout_sec, started))
+        return _segment_stops(raw_response, segment)
+
+    segment_stops = await asyncio.gather(*(optimize_segment(segment) for segment in segments))
+    return _stitch_segments(segments, segment_stops, params)
+
+def optimize_route(params: RouteOptimizationParams, timeout_sec=None):
     """
     Optimize route using Google Routes API with waypoint optimization
     Returns optimized route plan or raises exception if failed
     """
     try:
+        if len(params.locations) > settings.ROUTES_API_MAX_INTERMEDIATES:
+            return optimize_route_decomposed(params, timeout_sec=timeout_sec)
         payload = build_payload(params)
-        raw_response = call_api(payload)
-        route_plan = process_response(raw_response, params.locations, int(params.global_start_time.timestamp()))
-        
-        if not route_plan:
-            raise Exception("No route plan generated from Routes API")
-        
-        # Validate time windows and add warnings
-        corrected_route = validate_time_windows(route_plan, params.locations, int(params.global_start_time.timestamp()))
-        
-        logger.info("Successfully created optimized route plan using Routes API (with time window validation)")
-        return corrected_route
+        raw_response = call_api(payload, timeout_sec=timeout_sec)
+        return _build_route_plan(raw_response, params)
         
     except Exception as e:
         logger.error(f"Routes API optimization failed: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+async def optimize_route_async(params: RouteOptimizationParams, timeout_sec=None):
+    """Async optimize_route: the API call does not block the event loop"""
+    try:
+        if len(params.locations) > settings.ROUTES_API_MAX_INTERMEDIATES:
+            return await optimize_route_decomposed_async(params, timeout_sec=timeout_sec)
+        payload = build_payload(params)
+        raw_response = await call_api_async(payload, timeout_sec=timeout_sec)
+        return _build_route_plan(raw_response, params)
+
+    except Exception as e:
+        logger.error(f"Routes API optimization failed: {str(e)}")
+        raise
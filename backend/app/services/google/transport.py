@@ -0,0 +1,91 @@
+import random
+import re
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Query strings can carry the API key (key=...), so they are dropped from log messages
+_QUERY_RE = re.compile(r"\?[^\s'\")]*")
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Return the process-wide session whose adapters keep a keep-alive pool per host"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=settings.GOOGLE_HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=settings.GOOGLE_HTTP_POOL_MAXSIZE,
+                    max_retries=0  # retries are handled in request() so they can back off with jitter
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def endpoint_timeout(read_timeout_sec: float):
+    """Build a (connect, read) timeout tuple for an endpoint"""
+    return (min(settings.GOOGLE_HTTP_CONNECT_TIMEOUT_SEC, read_timeout_sec), read_timeout_sec)
+
+def redact(text) -> str:
+    """Text (a URL or exception message) with any query string replaced, for logging"""
+    return _QUERY_RE.sub("?<redacted>", str(text))
+
+def backoff_delay(attempt: int, retry_after=None) -> float:
+    """Full-jitter exponential backoff, never shorter than a server supplied Retry-After"""
+    cap = min(settings.GOOGLE_HTTP_BACKOFF_MAX_SEC, settings.GOOGLE_HTTP_BACKOFF_BASE_SEC * (2 ** attempt))
+    delay = random.uniform(0, cap)
+    if retry_after:
+        try:
+            delay = max(delay, min(float(retry_after), settings.GOOGLE_HTTP_BACKOFF_MAX_SEC))
+        except ValueError:
+            pass
+    return delay
+
+def request(method: str, url: str, timeout=None, max_retries=None, deadline=None, **kwargs) -> requests.Response:
+    """
+    Send a request through the shared session.
+    429/5xx responses and connection failures are retried with jittered exponential backoff;
+    read timeouts are not retried. A retry is skipped when its backoff would run past
+    deadline (a time.monotonic() value). The last response is returned so callers can
+    raise_for_status().
+    """
+    session = get_session()
+    retries = settings.GOOGLE_HTTP_MAX_RETRIES if max_retries is None else max_retries
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.ConnectionError as e:
+            delay = backoff_delay(attempt)
+            if attempt >= retries or (deadline is not None and time.monotonic() + delay >= deadline):
+                raise
+            logger.warning(f"{method} {redact(url)} connection failed ({redact(e)}); retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+            return response
+
+        delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return response
+        logger.warning(f"{method} {redact(url)} returned {response.status_code}; retrying in {delay:.2f}s (attempt {attempt + 1}/{retries})")
+        response.close()
+        time.sleep(delay)
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
@@ -1,46 +1,60 @@
-import math
 from datetime import datetime, timezone
+import numpy as np
+from app.core.config import settings
 from app.core.logging import get_logger
+from app.services.distance import haversine_km_matrix
 from app.services.time_windows import compute_schedule_with_time_windows
+from app.services.spatial_index import SpatialIndex
+from app.services.travel_matrix import active_provider, get_travel_matrix, haversine_travel_sec, quantize_point
 from app.schemas.route import RouteOptimizationParams
 
 logger = get_logger(__name__)
 
-def calculate_distance(lat1, lng1, lat2, lng2):
-    """Calculate distance between two points using Haversine formula"""
-    R = 6371  # Earth's radius in kilometers
-    
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lng = math.radians(lng2 - lng1)
-    
-    a = (math.sin(delta_lat / 2) ** 2 + 
-         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lng / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    
-    return R * c
-
-def find_nearest_neighbor(current_location, unvisited_locations):
-    """Find the nearest unvisited location to the current location"""
-    if not unvisited_locations:
+def find_nearest_neighbor(current_index, visited, matrix, distance=None):
+    """
+    Index of the unvisited point with the shortest travel time from current_index, or None.
+    Equal travel times (e.g. short legs at the estimate's minimum leg time) go to the
+    point closest by distance when a distance matrix is given.
+    """
+    if visited.all():
         return None
-    
-    min_distance = float('inf')
-    nearest_location = None
-    
-    for location in unvisited_locations:
-        distance = calculate_distance(
-            current_location["lat"], current_location["lng"],
-            location["lat"], location["lng"]
-        )
-        if distance < min_distance:
-            min_distance = distance
-            nearest_location = location
-    
-    return nearest_location
+    travel = np.where(visited, np.inf, matrix[current_index])
+    if distance is None:
+        return int(np.argmin(travel))
+    return int(np.argmin(np.where(travel == travel.min(), distance[current_index], np.inf)))
+
+def _matrix_visit_order(params: RouteOptimizationParams, departure_ts, deadline=None):
+    """Nearest-neighbour order by travel time: yields (stop index, travel seconds from the previous point)"""
+    # Travel times between the start (index 0) and every stop (index i + 1)
+    points = [params.start_location] + params.locations
+    matrix = np.asarray(get_travel_matrix(points, departure_ts=departure_ts, deadline=deadline))
+    distance = haversine_km_matrix([(p["lat"], p["lng"]) for p in points])
+    current_index = 0
+    visited = np.zeros(len(matrix), dtype=bool)
+    visited[0] = True
+    while True:
+        nearest_index = find_nearest_neighbor(current_index, visited, matrix, distance)
+        if nearest_index is None:
+            return
+        yield nearest_index - 1, int(matrix[current_index, nearest_index])
+        visited[nearest_index] = True
+        current_index = nearest_index
+
+def _indexed_visit_order(params: RouteOptimizationParams, departure_ts):
+    """
+    Nearest-neighbour order from a spatial index, without building an n x n matrix.
+    Only valid for the haversine travel model, where the nearest stop is also the quickest.
+    """
+    index = SpatialIndex([(loc["lat"], loc["lng"]) for loc in params.locations])
+    current = quantize_point(params.start_location["lat"], params.start_location["lng"])
+    while len(index):
+        nearest_index = index.nearest(*current)
+        index.remove(nearest_index)
+        nearest = quantize_point(params.locations[nearest_index]["lat"], params.locations[nearest_index]["lng"])
+        yield nearest_index, 0 if nearest == current else haversine_travel_sec(current, nearest, departure_ts)
+        current = nearest
 
-def optimize_route(params: RouteOptimizationParams):
+def optimize_route(params: RouteOptimizationParams, deadline=None):
     """
     Optimize route using greedy nearest neighbor algorithm
     Returns optimized route plan
@@ -49,28 +63,16 @@ def optimize_route(params: RouteOptimizationParams):
         logger.info("Using greedy nearest neighbor algorithm for route optimization")
         logger.warning("Greedy algorithm does not respect time windows and may not be optimal")
         
-        # Start from the start location
-        current_location = params.start_location
-        unvisited_locations = params.locations.copy()
-        route_plan = []
         current_time = int(params.global_start_time.timestamp())
-        
-        # Visit each location using nearest neighbor
-        while unvisited_locations:
-            nearest = find_nearest_neighbor(current_location, unvisited_locations)
-            if not nearest:
-                break
+        if active_provider() == "haversine" and len(params.locations) >= settings.SPATIAL_INDEX_MIN_STOPS:
+            visit_order = _indexed_visit_order(params, current_time)
+        else:
+            visit_order = _matrix_visit_order(params, current_time, deadline)
+        route_plan = []
 
-            # Estimate travel time from current_location to nearest using simple speed model
-            try:
-                distance_km = calculate_distance(
-                    current_location["lat"], current_location["lng"],
-                    nearest["lat"], nearest["lng"]
-                )
-                # Assume average speed 40 km/h; minimum 5 minutes to avoid zero
-                travel_time_estimate = max(5 * 60, int((distance_km / 40.0) * 3600))
-            except Exception:
-                travel_time_estimate = 15 * 60
+        # Visit each location using nearest neighbor
+        for nearest_index, travel_time_estimate in visit_order:
+            nearest = params.locations[nearest_index]
 
             # Add to route plan (times will be recomputed in validator; set reasonable placeholders)
             house_data = nearest["house_data"]
@@ -88,13 +90,9 @@ def optimize_route(params: RouteOptimizationParams):
                 "travel_duration_sec": travel_time_estimate
             })
 
-            # Update current location and time (travel + visit)
-            current_location = nearest
+            # Advance the clock by travel + visit
             current_time += travel_time_estimate + nearest["visit_duration_sec"]
 
-            # Remove visited location
-            unvisited_locations.remove(nearest)
-        
         # Validate time windows and add warnings
         corrected_route = validate_time_windows(route_plan, params.locations, int(params.global_start_time.timestamp()))
         
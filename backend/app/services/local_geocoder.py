@@ -0,0 +1,155 @@
+import bisect
+import csv
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.geocode_cache import normalize_address
+from app.services.spatial_index import SpatialIndex
+
+logger = get_logger(__name__)
+
+ADDRESS_COLUMNS = ("address", "full_address")
+LAT_COLUMNS = ("lat", "latitude")
+LNG_COLUMNS = ("lng", "lon", "long", "longitude")
+
+def _pick_column(columns, candidates, path):
+    lowered = {c.lower(): c for c in columns}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    raise ValueError(f"Gazetteer {path} has no column named any of {candidates}")
+
+def _read_rows(path: Path):
+    """Yield (address, lat, lng) from a CSV or Parquet gazetteer"""
+    if path.suffix.lower() == ".parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading a Parquet gazetteer requires pyarrow: pip install pyarrow")
+        table = pq.read_table(path)
+        address_col = _pick_column(table.column_names, ADDRESS_COLUMNS, path)
+        lat_col = _pick_column(table.column_names, LAT_COLUMNS, path)
+        lng_col = _pick_column(table.column_names, LNG_COLUMNS, path)
+        yield from zip(table.column(address_col).to_pylist(), table.column(lat_col).to_pylist(), table.column(lng_col).to_pylist())
+        return
+
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        address_col = _pick_column(reader.fieldnames or [], ADDRESS_COLUMNS, path)
+        lat_col = _pick_column(reader.fieldnames or [], LAT_COLUMNS, path)
+        lng_col = _pick_column(reader.fieldnames or [], LNG_COLUMNS, path)
+        for row in reader:
+            yield row[address_col], row[lat_col], row[lng_col]
+
+class LocalGeocoder:
+    """
+    Offline geocoder over a local gazetteer.
+    Normalized addresses are kept in one sorted list with coordinates in parallel
+    float arrays, so exact and prefix lookups are a binary search. An inverted
+    token index resolves addresses written with extra or missing parts (e.g. a ZIP code)
+    as long as exactly one gazetteer entry matches every query token.
+    """
+
+    def __init__(self, rows):
+        entries = {}
+        for address, lat, lng in rows:
+            if not address or lat in (None, "") or lng in (None, ""):
+                continue
+            entries[normalize_address(str(address))] = (float(lat), float(lng))
+
+        self.keys: List[str] = sorted(entries)
+        self.lats = array("d", (entries[k][0] for k in self.keys))
+        self.lngs = array("d", (entries[k][1] for k in self.keys))
+
+        postings: Dict[str, List[int]] = {}
+        for i, key in enumerate(self.keys):
+            for token in set(key.split()):
+                postings.setdefault(token, []).append(i)
+        self.token_index: Dict[str, array] = {token: array("I", ids) for token, ids in postings.items()}
+        self._spatial_index = None
+        self._index_lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        path = Path(path)
+        geocoder = cls(_read_rows(path))
+        logger.info(f"Loaded {len(geocoder)} gazetteer entries from {path}")
+        return geocoder
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _exact(self, key: str) -> Optional[int]:
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return None
+
+    def _by_tokens(self, key: str) -> Optional[int]:
+        tokens = set(key.split())
+        if not tokens or any(t not in self.token_index for t in tokens):
+            return None
+        posting_lists = sorted((self.token_index[t] for t in tokens), key=len)
+        candidates = set(posting_lists[0])
+        for posting in posting_lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return None
+        # Several entries containing every query token (e.g. "main st" in "1 main st" and "2 main st") are ambiguous
+        return candidates.pop() if len(candidates) == 1 else None
+
+    def lookup(self, address: str) -> Optional[Tuple[float, float]]:
+        """Return (lat, lng) for address, or None if the gazetteer has no unambiguous match"""
+        key = normalize_address(address)
+        i = self._exact(key)
+        if i is None:
+            i = self._by_tokens(key)
+        if i is None:
+            return None
+        return self.lats[i], self.lngs[i]
+
+    def search_prefix(self, prefix: str, limit: int = 10) -> List[Tuple[str, float, float]]:
+        """Return up to limit (normalized_address, lat, lng) entries starting with prefix"""
+        key = normalize_address(prefix)
+        start = bisect.bisect_left(self.keys, key)
+        matches = []
+        for i in range(start, min(start + limit, len(self.keys))):
+            if not self.keys[i].startswith(key):
+                break
+            matches.append((self.keys[i], self.lats[i], self.lngs[i]))
+        return matches
+
+    def nearby(self, lat: float, lng: float, limit: int = 10, radius_km: Optional[float] = None) -> List[Tuple[str, float, float, float]]:
+        """
+        Return up to limit (normalized_address, lat, lng, distance_km) entries closest to a point,
+        optionally only those within radius_km. The spatial index is built on first use.
+        """
+        if self._spatial_index is None:
+            with self._index_lock:
+                if self._spatial_index is None:
+                    self._spatial_index = SpatialIndex(list(zip(self.lats, self.lngs)))
+        if radius_km is None:
+            found = self._spatial_index.knn(lat, lng, limit)
+        else:
+            found = self._spatial_index.radius(lat, lng, radius_km)[:limit]
+        return [(self.keys[i], self.lats[i], self.lngs[i], distance_km) for i, distance_km in found]
+
+_local_geocoder = None
+_local_geocoder_path = None
+_load_lock = threading.Lock()
+
+def get_local_geocoder() -> Optional[LocalGeocoder]:
+    """Return the gazetteer configured by LOCAL_GEOCODER_PATH, loading it on first use"""
+    global _local_geocoder, _local_geocoder_path
+    path = settings.LOCAL_GEOCODER_PATH
+    if not path:
+        return None
+    if _local_geocoder is None or _local_geocoder_path != path:
+        with _load_lock:
+            if _local_geocoder is None or _local_geocoder_path != path:
+                _local_geocoder = LocalGeocoder.from_file(path)
+                _local_geocoder_path = path
+    return _local_geocoder
@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Optional
+import numpy as np
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.vrptw_optimizer import (
+    build_problem, candidate_neighbors, cheapest_insertion, improve_route, node_distances, route_cost, schedule_route
+)
+from app.schemas.route import RouteOptimizationParams
+
+logger = get_logger(__name__)
+
+# Extra seconds to wait for worker results after the search budget, covering process start-up and pickling
+RESULT_GRACE_SEC = 0.5
+
+def perturb(route, rng):
+    """Double-bridge move (three random cuts, middle segments swapped) that 2-opt cannot undo in one step"""
+    route = list(route)
+    if len(route) < 8:
+        rng.shuffle(route)
+        return route
+    a, b, c = sorted(rng.sample(range(1, len(route)), 3))
+    return route[:a] + route[b:c] + route[a:b] + route[c:]
+
+def _search_worker(shm_name, shape, dtype, ready, due, service, start_ts, route, neighbors, seed, deadline):
+    """
+    One search chain, run in a pool process. The travel matrix is read from shared memory.
+    Chain 0 improves the given route; the others first perturb it. Each chain then keeps
+    perturbing its best route and re-optimizing it until the wall-clock deadline.
+    Returns (cost, late stop count, route).
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # Plain lists make the cost evaluation in the local search much faster than array indexing
+        travel = np.ndarray(shape, dtype=dtype, buffer=shm.buf).tolist()
+    finally:
+        shm.close()
+
+    rng = random.Random(seed)
+    if seed:
+        route = perturb(route, rng)
+
+    def search(start_route):
+        remaining = deadline - time.time()
+        found = improve_route(start_route, travel, ready, due, service, start_ts,
+                              time_limit_sec=max(0.0, remaining), neighbors=neighbors)
+        return route_cost(found, travel, ready, due, service, start_ts)[0], found
+
+    best_cost, best = search(route)
+    while time.time() < deadline:
+        cost, candidate = search(perturb(best, rng))
+        if cost < best_cost:
+            best_cost, best = cost, candidate
+    return best_cost, route_cost(best, travel, ready, due, service, start_ts)[1], best
+
+def _warm_up():
+    """Runs in each new worker so the app modules are imported before the first search"""
+    return os.getpid()
+
+class LocalSearchPool:
+    """
+    Process pool for multi-start local search, started on first use and shared by requests.
+    Workers come from a fork server (or spawn) rather than forking the threaded API process.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def workers(self) -> int:
+        return self.max_workers or settings.LOCAL_SOLVER_PARALLEL_WORKERS or os.cpu_count() or 1
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(max_workers=self.workers(), mp_context=multiprocessing.get_context(method))
+            return self._executor
+
+    def start(self):
+        """
+        Start the workers ahead of the first request, since process start-up would not fit a
+        search budget. Returns the warm-up futures (one per worker)
+        """
+        executor = self._get_executor()
+        return [executor.submit(_warm_up) for _ in range(self.workers())]
+
+    def search(self, travel, ready, due, service, start_ts, route, neighbors, time_limit_sec):
+        """
+        Run one chain per worker from route for time_limit_sec and return the best
+        (cost, late, route) found, or None if no chain finished in time
+        """
+        travel = np.ascontiguousarray(travel, dtype=np.int64)
+        deadline = time.time() + time_limit_sec
+        shm = shared_memory.SharedMemory(create=True, size=max(1, travel.nbytes))
+        try:
+            np.ndarray(travel.shape, dtype=travel.dtype, buffer=shm.buf)[:] = travel
+            executor = self._get_executor()
+            futures = [
+                executor.submit(_search_worker, shm.name, travel.shape, travel.dtype.str, list(ready), list(due),
+                                list(service), start_ts, list(route), neighbors, seed, deadline)
+                for seed in range(self.workers())
+            ]
+            done, pending = wait(futures, timeout=time_limit_sec + RESULT_GRACE_SEC)
+            for future in pending:
+                future.cancel()
+            results = []
+            for future in done:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.warning(f"Local search worker failed: {str(e)}")
+            if pending:
+                logger.warning(f"{len(pending)} local search workers missed the {time_limit_sec}s budget")
+            return min(results, key=lambda result: result[0]) if results else None
+        except Exception:
+            # A broken pool (e.g. a worker was killed) is replaced on the next search
+            self.shutdown()
+            raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+local_search_pool = LocalSearchPool()
+
+def optimize_route(params: RouteOptimizationParams, time_limit_sec: Optional[float] = None, deadline: Optional[float] = None):
+    """
+    Multi-start local search across a process pool: every worker runs a perturbation chain
+    of the local VRPTW search from the cheapest-insertion route and the best route found
+    within the budget wins. Raises when parallel search is disabled or the tour is below
+    LOCAL_SOLVER_PARALLEL_MIN_STOPS, so the single-process solver takes over.
+    """
+    stop_count = len(params.locations)
+    if not settings.LOCAL_SOLVER_PARALLEL:
+        raise Exception("Parallel local search is disabled (LOCAL_SOLVER_PARALLEL)")
+    if stop_count < settings.LOCAL_SOLVER_PARALLEL_MIN_STOPS:
+        raise Exception(f"{stop_count} stops is below LOCAL_SOLVER_PARALLEL_MIN_STOPS ({settings.LOCAL_SOLVER_PARALLEL_MIN_STOPS})")
+
+    started = time.perf_counter()
+    time_limit_sec = time_limit_sec if time_limit_sec is not None else settings.LOCAL_SOLVER_PARALLEL_TIME_LIMIT_SEC
+    travel, ready, due, service, start_ts = build_problem(params, deadline)
+    route = cheapest_insertion(travel, ready, due, service, start_ts, distance=node_distances(params))
+    neighbors = candidate_neighbors(params, travel)
+
+    # Leave part of the budget for building the problem and scheduling the result
+    remaining = max(0.0, time_limit_sec - (time.perf_counter() - started) - RESULT_GRACE_SEC)
+    best = local_search_pool.search(travel, ready, due, service, start_ts, route, neighbors, remaining)
+    if best is None:
+        raise Exception(f"No local search worker finished within {time_limit_sec}s")
+
+    _, late, order = best
+    logger.info(f"Parallel local search planned {stop_count} stops on {local_search_pool.workers()} workers "
+                f"in {(time.perf_counter() - started) * 1000:.0f}ms ({late} late)")
+    return schedule_route(order, params, travel, ready, due, service, start_ts)
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Optional
+from app.core.config import settings
+from app.core.logging import get_logger
+
+logger = get_logger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def _address_key(address: str) -> str:
+    """
+    Case and whitespace only: responses echo the request's address strings, so unit
+    suffixes and other details must still tell requests apart
+    """
+    return _WHITESPACE_RE.sub(" ", address).strip().lower()
+
+def plan_cache_key(request) -> str:
+    """
+    Canonical hash of a RoutePlanRequest: addresses, visit windows, durations and the
+    global window. House order is kept because responses report original_order.
+    """
+    canonical = {
+        "start": _address_key(request.start_address),
+        "destination": _address_key(request.destination_address) if request.destination_address else None,
+        "houses": [
+            [_address_key(h.address), int(h.start_time.timestamp()), int(h.end_time.timestamp()), h.duration_minutes]
+            for h in request.houses
+        ],
+        "global_window": [int(request.global_start_time.timestamp()), int(request.global_end_time.timestamp())],
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class PlanCache:
+    """
+    LRU + TTL cache of route plans with in-flight coalescing: while a plan is being
+    computed, identical requests wait for that computation instead of starting their own.
+    Failures are shared with the waiters but never cached.
+    """
+
+    def __init__(self, ttl_seconds: Optional[int] = None, max_entries: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.PLAN_CACHE_TTL_SECONDS
+        self.max_entries = max_entries if max_entries is not None else settings.PLAN_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_locked(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            return self._get_locked(key)
+
+    def set(self, key, value):
+        with self._lock:
+            self._set_locked(key, value)
+
+    def _claim(self, key):
+        """Return (cached_value, future, is_leader) for key under the lock"""
+        with self._lock:
+            cached = self._get_locked(key)
+            if cached is not None:
+                self.hits += 1
+                return cached, None, False
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+            self.misses += 1
+            future = Future()
+            self._in_flight[key] = future
+            return None, future, True
+
+    def _finish(self, key, future, value=None, error=None):
+        with self._lock:
+            if error is None:
+                self._set_locked(key, value)
+            self._in_flight.pop(key, None)
+        if future.done():
+            return
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+    def get_or_compute(self, key, compute, share=None):
+        """
+        Return the cached plan for key, join an identical in-flight computation, or run compute().
+        share, if given, is applied to values this caller did not compute (hits and joined computations).
+        """
+        share = share or (lambda value: value)
+        cached, future, is_leader = self._claim(key)
+        if cached is not None:
+            logger.info(f"Plan cache hit: {key[:12]}")
+            return share(cached)
+        if not is_leader:
+            logger.info(f"Coalescing with in-flight plan computation: {key[:12]}")
+            return share(future.result())
+
+        try:
+            value = compute()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, value=value)
+        return value
+
+    async def get_or_compute_async(self, key, compute, share=None):
+        """
+        Async get_or_compute: compute is a coroutine function; waiters await the shared future.
+        share runs in a worker thread.
+        """
+        share = share or (lambda value: value)
+        cached, future, is_leader = self._claim(key)
+        if cached is not None:
+            logger.info(f"Plan cache hit: {key[:12]}")
+            return await asyncio.to_thread(share, cached)
+        if not is_leader:
+            logger.info(f"Coalescing with in-flight plan computation: {key[:12]}")
+            # Shielded so a cancelled waiter (e.g. a disconnected client) leaves the shared future alone
+            value = await asyncio.shield(asyncio.wrap_future(future))
+            return await asyncio.to_thread(share, value)
+
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            self._finish(key, future, error=Exception("Plan computation was cancelled"))
+            raise
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, value=value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.coalesced = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "in_flight": len(self._in_flight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
+
+plan_cache = PlanCache()
@@ -0,0 +1,298 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from sqlalchemy import or_
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db.models import PlanJob
+from app.db.session import SessionLocal, init_db
+from app.schemas.route import PlanJobResponse, RoutePlanRequest, RoutePlanResponse
+from app.services.plan_cache import plan_cache, plan_cache_key
+from app.services.plan_store import own_plan
+from app.services.routing import plan_optimized_route
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = {SUCCEEDED, FAILED, CANCELLED}
+
+class JobQueueFullError(Exception):
+    """Raised when the job queue already holds PLAN_JOB_MAX_QUEUED waiting jobs"""
+
+def run_plan_request(request: RoutePlanRequest) -> RoutePlanResponse:
+    """Plan a route for a request the same way /plan-route does, sharing its plan cache"""
+    def compute_plan():
+        return plan_optimized_route(
+            houses=request.houses,
+            start_address=request.start_address,
+            destination_address=request.destination_address,
+            global_start_time=request.global_start_time,
+            global_end_time=request.global_end_time,
+            deadline_sec=request.deadline_seconds
+        )
+
+    if settings.PLAN_CACHE_ENABLED:
+        return plan_cache.get_or_compute(plan_cache_key(request), compute_plan, share=own_plan)
+    return compute_plan()
+
+def _to_response(job: PlanJob) -> PlanJobResponse:
+    return PlanJobResponse(
+        job_id=job.id,
+        status=job.status,
+        created_at=datetime.fromtimestamp(job.created_at, timezone.utc),
+        updated_at=datetime.fromtimestamp(job.updated_at, timezone.utc),
+        result=RoutePlanResponse.model_validate_json(job.result_json) if job.result_json else None,
+        error=job.error
+    )
+
+def _lease_expired(now: int):
+    """Filter for running jobs whose owner stopped renewing their lease"""
+    return (PlanJob.status == RUNNING) & or_(PlanJob.lease_expires_at.is_(None), PlanJob.lease_expires_at < now)
+
+class PlanJobManager:
+    """
+    Runs route planning jobs on a bounded local worker pool, outside any request.
+    Job state lives in the app database, so clients can poll from a new connection and
+    queued or interrupted jobs are picked up again after a restart (resume_pending).
+    Several processes (e.g. uvicorn workers) can share the database: a job is claimed
+    atomically before it runs and its owner holds a lease that it renews while running,
+    so only jobs whose owner stopped renewing are taken over, at startup (resume_pending)
+    or by the periodic sweep of a live process.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_workers: Optional[int] = None,
+                 max_queued: Optional[int] = None, runner=run_plan_request, lease_seconds: Optional[int] = None):
+        self.session_factory = session_factory
+        self.max_workers = max_workers or settings.PLAN_JOB_WORKERS
+        self.max_queued = max_queued if max_queued is not None else settings.PLAN_JOB_MAX_QUEUED
+        self.lease_seconds = lease_seconds if lease_seconds is not None else settings.PLAN_JOB_LEASE_SECONDS
+        self.runner = runner
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = None
+        self._futures: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._stop_renewing = threading.Event()
+        self._renewer = None
+
+    def _ensure_ready(self):
+        with self._lock:
+            if not self._schema_ready:
+                session = self.session_factory()
+                try:
+                    init_db(bind=session.get_bind())
+                finally:
+                    session.close()
+                self._schema_ready = True
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="plan-job")
+                self._stop_renewing.clear()
+                self._renewer = threading.Thread(target=self._renew_leases, name="plan-job-lease", daemon=True)
+                self._renewer.start()
+
+    def _renew_leases(self):
+        """
+        Until shutdown, extend the leases of the jobs this process is running and queue jobs
+        whose lease expired, e.g. because the process running them died
+        """
+        while not self._stop_renewing.wait(self.lease_seconds / 3):
+            session = self.session_factory()
+            try:
+                now = int(time.time())
+                session.query(PlanJob).filter(PlanJob.owner == self.owner, PlanJob.status == RUNNING).update(
+                    {PlanJob.lease_expires_at: now + self.lease_seconds}, synchronize_session=False
+                )
+                session.commit()
+                expired_ids = [
+                    row[0] for row in session.query(PlanJob.id)
+                    .filter(_lease_expired(now), PlanJob.cancel_requested.is_(False))
+                    .order_by(PlanJob.created_at.asc())
+                ]
+            except Exception as e:
+                logger.warning(f"Could not renew plan job leases: {str(e)}")
+                continue
+            finally:
+                session.close()
+            with self._lock:
+                expired_ids = [job_id for job_id in expired_ids
+                               if job_id not in self._futures or self._futures[job_id].done()]
+            for job_id in expired_ids:
+                logger.info(f"Taking over plan job {job_id} after its lease expired")
+                try:
+                    self._enqueue(job_id)
+                except RuntimeError:
+                    # Shut down meanwhile
+                    return
+
+    def _claim(self, job_id: str) -> bool:
+        """
+        Atomically take a job that is queued, or running under an expired lease, and mark it
+        running under this process. Returns False if another process has it or it was cancelled.
+        """
+        now = int(time.time())
+        session = self.session_factory()
+        try:
+            claimed = session.query(PlanJob).filter(
+                PlanJob.id == job_id,
+                PlanJob.cancel_requested.is_(False),
+                or_(PlanJob.status == QUEUED, _lease_expired(now))
+            ).update({
+                PlanJob.status: RUNNING,
+                PlanJob.owner: self.owner,
+                PlanJob.lease_expires_at: now + self.lease_seconds,
+                PlanJob.updated_at: now,
+            }, synchronize_session=False)
+            session.commit()
+            return claimed == 1
+        finally:
+            session.close()
+
+    def _finish(self, job_id: str, **fields) -> bool:
+        """Record a job's outcome if this process still owns it and it was not cancelled meanwhile"""
+        session = self.session_factory()
+        try:
+            fields.update({"updated_at": int(time.time()), "lease_expires_at": None})
+            updated = session.query(PlanJob).filter(
+                PlanJob.id == job_id, PlanJob.owner == self.owner, PlanJob.status == RUNNING
+            ).update({getattr(PlanJob, name): value for name, value in fields.items()}, synchronize_session=False)
+            session.commit()
+            return updated == 1
+        finally:
+            session.close()
+
+    def _load(self, job_id: str) -> Optional[PlanJob]:
+        session = self.session_factory()
+        try:
+            job = session.get(PlanJob, job_id)
+            if job is not None:
+                session.expunge(job)
+            return job
+        finally:
+            session.close()
+
+    def _enqueue(self, job_id: str):
+        with self._lock:
+            self._futures = {k: f for k, f in self._futures.items() if not f.done()}
+            future = self._executor.submit(self._run, job_id)
+            self._futures[job_id] = future
+
+    def submit(self, request: RoutePlanRequest) -> PlanJobResponse:
+        """Persist a new job and queue it; raises JobQueueFullError when the queue is full"""
+        self._ensure_ready()
+        with self._lock:
+            active = sum(1 for f in self._futures.values() if not f.done())
+        if active >= self.max_workers + self.max_queued:
+            raise JobQueueFullError(f"Plan job queue is full ({active} active jobs)")
+
+        now = int(time.time())
+        job = PlanJob(
+            id=uuid.uuid4().hex,
+            status=QUEUED,
+            request_json=request.model_dump_json(),
+            cancel_requested=False,
+            created_at=now,
+            updated_at=now
+        )
+        session = self.session_factory()
+        try:
+            session.add(job)
+            session.commit()
+            session.refresh(job)
+            session.expunge(job)
+        finally:
+            session.close()
+
+        logger.info(f"Queued plan job {job.id} for {len(request.houses)} houses")
+        self._enqueue(job.id)
+        return _to_response(job)
+
+    def get(self, job_id: str) -> Optional[PlanJobResponse]:
+        self._ensure_ready()
+        job = self._load(job_id)
+        return _to_response(job) if job else None
+
+    def cancel(self, job_id: str) -> Optional[PlanJobResponse]:
+        """
+        Cancel a job. A queued job never runs; a running job finishes in the background
+        but its result is discarded. Finished jobs are returned unchanged.
+        """
+        self._ensure_ready()
+        job = self._load(job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return _to_response(job) if job else None
+
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        logger.info(f"Cancelling plan job {job_id} (was {job.status})")
+        session = self.session_factory()
+        try:
+            # Conditional, so a job that finished in the meantime keeps its outcome
+            session.query(PlanJob).filter(PlanJob.id == job_id, PlanJob.status.notin_(FINISHED_STATUSES)).update(
+                {PlanJob.status: CANCELLED, PlanJob.cancel_requested: True, PlanJob.updated_at: int(time.time())},
+                synchronize_session=False
+            )
+            session.commit()
+        finally:
+            session.close()
+        return _to_response(self._load(job_id))
+
+    def _run(self, job_id: str):
+        if not self._claim(job_id):
+            return
+        job = self._load(job_id)
+        logger.info(f"Running plan job {job_id}")
+
+        try:
+            request = RoutePlanRequest.model_validate_json(job.request_json)
+            result = self.runner(request)
+            outcome = {"status": SUCCEEDED, "result_json": result.model_dump_json(), "error": None}
+        except Exception as e:
+            logger.error(f"Plan job {job_id} failed: {str(e)}", exc_info=True)
+            outcome = {"status": FAILED, "error": str(e)}
+
+        if not self._finish(job_id, **outcome):
+            logger.info(f"Plan job {job_id} was cancelled or taken over while running; discarding result")
+            return
+        logger.info(f"Plan job {job_id} {outcome['status']}")
+
+    def resume_pending(self):
+        """
+        Queue jobs left queued, or running under an expired lease, by other processes.
+        Jobs running in live processes keep their lease and are left alone; a job queued
+        in several processes still runs once, since each run has to claim it first.
+        """
+        self._ensure_ready()
+        now = int(time.time())
+        session = self.session_factory()
+        try:
+            pending_ids = [
+                row[0] for row in session.query(PlanJob.id)
+                .filter(or_(PlanJob.status == QUEUED, _lease_expired(now)))
+                .order_by(PlanJob.created_at.asc())
+            ]
+        finally:
+            session.close()
+        for job_id in pending_ids:
+            self._enqueue(job_id)
+        if pending_ids:
+            logger.info(f"Resumed {len(pending_ids)} pending plan jobs")
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        self._stop_renewing.set()
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+plan_job_manager = PlanJobManager()
@@ -0,0 +1,208 @@
+import json
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db.models import StoredRoutePlan
+from app.db.session import SessionLocal, init_db
+from app.schemas.route import HouseVisit, PlanChange, RouteOptimizationParams, RoutePlanResponse
+from app.services.geocode_cache import normalize_address
+from app.services.geocoding import geocode_address
+from app.services.vrptw_optimizer import build_problem, candidate_neighbors, cheapest_insertion, improve_route, node_distances, schedule_route
+
+logger = get_logger(__name__)
+
+REPAIR_METHOD = "Incremental Repair"
+
+class PlanStore:
+    """
+    Planned routes (geocoded stops, time range and visit order) stored in the app database,
+    so a plan can be changed later without geocoding or optimizing it again.
+    Plans are never modified; a change is stored as a new plan. Plans expire after ttl_seconds;
+    expired rows are deleted at most every purge_interval_sec.
+    """
+
+    def __init__(self, session_factory=SessionLocal, ttl_seconds: Optional[int] = None, purge_interval_sec: Optional[int] = None):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.PLAN_STORE_TTL_SECONDS
+        self.purge_interval_sec = purge_interval_sec if purge_interval_sec is not None else settings.PLAN_STORE_PURGE_INTERVAL_SEC
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._last_purge = float("-inf")
+
+    def _ensure_schema(self):
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    session = self.session_factory()
+                    try:
+                        init_db(bind=session.get_bind())
+                    finally:
+                        session.close()
+                    self._schema_ready = True
+
+    def save(self, params: RouteOptimizationParams, response: RoutePlanResponse) -> Optional[str]:
+        """Store a plan and return its id, or None if it could not be stored"""
+        state = {
+            "start_location": params.start_location,
+            "destination_location": params.destination_location,
+            "global_start_time": params.global_start_time.isoformat(),
+            "global_end_time": params.global_end_time.isoformat(),
+            "stops": [
+                {"lat": loc["lat"], "lng": loc["lng"], "house": loc["house_data"].model_dump(mode="json")}
+                for loc in sorted(params.locations, key=lambda loc: loc["original_index"])
+            ],
+            "order": [stop.original_order for stop in response.route],
+        }
+        try:
+            return self._add(json.dumps(state))
+        except Exception as e:
+            logger.warning(f"Could not store route plan: {str(e)}")
+            return None
+
+    def fork(self, plan_id: str) -> Optional[str]:
+        """Store a copy of a plan under a new id and return it, or None if the plan is gone or could not be copied"""
+        try:
+            self._ensure_schema()
+            session = self.session_factory()
+            try:
+                entry = session.get(StoredRoutePlan, plan_id)
+                state_json = entry.state_json if entry is not None else None
+            finally:
+                session.close()
+            return self._add(state_json) if state_json is not None else None
+        except Exception as e:
+            logger.warning(f"Could not copy route plan {plan_id}: {str(e)}")
+            return None
+
+    def _add(self, state_json: str) -> str:
+        """Insert a plan row, deleting expired rows when the purge interval has passed"""
+        self._ensure_schema()
+        now = int(time.time())
+        plan_id = uuid.uuid4().hex
+        purge = False
+        with self._lock:
+            if time.monotonic() - self._last_purge >= self.purge_interval_sec:
+                self._last_purge = time.monotonic()
+                purge = True
+        session = self.session_factory()
+        try:
+            session.add(StoredRoutePlan(id=plan_id, state_json=state_json, created_at=now))
+            if purge:
+                session.query(StoredRoutePlan).filter(
+                    StoredRoutePlan.created_at < now - self.ttl_seconds
+                ).delete(synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+        return plan_id
+
+    def get(self, plan_id: str) -> Optional[Dict[str, Any]]:
+        """The stored state of a plan, or None if it does not exist or has expired"""
+        self._ensure_schema()
+        session = self.session_factory()
+        try:
+            entry = session.get(StoredRoutePlan, plan_id)
+            if entry is None or entry.created_at < int(time.time()) - self.ttl_seconds:
+                return None
+            return json.loads(entry.state_json)
+        finally:
+            session.close()
+
+plan_store = PlanStore()
+
+def own_plan(response: RoutePlanResponse, store: PlanStore = plan_store) -> RoutePlanResponse:
+    """
+    Copy of a plan response shared through the plan cache, with its own plan id, so callers
+    served the same cached plan never hand out one plan_id to different clients
+    """
+    if response.plan_id is None:
+        return response
+    return response.model_copy(update={"plan_id": store.fork(response.plan_id)})
+
+def _stop_location(index: int, stop: Dict[str, Any]) -> Dict[str, Any]:
+    house = HouseVisit.model_validate(stop["house"])
+    return {
+        "lat": stop["lat"],
+        "lng": stop["lng"],
+        "start_ts": int(house.start_time.timestamp()),
+        "end_ts": int(house.end_time.timestamp()),
+        "visit_duration_sec": house.duration_minutes * 60,
+        "original_index": index,
+        "house_data": house
+    }
+
+def _find_stop(stops: List[Dict[str, Any]], address: Optional[str]) -> int:
+    if not address:
+        raise ValueError("address is required to remove or update a stop")
+    key = normalize_address(address)
+    for i, stop in enumerate(stops):
+        if stop is not None and normalize_address(stop["house"]["address"]) == key:
+            return i
+    raise ValueError(f"No stop at {address} in this plan")
+
+def apply_plan_changes(plan_id: str, changes: List[PlanChange], store: PlanStore = plan_store) -> Optional[RoutePlanResponse]:
+    """
+    Apply inserts, removals and window changes to a stored plan without replanning it.
+    Removed stops are dropped from the visit order; inserted stops and stops with a new
+    window are placed with cheapest feasible insertion, then a short local search
+    (PLAN_REPAIR_TIME_LIMIT_SEC) tidies the route. Only new stops are geocoded.
+    Returns the repaired plan under a new plan id, or None if the plan is unknown.
+    Raises ValueError for changes that do not fit the plan.
+    """
+    started = time.perf_counter()
+    state = store.get(plan_id)
+    if state is None:
+        return None
+
+    stops: List[Optional[Dict[str, Any]]] = list(state["stops"])
+    displaced = set()
+    for change in changes:
+        if change.op == "insert":
+            if change.house is None:
+                raise ValueError("house is required to insert a stop")
+            lat, lng = geocode_address(change.house.address)
+            stops.append({"lat": lat, "lng": lng, "house": change.house.model_dump(mode="json")})
+            displaced.add(len(stops) - 1)
+        elif change.op == "remove":
+            stops[_find_stop(stops, change.address)] = None
+        elif change.op == "update_window":
+            index = _find_stop(stops, change.address)
+            house = dict(stops[index]["house"])
+            if change.start_time is not None:
+                house["start_time"] = change.start_time.isoformat()
+            if change.end_time is not None:
+                house["end_time"] = change.end_time.isoformat()
+            stops[index] = {**stops[index], "house": house}
+            displaced.add(index)
+        else:
+            raise ValueError(f"Unknown change op: {change.op}")
+
+    # Renumber the remaining stops; node k + 1 in the solver arrays is stop k
+    kept = [i for i, stop in enumerate(stops) if stop is not None]
+    new_index = {old: new for new, old in enumerate(kept)}
+    params = RouteOptimizationParams(
+        locations=[_stop_location(new_index[i], stops[i]) for i in kept],
+        start_location=state["start_location"],
+        destination_location=state["destination_location"],
+        global_start_time=datetime.fromisoformat(state["global_start_time"]),
+        global_end_time=datetime.fromisoformat(state["global_end_time"])
+    )
+    route = [new_index[i] + 1 for i in state["order"] if i in new_index and i not in displaced]
+
+    route_plan = []
+    if params.locations:
+        travel, ready, due, service, start_ts = build_problem(params)
+        route = cheapest_insertion(travel, ready, due, service, start_ts, route=route, distance=node_distances(params))
+        route = improve_route(route, travel, ready, due, service, start_ts,
+                              time_limit_sec=settings.PLAN_REPAIR_TIME_LIMIT_SEC,
+                              neighbors=candidate_neighbors(params, travel))
+        route_plan = schedule_route(route, params, travel, ready, due, service, start_ts)
+
+    response = RoutePlanResponse(route=route_plan, optimization_method=REPAIR_METHOD)
+    response.plan_id = store.save(params, response)
+    logger.info(f"Applied {len(changes)} changes to plan {plan_id} in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return response
@@ -0,0 +1,91 @@
+import math
+from typing import List, Tuple
+
+EARTH_RADIUS_M = 6371000.0
+# Web Mercator ground resolution at the equator for zoom 0, in meters per pixel
+METERS_PER_PIXEL_ZOOM0 = 156543.03392
+
+Point = Tuple[float, float]
+
+def decode(encoded: str, precision: int = 5) -> List[Point]:
+    """Decode a Google encoded polyline into (lat, lng) points"""
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    return points
+
+def _encode_value(value: int, chunks: List[str]):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+
+def encode(points: List[Point], precision: int = 5) -> str:
+    """Encode (lat, lng) points as a Google encoded polyline"""
+    factor = 10 ** precision
+    chunks: List[str] = []
+    prev_lat = prev_lng = 0
+    for lat, lng in points:
+        lat_e, lng_e = int(round(lat * factor)), int(round(lng * factor))
+        _encode_value(lat_e - prev_lat, chunks)
+        _encode_value(lng_e - prev_lng, chunks)
+        prev_lat, prev_lng = lat_e, lng_e
+    return "".join(chunks)
+
+def tolerance_for_zoom(zoom: int, latitude: float = 0.0, pixels: float = 1.0) -> float:
+    """Ground distance in meters covered by `pixels` screen pixels at a Web Mercator zoom level"""
+    return pixels * METERS_PER_PIXEL_ZOOM0 * math.cos(math.radians(latitude)) / (2 ** zoom)
+
+def simplify(points: List[Point], tolerance_m: float) -> List[Point]:
+    """
+    Douglas-Peucker simplification: drop points closer than tolerance_m to the line
+    between the points kept around them. Endpoints are always kept.
+    """
+    if len(points) < 3 or tolerance_m <= 0:
+        return list(points)
+
+    # Project onto a local equirectangular plane in meters; accurate at route scale
+    cos_lat = math.cos(math.radians(sum(p[0] for p in points) / len(points)))
+    xy = [(math.radians(lng) * cos_lat * EARTH_RADIUS_M, math.radians(lat) * EARTH_RADIUS_M) for lat, lng in points]
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = xy[first]
+        bx, by = xy[last]
+        dx, dy = bx - ax, by - ay
+        segment_sq = dx * dx + dy * dy
+        max_dist, max_index = 0.0, None
+        for i in range(first + 1, last):
+            px, py = xy[i]
+            if segment_sq == 0:
+                dist = math.hypot(px - ax, py - ay)
+            else:
+                t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / segment_sq))
+                dist = math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+            if dist > max_dist:
+                max_dist, max_index = dist, i
+        if max_index is not None and max_dist > tolerance_m:
+            keep[max_index] = True
+            stack.append((first, max_index))
+            stack.append((max_index, last))
+
+    return [p for p, kept in zip(points, keep) if kept]
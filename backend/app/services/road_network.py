@@ -0,0 +1,426 @@
+import heapq
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.distance import haversine_km_pairs
+from app.services.spatial_index import SpatialIndex
+
+logger = get_logger(__name__)
+
+# Free-flow speeds (km/h) for drivable highway types when a way has no usable maxspeed tag
+DEFAULT_SPEEDS_KMH = {
+    "motorway": 100, "motorway_link": 60,
+    "trunk": 80, "trunk_link": 50,
+    "primary": 60, "primary_link": 45,
+    "secondary": 50, "secondary_link": 40,
+    "tertiary": 40, "tertiary_link": 35,
+    "unclassified": 30, "residential": 25, "road": 25,
+    "living_street": 10, "service": 15,
+}
+NO_ACCESS = {"no", "private"}
+# Speed for the straight-line stretch between a point and the road node it snaps to
+CONNECTOR_SPEED_KMH = 15.0
+# Nodes settled per witness search; a lower limit contracts faster but adds shortcuts
+WITNESS_SETTLE_LIMIT = 50
+# Bump when the cached graph layout changes so stale caches are rebuilt
+GRAPH_FORMAT_VERSION = 1
+
+_MAXSPEED_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(mph)?")
+
+def _is_drivable(tags: Dict[str, str]) -> bool:
+    if tags.get("highway") not in DEFAULT_SPEEDS_KMH or tags.get("area") == "yes":
+        return False
+    return tags.get("access") not in NO_ACCESS and tags.get("motor_vehicle") not in NO_ACCESS
+
+def _speed_kmh(tags: Dict[str, str]) -> float:
+    match = _MAXSPEED_RE.match(tags.get("maxspeed", ""))
+    if match:
+        speed = float(match.group(1)) * (1.609 if match.group(2) else 1.0)
+        if speed > 0:
+            return speed
+    return float(DEFAULT_SPEEDS_KMH[tags["highway"]])
+
+def _directions(tags: Dict[str, str]) -> Tuple[bool, bool]:
+    """(forward allowed, backward allowed) along the way's node order"""
+    oneway = tags.get("oneway", "")
+    if oneway in ("-1", "reverse"):
+        return False, True
+    if oneway in ("yes", "true", "1"):
+        return True, False
+    implied = tags.get("highway") == "motorway" or tags.get("junction") in ("roundabout", "circular")
+    return True, not implied or oneway == "no"
+
+def _read_osm_xml(path: Path):
+    nodes: Dict[int, Tuple[float, float]] = {}
+    ways = []
+    for _, element in ET.iterparse(path, events=("end",)):
+        if element.tag == "node":
+            nodes[int(element.get("id"))] = (float(element.get("lat")), float(element.get("lon")))
+            element.clear()
+        elif element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            if _is_drivable(tags):
+                ways.append(([int(nd.get("ref")) for nd in element.iter("nd")], tags))
+            element.clear()
+        elif element.tag == "relation":
+            element.clear()
+    return nodes, ways
+
+def _read_osm_pbf(path: Path):
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("Reading a .pbf extract requires osmium: pip install osmium (or convert it to .osm XML)")
+    nodes: Dict[int, Tuple[float, float]] = {}
+    ways = []
+
+    class WayHandler(osmium.SimpleHandler):
+        def way(self, way):
+            tags = {tag.k: tag.v for tag in way.tags}
+            if not _is_drivable(tags):
+                return
+            refs = []
+            for node in way.nodes:
+                if node.location.valid():
+                    nodes[node.ref] = (node.location.lat, node.location.lon)
+                    refs.append(node.ref)
+            ways.append((refs, tags))
+
+    WayHandler().apply_file(str(path), locations=True)
+    return nodes, ways
+
+def read_osm(path) -> Tuple[Dict[int, Tuple[float, float]], List[Tuple[List[int], Dict[str, str]]]]:
+    """Node coordinates and drivable ways ((node ids, tags)) from an .osm XML or .pbf extract"""
+    path = Path(path)
+    if path.suffix.lower() == ".pbf":
+        return _read_osm_pbf(path)
+    return _read_osm_xml(path)
+
+def _reachable(count, indptr, indices, source):
+    seen = np.zeros(count, dtype=bool)
+    seen[source] = True
+    stack = [source]
+    while stack:
+        node = stack.pop()
+        for neighbor in indices[indptr[node]:indptr[node + 1]]:
+            if not seen[neighbor]:
+                seen[neighbor] = True
+                stack.append(neighbor)
+    return seen
+
+def _csr(count, tails, heads, weights):
+    order = np.argsort(tails, kind="stable")
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tails, minlength=count), out=indptr[1:])
+    return indptr, heads[order], weights[order]
+
+def build_graph(nodes, ways):
+    """
+    Directed road graph from parsed OSM data as (coordinates (n, 2), tails, heads, seconds),
+    with parallel edges merged and only the largest strongly connected part kept, so every
+    node can reach every other
+    """
+    edges = []  # (tail osm id, head osm id, km/h)
+    for refs, tags in ways:
+        refs = [ref for ref in refs if ref in nodes]
+        forward, backward = _directions(tags)
+        speed = _speed_kmh(tags)
+        for a, b in zip(refs, refs[1:]):
+            if a == b:
+                continue
+            if forward:
+                edges.append((a, b, speed))
+            if backward:
+                edges.append((b, a, speed))
+    if not edges:
+        raise Exception("OSM extract contains no drivable roads")
+
+    tail_ids, head_ids, speeds = (np.array(column) for column in zip(*edges))
+    osm_ids, inverse = np.unique(np.concatenate((tail_ids, head_ids)).astype(np.int64), return_inverse=True)
+    tails, heads = inverse[:len(edges)], inverse[len(edges):]
+    coordinates = np.array([nodes[int(osm_id)] for osm_id in osm_ids], dtype=np.float64)
+    seconds = haversine_km_pairs(coordinates[tails], coordinates[heads]) / speeds * 3600
+
+    # Keep the cheapest of parallel edges
+    order = np.lexsort((seconds, heads, tails))
+    tails, heads, seconds = tails[order], heads[order], seconds[order]
+    first = np.ones(len(tails), dtype=bool)
+    first[1:] = (tails[1:] != tails[:-1]) | (heads[1:] != heads[:-1])
+    tails, heads, seconds = tails[first], heads[first], seconds[first]
+
+    # Strongly connected part around the best-connected node: reachable both ways from it
+    count = len(coordinates)
+    hub = int(np.argmax(np.bincount(tails, minlength=count) + np.bincount(heads, minlength=count)))
+    forward_ptr, forward_idx, _ = _csr(count, tails, heads, seconds)
+    backward_ptr, backward_idx, _ = _csr(count, heads, tails, seconds)
+    keep = _reachable(count, forward_ptr, forward_idx.tolist(), hub) & _reachable(count, backward_ptr, backward_idx.tolist(), hub)
+    renumber = np.cumsum(keep) - 1
+    kept_edges = keep[tails] & keep[heads]
+    logger.info(f"Road graph: {int(keep.sum())} of {count} nodes in the connected network, {int(kept_edges.sum())} edges")
+    return coordinates[keep], renumber[tails[kept_edges]], renumber[heads[kept_edges]], seconds[kept_edges]
+
+def contract(count, tails, heads, seconds):
+    """
+    Contraction hierarchy: nodes are contracted in order of edge difference (shortcuts added
+    minus edges removed, plus contracted neighbours), with lazily updated priorities and
+    shortcuts only where a bounded witness search finds no path that avoids the node.
+    Returns (rank, upward out-edges, upward in-edges) with the edge sets as CSR arrays
+    (indptr, indices, seconds); in-edge indices are the tails.
+    """
+    out_edges: List[Dict[int, float]] = [dict() for _ in range(count)]
+    in_edges: List[Dict[int, float]] = [dict() for _ in range(count)]
+    for tail, head, weight in zip(tails.tolist(), heads.tolist(), seconds.tolist()):
+        out_edges[tail][head] = weight
+        in_edges[head][tail] = weight
+    contracted_neighbors = [0] * count
+
+    def witness_distances(source, skipped, limit):
+        distances = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        while heap and settled < WITNESS_SETTLE_LIMIT:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            if distance > limit:
+                break
+            settled += 1
+            for neighbor, weight in out_edges[node].items():
+                candidate = distance + weight
+                if neighbor != skipped and candidate < distances.get(neighbor, float("inf")):
+                    distances[neighbor] = candidate
+                    heapq.heappush(heap, (candidate, neighbor))
+        return distances
+
+    def shortcuts(node):
+        outgoing = out_edges[node]
+        if not outgoing:
+            return []
+        longest_out = max(outgoing.values())
+        needed = []
+        for tail, weight_in in in_edges[node].items():
+            distances = witness_distances(tail, node, weight_in + longest_out)
+            for head, weight_out in outgoing.items():
+                via = weight_in + weight_out
+                if head != tail and distances.get(head, float("inf")) > via:
+                    needed.append((tail, head, via))
+        return needed
+
+    def priority(node, needed):
+        return len(needed) - len(in_edges[node]) - len(out_edges[node]) + contracted_neighbors[node]
+
+    heap = [(priority(node, shortcuts(node)), node) for node in range(count)]
+    heapq.heapify(heap)
+    rank = np.full(count, -1, dtype=np.int64)
+    up_out: List[Tuple[int, int, float]] = []
+    up_in: List[Tuple[int, int, float]] = []
+    next_rank = 0
+    while heap:
+        _, node = heapq.heappop(heap)
+        if rank[node] >= 0:
+            continue
+        needed = shortcuts(node)
+        updated = priority(node, needed)
+        if heap and updated > heap[0][0]:
+            heapq.heappush(heap, (updated, node))
+            continue
+
+        for tail, head, via in needed:
+            if via < out_edges[tail].get(head, float("inf")):
+                out_edges[tail][head] = via
+                in_edges[head][tail] = via
+        # Every remaining neighbour ranks higher, so the node's edges are upward edges
+        for head, weight in out_edges[node].items():
+            up_out.append((node, head, weight))
+            del in_edges[head][node]
+            contracted_neighbors[head] += 1
+        for tail, weight in in_edges[node].items():
+            up_in.append((node, tail, weight))
+            del out_edges[tail][node]
+            contracted_neighbors[tail] += 1
+        out_edges[node], in_edges[node] = {}, {}
+        rank[node] = next_rank
+        next_rank += 1
+
+    def to_csr(edges):
+        if not edges:
+            return np.zeros(count + 1, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        source, target, weight = (np.array(column) for column in zip(*edges))
+        return _csr(count, source.astype(np.int64), target.astype(np.int64), weight.astype(np.float64))
+
+    logger.info(f"Contracted {count} nodes: {len(up_out) + len(up_in)} upward edges for {len(tails)} road edges")
+    return rank, to_csr(up_out), to_csr(up_in)
+
+class RoadNetwork:
+    """
+    Offline road network with a contraction hierarchy for shortest travel times.
+    Many-to-many matrices use bucket queries: one upward search per target leaves
+    (target, seconds) entries at every node it settles, then one upward search per source
+    combines its distances with those entries. Points are snapped to the nearest road node.
+    """
+
+    def __init__(self, coordinates, rank, up_out, up_in):
+        self.coordinates = np.asarray(coordinates, dtype=np.float64)
+        self.rank = np.asarray(rank, dtype=np.int64)
+        self.up_out = tuple(np.asarray(a) for a in up_out)
+        self.up_in = tuple(np.asarray(a) for a in up_in)
+        # Plain lists are much faster than array indexing inside the searches
+        self._up_out = tuple(a.tolist() for a in self.up_out)
+        self._up_in = tuple(a.tolist() for a in self.up_in)
+        self._index = SpatialIndex(self.coordinates)
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    @classmethod
+    def from_extract(cls, path, cache_path=None):
+        """
+        Road network for an OSM extract. The contracted graph is cached next to the
+        extract (or at cache_path) and rebuilt when the extract changes. A cache that cannot
+        be written is logged; the built network is still returned.
+        """
+        path = Path(path)
+        cache_path = Path(cache_path) if cache_path else path.with_name(path.name + ".ch.npz")
+        source = os.stat(path)
+        signature = np.array([GRAPH_FORMAT_VERSION, source.st_size, int(source.st_mtime)], dtype=np.int64)
+        if cache_path.exists():
+            with np.load(cache_path) as cached:
+                if np.array_equal(cached["signature"], signature):
+                    logger.info(f"Loaded contracted road network from {cache_path}")
+                    return cls(cached["coordinates"], cached["rank"],
+                               (cached["out_indptr"], cached["out_indices"], cached["out_seconds"]),
+                               (cached["in_indptr"], cached["in_indices"], cached["in_seconds"]))
+            logger.info(f"Road network cache {cache_path} is stale; rebuilding")
+
+        coordinates, tails, heads, seconds = build_graph(*read_osm(path))
+        rank, up_out, up_in = contract(len(coordinates), tails, heads, seconds)
+        network = cls(coordinates, rank, up_out, up_in)
+        try:
+            np.savez_compressed(
+                cache_path, signature=signature, coordinates=coordinates, rank=rank,
+                out_indptr=up_out[0], out_indices=up_out[1], out_seconds=up_out[2],
+                in_indptr=up_in[0], in_indices=up_in[1], in_seconds=up_in[2]
+            )
+            logger.info(f"Saved contracted road network to {cache_path}")
+        except Exception as e:
+            logger.warning(f"Could not save contracted road network to {cache_path}: {str(e)}")
+        return network
+
+    @staticmethod
+    def _upward(source, graph):
+        indptr, indices, weights = graph
+        distances = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = []
+        while heap:
+            distance, node = heapq.heappop(heap)
+            if distance > distances[node]:
+                continue
+            settled.append((node, distance))
+            for k in range(indptr[node], indptr[node + 1]):
+                neighbor, candidate = indices[k], distance + weights[k]
+                if candidate < distances.get(neighbor, float("inf")):
+                    distances[neighbor] = candidate
+                    heapq.heappush(heap, (candidate, neighbor))
+        return settled
+
+    def snap(self, points) -> List[Tuple[int, float]]:
+        """(nearest road node, straight-line km to it) for each (lat, lng) point"""
+        return [self._index.knn(lat, lng, 1)[0] for lat, lng in np.asarray(points, dtype=np.float64).reshape(-1, 2).tolist()]
+
+    def node_matrix(self, sources, targets) -> np.ndarray:
+        """Shortest travel seconds between road nodes (inf where unreachable)"""
+        buckets: Dict[int, List[Tuple[int, float]]] = defaultdict(list)
+        for column, target in enumerate(targets):
+            for node, distance in self._upward(target, self._up_in):
+                buckets[node].append((column, distance))
+
+        matrix = np.full((len(sources), len(targets)), np.inf)
+        for row_index, source in enumerate(sources):
+            row = [float("inf")] * len(targets)
+            for node, distance in self._upward(source, self._up_out):
+                for column, remaining in buckets.get(node, ()):
+                    if distance + remaining < row[column]:
+                        row[column] = distance + remaining
+            matrix[row_index] = row
+        return matrix
+
+    def travel_matrix(self, points, max_snap_km: Optional[float] = None) -> np.ndarray:
+        """
+        Travel seconds between every pair of (lat, lng) points over the road network, including
+        the stretches to and from the snapped road nodes. Pairs with a point farther than
+        max_snap_km (OSM_MAX_SNAP_KM) from any road are inf; identical points are 0.
+        """
+        max_snap_km = max_snap_km if max_snap_km is not None else settings.OSM_MAX_SNAP_KM
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        snapped = self.snap(points)
+        nodes = sorted({node for node, _ in snapped})
+        column = {node: i for i, node in enumerate(nodes)}
+        between_nodes = self.node_matrix(nodes, nodes)
+
+        position = np.array([column[node] for node, _ in snapped], dtype=np.int64)
+        connector = np.array([km for _, km in snapped]) / CONNECTOR_SPEED_KMH * 3600
+        matrix = between_nodes[np.ix_(position, position)] + connector[:, np.newaxis] + connector[np.newaxis, :]
+        off_road = np.array([km > max_snap_km for _, km in snapped])
+        matrix[off_road, :] = np.inf
+        matrix[:, off_road] = np.inf
+        same_point = np.all(points[:, np.newaxis, :] == points[np.newaxis, :, :], axis=2)
+        matrix[same_point] = 0
+        return matrix
+
+_road_network = None
+_road_network_path = None
+_load_error: Optional[Exception] = None
+_load_lock = threading.Lock()
+
+def get_road_network() -> Optional[RoadNetwork]:
+    """
+    Return the road network for OSM_EXTRACT_PATH, loading (or building) it on first use.
+    A failed build is remembered and raised again for the same path, so requests do not
+    parse the extract over and over.
+    """
+    global _road_network, _road_network_path, _load_error
+    path = settings.OSM_EXTRACT_PATH
+    if not path:
+        return None
+    if _road_network_path != path:
+        with _load_lock:
+            if _road_network_path != path:
+                try:
+                    network, error = RoadNetwork.from_extract(path, settings.OSM_GRAPH_CACHE_PATH or None), None
+                except Exception as e:
+                    logger.error(f"Could not load road network from {path}: {str(e)}")
+                    network, error = None, e
+                # The path is set last: readers outside the lock check it first
+                _road_network, _load_error = network, error
+                _road_network_path = path
+    if _load_error is not None:
+        raise Exception(f"Road network for {path} is unavailable: {str(_load_error)}")
+    return _road_network
+
+def preload_road_network():
+    """Load (or build) the road network ahead of the first request when the osm provider is configured"""
+    if settings.TRAVEL_MATRIX_PROVIDER != "osm" or not settings.OSM_EXTRACT_PATH:
+        return
+    try:
+        get_road_network()
+    except Exception as e:
+        logger.warning(f"Road network preload failed; the osm provider will use estimates: {str(e)}")
+
+if __name__ == "__main__":
+    import argparse
+    from app.core.logging import setup_logging
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Build the contracted road network cache for an OSM extract")
+    parser.add_argument("extract", help="OSM extract (.osm, or .pbf with the osmium package)")
+    parser.add_argument("--cache-path", help="where to write the graph (default: next to the extract)")
+    args = parser.parse_args()
+    RoadNetwork.from_extract(args.extract, args.cache_path)
@@ -0,0 +1,60 @@
+import hashlib
+import json
+from typing import List, Optional
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services import polyline
+from app.services.geocode_cache import normalize_address
+from app.services.geocoding import geocode_addresses
+from app.services.google.routes_api import fetch_route_polyline
+from app.services.plan_cache import PlanCache
+
+logger = get_logger(__name__)
+
+# Full-resolution points per route and encoded polylines per (route, tolerance)
+route_geometry_cache = PlanCache(
+    ttl_seconds=settings.ROUTE_GEOMETRY_CACHE_TTL_SECONDS,
+    max_entries=settings.ROUTE_GEOMETRY_CACHE_MAX_ENTRIES
+)
+
+def route_geometry_key(addresses: List[str]) -> str:
+    encoded = json.dumps([normalize_address(a) for a in addresses], separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def _fetch_points(addresses: List[str]):
+    coordinates = geocode_addresses(addresses)
+    points = polyline.decode(fetch_route_polyline(coordinates))
+    logger.info(f"Fetched route geometry through {len(addresses)} stops: {len(points)} points")
+    return points
+
+def get_route_geometry(addresses: List[str], zoom: Optional[int] = None, tolerance_m: Optional[float] = None):
+    """
+    Encoded polyline of the driving route through addresses in order, simplified with
+    Douglas-Peucker to tolerance_m (or to ROUTE_GEOMETRY_TOLERANCE_PX at the given zoom).
+    The full-resolution route and each simplified variant are cached.
+    """
+    if len(addresses) < 2:
+        raise ValueError("At least two addresses are required")
+
+    key = route_geometry_key(addresses)
+    points = route_geometry_cache.get_or_compute(key, lambda: _fetch_points(addresses))
+
+    if tolerance_m is None:
+        if zoom is None:
+            tolerance_m = 0.0
+        else:
+            latitude = sum(p[0] for p in points) / len(points)
+            tolerance_m = polyline.tolerance_for_zoom(zoom, latitude, settings.ROUTE_GEOMETRY_TOLERANCE_PX)
+    tolerance_m = round(tolerance_m, 2)
+
+    def simplify():
+        simplified = polyline.simplify(points, tolerance_m)
+        return polyline.encode(simplified), len(simplified)
+
+    encoded, point_count = route_geometry_cache.get_or_compute(f"{key}:{tolerance_m}", simplify)
+    return {
+        "encoded_polyline": encoded,
+        "point_count": point_count,
+        "original_point_count": len(points),
+        "tolerance_meters": tolerance_m,
+    }
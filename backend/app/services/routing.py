@@ -1,65 +1,117 @@
+import asyncio
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from app.core.config import settings
 from app.core.logging import get_logger
-from app.services.geocoding import geocode_address
+from app.services.circuit_breaker import call_with_circuit_breaker, call_with_circuit_breaker_async
+from app.services.geocoding import geocode_addresses, geocode_addresses_async
 from app.services.google.route_optimization_api import optimize_route as route_optimization_api_optimize
+from app.services.google.route_optimization_api import optimize_route_async as route_optimization_api_optimize_async
 from app.services.google.routes_api import optimize_route as routes_api_optimize
+from app.services.google.routes_api import optimize_route_async as routes_api_optimize_async
+from app.services.exact_optimizer import optimize_route as exact_optimize
 from app.services.greedy_optimizer import optimize_route as greedy_optimize
-from app.schemas.route import RouteOptimizationParams, RoutePlanResponse
+from app.services.parallel_search import optimize_route as parallel_search_optimize
+from app.services.plan_store import plan_store
+from app.services.vrptw_optimizer import optimize_route as vrptw_optimize
+from app.schemas.route import PlanStreamEvent, RouteOptimizationParams, RoutePlanResponse
+from app.services.time_windows import schedule_cost
 
 logger = get_logger(__name__)
 
-def plan_optimized_route(houses, start_address, destination_address=None, global_start_time=None, global_end_time=None):
+# (name, optimize function, calls a remote provider) in order of preference
+OPTIMIZATION_METHODS = [
+    ("Exact Solver", exact_optimize, False),
+    ("Google Route Optimization API", route_optimization_api_optimize, True),
+    ("Google Routes API", routes_api_optimize, True),
+    ("Parallel Local Search", parallel_search_optimize, False),
+    ("Local VRPTW Solver", vrptw_optimize, False),
+    ("Greedy Algorithm", greedy_optimize, False),
+]
+
+# Non-blocking variants of the remote providers, used by the async request path
+ASYNC_REMOTE_METHODS = {
+    "Google Route Optimization API": route_optimization_api_optimize_async,
+    "Google Routes API": routes_api_optimize_async,
+}
+
+def _route_stop_addresses(houses, start_address, destination_address=None):
+    addresses = [start_address]
+    if destination_address:
+        addresses.append(destination_address)
+    addresses.extend(h.address for h in houses)
+    return addresses
+
+def _assemble_route_stops(houses, destination_address, coordinates):
+    start_lat, start_lng = coordinates[0]
+    start_location = {"lat": start_lat, "lng": start_lng}
+    logger.debug(f"Start location: lat={start_lat}, lng={start_lng}")
+
+    destination_location = None
+    if destination_address:
+        dest_lat, dest_lng = coordinates[1]
+        destination_location = {"lat": dest_lat, "lng": dest_lng}
+        logger.debug(f"Destination location: lat={dest_lat}, lng={dest_lng}")
+
+    house_coordinates = coordinates[2:] if destination_address else coordinates[1:]
+    locations = []
+    for i, (h, (lat, lng)) in enumerate(zip(houses, house_coordinates)):
+        locations.append({
+            "lat": lat,
+            "lng": lng,
+            "start_ts": int(h.start_time.timestamp()),
+            "end_ts": int(h.end_time.timestamp()),
+            "visit_duration_sec": h.duration_minutes * 60,
+            "original_index": i,  # Keep track of original order
+            "house_data": h  # Store the original house data
+        })
+        logger.debug(f"Geocoded location for {h.address}: lat={lat}, lng={lng}")
+
+    return start_location, destination_location, locations
+
+def geocode_route_stops(houses, start_address, destination_address=None):
+    """
+    Geocode the start, optional destination and every house in one concurrent stage.
+    Returns (start_location, destination_location, locations) where locations keep the
+    original house order.
+    """
+    addresses = _route_stop_addresses(houses, start_address, destination_address)
+    logger.info(f"Geocoding {len(addresses)} addresses (start, destination and houses)")
+    coordinates = geocode_addresses(addresses)
+    return _assemble_route_stops(houses, destination_address, coordinates)
+
+async def geocode_route_stops_async(houses, start_address, destination_address=None):
+    """Async geocode_route_stops"""
+    addresses = _route_stop_addresses(houses, start_address, destination_address)
+    logger.info(f"Geocoding {len(addresses)} addresses (start, destination and houses)")
+    coordinates = await geocode_addresses_async(addresses)
+    return _assemble_route_stops(houses, destination_address, coordinates)
+
+def plan_optimized_route(houses, start_address, destination_address=None, global_start_time=None, global_end_time=None, deadline_sec=None):
     """
     Plan optimized route using multiple fallback methods:
-    1. Google Route Optimization API (best, respects time windows)
-    2. Google Routes API (good, but doesn't respect time windows)
-    3. Greedy Algorithm (basic, doesn't respect time windows)
+    1. Exact Solver (optimal, respects time windows; small tours only)
+    2. Google Route Optimization API (best, respects time windows)
+    3. Google Routes API (good, but doesn't respect time windows)
+    4. Parallel Local Search (multi-core local VRPTW search; opt-in, larger tours only)
+    5. Local VRPTW Solver (no network, respects time windows)
+    6. Greedy Algorithm (basic, doesn't respect time windows)
+
+    With a deadline (deadline_sec or ROUTE_PLAN_DEADLINE_SEC) the methods run hedged
+    instead of strictly in sequence, see run_hedged_optimizers.
     """
     try:
         logger.info(f"Starting route optimization for {len(houses)} houses")
         
-        # Geocode start location
-        logger.info(f"Geocoding start address: {start_address}")
-        start_lat, start_lng = geocode_address(start_address)
-        start_location = {"lat": start_lat, "lng": start_lng}
-        logger.debug(f"Start location: lat={start_lat}, lng={start_lng}")
-        
-        # Geocode destination if provided
-        destination_location = None
-        if destination_address:
-            logger.info(f"Geocoding destination address: {destination_address}")
-            dest_lat, dest_lng = geocode_address(destination_address)
-            destination_location = {"lat": dest_lat, "lng": dest_lng}
-            logger.debug(f"Destination location: lat={dest_lat}, lng={dest_lng}")
-        
         # Validate input
         if not houses:
             raise Exception("No houses provided to plan route")
 
-        # Geocode intermediate locations
-        locations = []
-        for i, h in enumerate(houses):
-            logger.info(f"Geocoding address: {h.address}")
-            lat, lng = geocode_address(h.address)
-            locations.append({
-                "lat": lat,
-                "lng": lng,
-                "start_ts": int(h.start_time.timestamp()),
-                "end_ts": int(h.end_time.timestamp()),
-                "visit_duration_sec": h.duration_minutes * 60,
-                "original_index": i,  # Keep track of original order
-                "house_data": h  # Store the original house data
-            })
-            logger.debug(f"Geocoded location: lat={lat}, lng={lng}")
-
-        # Use the earliest start time across all houses as the global start timestamp
-        start_ts = min(int(h.start_time.timestamp()) for h in houses)
-
-        # Try optimization methods in order of preference
-        optimization_methods = [
-            ("Google Route Optimization API", route_optimization_api_optimize),
-            ("Google Routes API", routes_api_optimize),
-            ("Greedy Algorithm", greedy_optimize)
-        ]
+        # The latency budget covers the whole request, geocoding included
+        deadline_sec = deadline_sec or settings.ROUTE_PLAN_DEADLINE_SEC
+        deadline = time.monotonic() + deadline_sec if deadline_sec else None
+
+        start_location, destination_location, locations = geocode_route_stops(houses, start_address, destination_address)
 
         # Create optimization parameters object
         optimization_params = RouteOptimizationParams(
@@ -70,24 +122,379 @@ def plan_optimized_route(houses, start_address, destination_address=None, global
             global_end_time=global_end_time
         )
 
-        for method_name, optimize_func in optimization_methods:
-            try:
-                logger.info(f"Attempting route optimization with {method_name}")
-                route_plan = optimize_func(optimization_params)
+        if deadline_sec:
+            result = run_hedged_optimizers(optimization_params, deadline_sec, deadline=deadline)
+        else:
+            result = run_sequential_optimizers(optimization_params)
+        result.plan_id = plan_store.save(optimization_params, result)
+        return result
+
+    except Exception as e:
+        logger.error(f"Error in route optimization: {str(e)}", exc_info=True)
+        raise
+
+async def plan_optimized_route_async(houses, start_address, destination_address=None, global_start_time=None, global_end_time=None, deadline_sec=None):
+    """
+    Async plan_optimized_route: geocoding and Google calls use the non-blocking client and
+    CPU-bound local optimizers run in worker threads, so the event loop is never blocked.
+    """
+    try:
+        logger.info(f"Starting route optimization for {len(houses)} houses")
+
+        if not houses:
+            raise Exception("No houses provided to plan route")
+
+        deadline_sec = deadline_sec or settings.ROUTE_PLAN_DEADLINE_SEC
+        deadline = time.monotonic() + deadline_sec if deadline_sec else None
+
+        start_location, destination_location, locations = await geocode_route_stops_async(houses, start_address, destination_address)
+
+        optimization_params = RouteOptimizationParams(
+            locations=locations,
+            start_location=start_location,
+            destination_location=destination_location,
+            global_start_time=global_start_time,
+            global_end_time=global_end_time
+        )
+
+        if deadline_sec:
+            result = await run_hedged_optimizers_async(optimization_params, deadline_sec, deadline=deadline)
+        else:
+            result = await run_sequential_optimizers_async(optimization_params)
+        result.plan_id = await asyncio.to_thread(plan_store.save, optimization_params, result)
+        return result
+
+    except Exception as e:
+        logger.error(f"Error in route optimization: {str(e)}", exc_info=True)
+        raise
+
+def leading_local_methods():
+    """
+    Local methods preferred over every remote one (the exact solver). The hedged paths run
+    them before starting any remote call and skip the remote calls when one succeeds.
+    """
+    leading = []
+    for method in OPTIMIZATION_METHODS:
+        if method[2]:
+            break
+        leading.append(method)
+    return leading
+
+def run_optimization_method(method_name, optimize_func, is_remote, optimization_params, **kwargs):
+    """Run one optimization method; remote providers go through their circuit breaker"""
+    if is_remote:
+        return call_with_circuit_breaker(method_name, optimize_func, optimization_params, **kwargs)
+    return optimize_func(optimization_params, **kwargs)
+
+async def run_optimization_method_async(method_name, optimize_func, is_remote, optimization_params, **kwargs):
+    """
+    Async run_optimization_method. Remote providers use their coroutine variant when one
+    is registered in ASYNC_REMOTE_METHODS; everything else runs in a worker thread.
+    """
+    if is_remote:
+        async_func = ASYNC_REMOTE_METHODS.get(method_name)
+        if async_func:
+            return await call_with_circuit_breaker_async(method_name, async_func, optimization_params, **kwargs)
+        return await asyncio.to_thread(call_with_circuit_breaker, method_name, optimize_func, optimization_params, **kwargs)
+    return await asyncio.to_thread(optimize_func, optimization_params, **kwargs)
+
+def run_sequential_optimizers(optimization_params, method_kwargs=None):
+    """
+    Try optimization methods in order of preference and return the first successful plan.
+    method_kwargs maps a method name to extra keyword arguments for its optimize function.
+    """
+    method_kwargs = method_kwargs or {}
+    for method_name, optimize_func, is_remote in OPTIMIZATION_METHODS:
+        try:
+            logger.info(f"Attempting route optimization with {method_name}")
+            route_plan = run_optimization_method(method_name, optimize_func, is_remote, optimization_params, **method_kwargs.get(method_name, {}))
+            
+            if route_plan:
+                logger.info(f"Successfully created route plan using {method_name}")
+                return RoutePlanResponse(route=route_plan, optimization_method=method_name)
+            else:
+                logger.warning(f"{method_name} returned empty route plan")
                 
+        except Exception as e:
+            logger.warning(f"{method_name} failed: {str(e)}")
+            continue
+
+    # If all methods failed
+    raise Exception("All route optimization methods failed")
+
+def run_hedged_optimizers(optimization_params, deadline_sec, method_kwargs=None, deadline=None):
+    """
+    Run the optimization methods against a per-request latency budget.
+    Local methods run immediately, with their travel matrix lookups bounded by the deadline;
+    remote methods run in parallel with the remaining budget as their timeout. Returns the
+    most preferred plan available when the deadline passes, or as soon as no more preferred
+    method is still running. Leading local methods run first, see leading_local_methods.
+    deadline (a time.monotonic() value) lets callers start the budget earlier, e.g. at
+    request entry; it defaults to deadline_sec from now.
+    """
+    method_kwargs = method_kwargs or {}
+    deadline = deadline if deadline is not None else time.monotonic() + deadline_sec
+    rank = {name: i for i, (name, _func, _is_remote) in enumerate(OPTIMIZATION_METHODS)}
+    results = {}
+
+    leading = leading_local_methods()
+    for method_name, optimize_func, _is_remote in leading:
+        try:
+            route_plan = run_optimization_method(method_name, optimize_func, False, optimization_params,
+                                                 deadline=deadline, **method_kwargs.get(method_name, {}))
+            if route_plan:
+                logger.info(f"Successfully created route plan using {method_name}; remote methods not started")
+                return RoutePlanResponse(route=route_plan, optimization_method=method_name)
+        except Exception as e:
+            logger.warning(f"{method_name} failed: {str(e)}")
+
+    remote_methods = [(name, func) for name, func, is_remote in OPTIMIZATION_METHODS if is_remote]
+    executor = ThreadPoolExecutor(max_workers=max(1, len(remote_methods)), thread_name_prefix="optimizer")
+    futures = {}
+    try:
+        for method_name, optimize_func in remote_methods:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Skipping {method_name}: the {deadline_sec}s budget is already spent")
+                continue
+            logger.info(f"Starting {method_name} with {remaining:.1f}s budget")
+            future = executor.submit(run_optimization_method, method_name, optimize_func, True, optimization_params,
+                                     timeout_sec=remaining, **method_kwargs.get(method_name, {}))
+            futures[future] = method_name
+
+        for method_name, optimize_func, is_remote in OPTIMIZATION_METHODS[len(leading):]:
+            if is_remote:
+                continue
+            try:
+                route_plan = run_optimization_method(method_name, optimize_func, False, optimization_params,
+                                                     deadline=deadline, **method_kwargs.get(method_name, {}))
                 if route_plan:
-                    logger.info(f"Successfully created route plan using {method_name}")
-                    return RoutePlanResponse(route=route_plan, optimization_method=method_name)
-                else:
-                    logger.warning(f"{method_name} returned empty route plan")
-                    
+                    results[method_name] = route_plan
             except Exception as e:
                 logger.warning(f"{method_name} failed: {str(e)}")
+
+        pending = set(futures)
+        while pending:
+            # Stop waiting once nothing still running could beat the best result we hold
+            best_rank = min((rank[name] for name in results), default=len(rank))
+            if all(rank[futures[f]] > best_rank for f in pending):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Route planning deadline of {deadline_sec}s reached; still waiting on {[futures[f] for f in pending]}")
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                method_name = futures[future]
+                try:
+                    route_plan = future.result()
+                    if route_plan:
+                        results[method_name] = route_plan
+                    else:
+                        logger.warning(f"{method_name} returned empty route plan")
+                except Exception as e:
+                    logger.warning(f"{method_name} failed: {str(e)}")
+    finally:
+        # Stragglers are bounded by their own timeouts; do not block the response on them
+        executor.shutdown(wait=False)
+
+    if not results:
+        raise Exception("All route optimization methods failed")
+
+    method_name = min(results, key=lambda name: rank[name])
+    logger.info(f"Successfully created route plan using {method_name} within {deadline_sec}s budget")
+    return RoutePlanResponse(route=results[method_name], optimization_method=method_name)
+
+async def run_sequential_optimizers_async(optimization_params):
+    """Async run_sequential_optimizers"""
+    for method_name, optimize_func, is_remote in OPTIMIZATION_METHODS:
+        try:
+            logger.info(f"Attempting route optimization with {method_name}")
+            route_plan = await run_optimization_method_async(method_name, optimize_func, is_remote, optimization_params)
+
+            if route_plan:
+                logger.info(f"Successfully created route plan using {method_name}")
+                return RoutePlanResponse(route=route_plan, optimization_method=method_name)
+            else:
+                logger.warning(f"{method_name} returned empty route plan")
+
+        except Exception as e:
+            logger.warning(f"{method_name} failed: {str(e)}")
+            continue
+
+    raise Exception("All route optimization methods failed")
+
+async def run_hedged_optimizers_async(optimization_params, deadline_sec, deadline=None):
+    """
+    Async run_hedged_optimizers. Remote calls are tasks on the event loop and are
+    cancelled once the deadline passes or a more preferred result is in hand.
+    """
+    deadline = deadline if deadline is not None else time.monotonic() + deadline_sec
+    rank = {name: i for i, (name, _func, _is_remote) in enumerate(OPTIMIZATION_METHODS)}
+    results = {}
+
+    leading = leading_local_methods()
+    for method_name, optimize_func, _is_remote in leading:
+        try:
+            route_plan = await run_optimization_method_async(method_name, optimize_func, False, optimization_params, deadline=deadline)
+            if route_plan:
+                logger.info(f"Successfully created route plan using {method_name}; remote methods not started")
+                return RoutePlanResponse(route=route_plan, optimization_method=method_name)
+        except Exception as e:
+            logger.warning(f"{method_name} failed: {str(e)}")
+
+    tasks = {}
+    for method_name, optimize_func, is_remote in OPTIMIZATION_METHODS:
+        if is_remote:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Skipping {method_name}: the {deadline_sec}s budget is already spent")
+                continue
+            logger.info(f"Starting {method_name} with {remaining:.1f}s budget")
+            task = asyncio.create_task(run_optimization_method_async(method_name, optimize_func, True, optimization_params, timeout_sec=remaining))
+            tasks[task] = method_name
+
+    try:
+        for method_name, optimize_func, is_remote in OPTIMIZATION_METHODS[len(leading):]:
+            if is_remote:
                 continue
+            try:
+                route_plan = await run_optimization_method_async(method_name, optimize_func, False, optimization_params, deadline=deadline)
+                if route_plan:
+                    results[method_name] = route_plan
+            except Exception as e:
+                logger.warning(f"{method_name} failed: {str(e)}")
+
+        pending = set(tasks)
+        while pending:
+            best_rank = min((rank[name] for name in results), default=len(rank))
+            if all(rank[tasks[t]] > best_rank for t in pending):
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Route planning deadline of {deadline_sec}s reached; cancelling {[tasks[t] for t in pending]}")
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                method_name = tasks[task]
+                try:
+                    route_plan = task.result()
+                    if route_plan:
+                        results[method_name] = route_plan
+                    else:
+                        logger.warning(f"{method_name} returned empty route plan")
+                except Exception as e:
+                    logger.warning(f"{method_name} failed: {str(e)}")
+    finally:
+        for task in tasks:
+            task.cancel()
 
-        # If all methods failed
+    if not results:
         raise Exception("All route optimization methods failed")
 
+    method_name = min(results, key=lambda name: rank[name])
+    logger.info(f"Successfully created route plan using {method_name} within {deadline_sec}s budget")
+    return RoutePlanResponse(route=results[method_name], optimization_method=method_name)
+
+async def stream_optimized_route_async(houses, start_address, destination_address=None, global_start_time=None, global_end_time=None, deadline_sec=None):
+    """
+    Progressive planning: yields PlanStreamEvent objects as the plan improves.
+    Local methods are emitted first (milliseconds); remote providers run concurrently
+    and each result is emitted when its schedule cost beats the best one sent so far.
+    Ends with a "done" event naming the best method, or an "error" event. A plan from a
+    leading local method (see leading_local_methods) is final; no remote provider is called.
+    """
+    deadline_sec = deadline_sec or settings.ROUTE_PLAN_DEADLINE_SEC
+    deadline = time.monotonic() + deadline_sec if deadline_sec else None
+    try:
+        if not houses:
+            raise Exception("No houses provided to plan route")
+
+        start_location, destination_location, locations = await geocode_route_stops_async(houses, start_address, destination_address)
+        optimization_params = RouteOptimizationParams(
+            locations=locations,
+            start_location=start_location,
+            destination_location=destination_location,
+            global_start_time=global_start_time,
+            global_end_time=global_end_time
+        )
     except Exception as e:
-        logger.error(f"Error in route optimization: {str(e)}", exc_info=True)
-        raise
\ No newline at end of file
+        logger.error(f"Error preparing streamed route plan: {str(e)}", exc_info=True)
+        yield PlanStreamEvent(event="error", detail=str(e))
+        return
+
+    start_ts = int(global_start_time.timestamp())
+    rank = {name: i for i, (name, _func, _is_remote) in enumerate(OPTIMIZATION_METHODS)}
+    best = None  # (cost, rank, method_name)
+
+    def improves(method_name, cost):
+        return best is None or (cost, rank[method_name]) < best[:2]
+
+    leading = leading_local_methods()
+    for method_name, optimize_func, _is_remote in leading:
+        try:
+            route_plan = await run_optimization_method_async(method_name, optimize_func, False, optimization_params, deadline=deadline)
+        except Exception as e:
+            logger.warning(f"{method_name} failed: {str(e)}")
+            continue
+        if route_plan:
+            cost = schedule_cost(route_plan, start_ts, len(locations))
+            yield PlanStreamEvent(event="plan", optimization_method=method_name, cost=cost, route=route_plan)
+            yield PlanStreamEvent(event="done", optimization_method=method_name, cost=cost)
+            return
+
+    tasks = {}
+    for method_name, optimize_func, is_remote in OPTIMIZATION_METHODS:
+        if is_remote:
+            kwargs = {}
+            if deadline:
+                kwargs["timeout_sec"] = deadline - time.monotonic()
+                if kwargs["timeout_sec"] <= 0:
+                    continue
+            task = asyncio.create_task(run_optimization_method_async(method_name, optimize_func, True, optimization_params, **kwargs))
+            tasks[task] = method_name
+
+    try:
+        for method_name, optimize_func, is_remote in OPTIMIZATION_METHODS[len(leading):]:
+            if is_remote:
+                continue
+            try:
+                route_plan = await run_optimization_method_async(method_name, optimize_func, False, optimization_params, deadline=deadline)
+            except Exception as e:
+                logger.warning(f"{method_name} failed: {str(e)}")
+                continue
+            cost = schedule_cost(route_plan, start_ts, len(locations))
+            if route_plan and improves(method_name, cost):
+                best = (cost, rank[method_name], method_name)
+                yield PlanStreamEvent(event="plan", optimization_method=method_name, cost=cost, route=route_plan)
+
+        pending = set(tasks)
+        while pending:
+            timeout = None
+            if deadline:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    logger.warning(f"Streaming deadline of {deadline_sec}s reached; cancelling {[tasks[t] for t in pending]}")
+                    break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                method_name = tasks[task]
+                try:
+                    route_plan = task.result()
+                except Exception as e:
+                    logger.warning(f"{method_name} failed: {str(e)}")
+                    continue
+                if not route_plan:
+                    continue
+                cost = schedule_cost(route_plan, start_ts, len(locations))
+                if improves(method_name, cost):
+                    best = (cost, rank[method_name], method_name)
+                    yield PlanStreamEvent(event="plan", optimization_method=method_name, cost=cost, route=route_plan)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if best is None:
+        yield PlanStreamEvent(event="error", detail="All route optimization methods failed")
+    else:
+        yield PlanStreamEvent(event="done", optimization_method=best[2], cost=best[0])
@@ -0,0 +1,156 @@
+import heapq
+import math
+from typing import Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+from app.services.distance import EARTH_RADIUS_KM
+
+# Points per leaf bucket; small buckets prune better, large ones cut Python overhead
+LEAF_SIZE = 16
+
+def to_unit_vectors(coordinates) -> np.ndarray:
+    """(lat, lng) degrees -> (x, y, z) on the unit sphere, where chord length orders like great-circle distance"""
+    coordinates = np.radians(np.asarray(coordinates, dtype=np.float64).reshape(-1, 2))
+    lat, lng = coordinates[:, 0], coordinates[:, 1]
+    return np.column_stack((np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)))
+
+def chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+def km_to_chord(distance_km: float) -> float:
+    return 2 * math.sin(min(math.pi, distance_km / EARTH_RADIUS_KM) / 2)
+
+class SpatialIndex:
+    """
+    KD-tree over points on the unit sphere with k-nearest-neighbour and radius queries.
+    Points can be removed; removed points are skipped and subtrees without live points
+    are pruned, so queries stay sublinear as a route consumes its stops.
+    """
+
+    def __init__(self, coordinates: Sequence[Tuple[float, float]], ids: Optional[Sequence[Hashable]] = None):
+        self.points = to_unit_vectors(coordinates) if len(coordinates) else np.zeros((0, 3))
+        self.ids = list(ids) if ids is not None else list(range(len(self.points)))
+        self._position = {item_id: i for i, item_id in enumerate(self.ids)}
+        self._alive = np.ones(len(self.points), dtype=bool)
+        self._live_count = len(self.points)
+
+        # Node arrays: children (-1 for leaves), leaf ranges into self._order, bounding boxes,
+        # live point counts and parents (for updating counts on removal)
+        self._order = np.arange(len(self.points))
+        self._left: List[int] = []
+        self._right: List[int] = []
+        self._start: List[int] = []
+        self._end: List[int] = []
+        self._low: List[np.ndarray] = []
+        self._high: List[np.ndarray] = []
+        self._count: List[int] = []
+        self._parent: List[int] = []
+        self._leaf_of = np.zeros(len(self.points), dtype=np.int64)
+        if len(self.points):
+            self._build()
+
+    def _build(self):
+        stack = [(0, len(self.points), -1, None)]
+        while stack:
+            start, end, parent, side = stack.pop()
+            node = len(self._left)
+            members = self._order[start:end]
+            box = self.points[members]
+            self._left.append(-1)
+            self._right.append(-1)
+            self._start.append(start)
+            self._end.append(end)
+            self._low.append(box.min(axis=0))
+            self._high.append(box.max(axis=0))
+            self._count.append(end - start)
+            self._parent.append(parent)
+            if side == "left":
+                self._left[parent] = node
+            elif side == "right":
+                self._right[parent] = node
+
+            if end - start <= LEAF_SIZE:
+                self._leaf_of[members] = node
+                continue
+            axis = int(np.argmax(self._high[node] - self._low[node]))
+            middle = (end - start) // 2
+            self._order[start:end] = members[np.argpartition(box[:, axis], middle)]
+            stack.append((start, start + middle, node, "left"))
+            stack.append((start + middle, end, node, "right"))
+
+    def __len__(self):
+        return self._live_count
+
+    def __contains__(self, item_id):
+        position = self._position.get(item_id)
+        return position is not None and bool(self._alive[position])
+
+    def remove(self, item_id):
+        """Remove a point; later queries no longer return it"""
+        position = self._position[item_id]
+        if not self._alive[position]:
+            return
+        self._alive[position] = False
+        self._live_count -= 1
+        node = int(self._leaf_of[position])
+        while node != -1:
+            self._count[node] -= 1
+            node = self._parent[node]
+
+    def _box_distance_sq(self, node, target):
+        gap = np.maximum(np.maximum(self._low[node] - target, target - self._high[node]), 0.0)
+        return float(gap @ gap)
+
+    def knn(self, lat: float, lng: float, k: int = 1) -> List[Tuple[Hashable, float]]:
+        """The k live points closest to (lat, lng) as (id, great-circle km), nearest first"""
+        if k <= 0 or not self._live_count:
+            return []
+        target = to_unit_vectors([(lat, lng)])[0]
+        best: List[Tuple[float, int]] = []  # max-heap of (-distance², position)
+        frontier = [(0.0, 0)]
+        while frontier:
+            box_distance, node = heapq.heappop(frontier)
+            if len(best) == k and box_distance > -best[0][0]:
+                break
+            if self._count[node] == 0:
+                continue
+            if self._left[node] == -1:
+                members = self._order[self._start[node]:self._end[node]]
+                members = members[self._alive[members]]
+                distances = ((self.points[members] - target) ** 2).sum(axis=1)
+                for distance, position in zip(distances.tolist(), members.tolist()):
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, position))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, position))
+                continue
+            for child in (self._left[node], self._right[node]):
+                if self._count[child]:
+                    heapq.heappush(frontier, (self._box_distance_sq(child, target), child))
+        return [(self.ids[position], chord_to_km(math.sqrt(-distance))) for distance, position in sorted(best, reverse=True)]
+
+    def nearest(self, lat: float, lng: float) -> Optional[Hashable]:
+        """Id of the closest live point, or None if the index is empty"""
+        found = self.knn(lat, lng, 1)
+        return found[0][0] if found else None
+
+    def radius(self, lat: float, lng: float, radius_km: float) -> List[Tuple[Hashable, float]]:
+        """Live points within radius_km of (lat, lng) as (id, great-circle km), nearest first"""
+        if not self._live_count:
+            return []
+        target = to_unit_vectors([(lat, lng)])[0]
+        limit = km_to_chord(radius_km) ** 2
+        found = []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._count[node] == 0 or self._box_distance_sq(node, target) > limit:
+                continue
+            if self._left[node] == -1:
+                members = self._order[self._start[node]:self._end[node]]
+                members = members[self._alive[members]]
+                distances = ((self.points[members] - target) ** 2).sum(axis=1)
+                inside = distances <= limit
+                found.extend(zip(distances[inside].tolist(), members[inside].tolist()))
+                continue
+            stack.extend((self._left[node], self._right[node]))
+        return [(self.ids[position], chord_to_km(math.sqrt(distance))) for distance, position in sorted(found)]
@@ -75,4 +75,17 @@ def compute_schedule_with_time_windows(route_plan: List[Dict], start_ts: int) ->
 
     return corrected_route
 
+# Seconds added to a schedule's cost for each time window violation or unvisited stop
+VIOLATION_PENALTY_SEC = 3600
 
+def schedule_cost(route_plan: List[Dict], start_ts: int, expected_stops: int = None) -> float:
+    """
+    Comparable cost of a computed schedule: seconds from start_ts until the last departure,
+    plus VIOLATION_PENALTY_SEC per time window violation and per stop missing from the route.
+    """
+    if not route_plan:
+        return float("inf")
+    finish_ts = max(int(stop["departure_time"].timestamp()) for stop in route_plan)
+    violations = sum(1 for stop in route_plan if stop.get("time_window_violation"))
+    missing = max(0, (expected_stops or len(route_plan)) - len(route_plan))
+    return float(finish_ts - start_ts + VIOLATION_PENALTY_SEC * (violations + missing))
@@ -0,0 +1,252 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import func
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db.models import TravelLegCacheEntry
+from app.db.session import SessionLocal, init_db
+from app.services.circuit_breaker import call_with_circuit_breaker
+from app.services.google.route_matrix_api import fetch_route_matrix
+from app.services.road_network import get_road_network
+from app.services.travel_model import estimate_travel_matrix, observe_legs
+
+logger = get_logger(__name__)
+
+# Keys per IN (...) query, below SQLite's bound-parameter limit
+_QUERY_CHUNK = 500
+# Circuit breaker guarding computeRouteMatrix, so a failing provider is not retried on every matrix
+MATRIX_BREAKER = "Google Route Matrix API"
+
+def quantize_point(lat: float, lng: float) -> Tuple[float, float]:
+    decimals = settings.TRAVEL_MATRIX_COORD_DECIMALS
+    return round(lat, decimals), round(lng, decimals)
+
+def hour_bucket(departure_ts: Optional[float]) -> int:
+    """Hour of the week (UTC) so legs are reused across weeks for the same traffic pattern"""
+    if departure_ts is None:
+        return -1
+    return int(departure_ts // 3600) % (7 * 24)
+
+def leg_key(origin: Tuple[float, float], destination: Tuple[float, float], bucket: int) -> str:
+    return f"{origin[0]},{origin[1]}>{destination[0]},{destination[1]}@{bucket}"
+
+def haversine_travel_sec(origin: Tuple[float, float], destination: Tuple[float, float], departure_ts: Optional[float] = None) -> int:
+    """Travel estimate from straight-line distance (see travel_model), used when no provider result is available"""
+    return int(estimate_travel_matrix([origin, destination], departure_ts)[0, 1])
+
+class TravelLegCache:
+    """
+    Persistent cache of provider travel times backed by the app database.
+    Entries expire after ttl_seconds; past max_entries the oldest entries are evicted.
+    """
+
+    def __init__(self, session_factory=SessionLocal, ttl_seconds: Optional[int] = None, max_entries: Optional[int] = None):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.TRAVEL_LEG_CACHE_TTL_SECONDS
+        self.max_entries = max_entries if max_entries is not None else settings.TRAVEL_LEG_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _ensure_schema(self):
+        if not self._schema_ready:
+            with self._lock:
+                if not self._schema_ready:
+                    session = self.session_factory()
+                    try:
+                        init_db(bind=session.get_bind())
+                    finally:
+                        session.close()
+                    self._schema_ready = True
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, int]:
+        """Return {key: duration_sec} for the keys with a fresh entry"""
+        self._ensure_schema()
+        keys = list(dict.fromkeys(keys))
+        oldest = int(time.time()) - self.ttl_seconds
+        found = {}
+        session = self.session_factory()
+        try:
+            for i in range(0, len(keys), _QUERY_CHUNK):
+                rows = session.query(TravelLegCacheEntry.leg_key, TravelLegCacheEntry.duration_sec).filter(
+                    TravelLegCacheEntry.leg_key.in_(keys[i:i + _QUERY_CHUNK]),
+                    TravelLegCacheEntry.created_at >= oldest
+                )
+                found.update({key: duration for key, duration in rows})
+        finally:
+            session.close()
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, legs: Dict[str, Tuple[int, Optional[int]]]):
+        """Store {key: (duration_sec, distance_meters)} and evict the oldest entries over the size bound"""
+        if not legs:
+            return
+        self._ensure_schema()
+        now = int(time.time())
+        session = self.session_factory()
+        try:
+            for key, (duration_sec, distance_meters) in legs.items():
+                session.merge(TravelLegCacheEntry(
+                    leg_key=key,
+                    duration_sec=duration_sec,
+                    distance_meters=distance_meters,
+                    created_at=now
+                ))
+            session.commit()
+
+            overflow = session.query(func.count(TravelLegCacheEntry.leg_key)).scalar() - self.max_entries
+            if overflow > 0:
+                stale_keys = [
+                    row[0] for row in session.query(TravelLegCacheEntry.leg_key)
+                    .order_by(TravelLegCacheEntry.created_at.asc())
+                    .limit(overflow)
+                ]
+                session.query(TravelLegCacheEntry).filter(
+                    TravelLegCacheEntry.leg_key.in_(stale_keys)
+                ).delete(synchronize_session=False)
+                session.commit()
+                logger.debug(f"Evicted {len(stale_keys)} travel leg cache entries")
+        finally:
+            session.close()
+
+    def clear(self):
+        """Remove every entry and reset counters"""
+        self._ensure_schema()
+        session = self.session_factory()
+        try:
+            session.query(TravelLegCacheEntry).delete()
+            session.commit()
+        finally:
+            session.close()
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+travel_leg_cache = TravelLegCache()
+
+def _fetch_missing(points, missing_pairs, departure_ts, deadline=None):
+    """
+    Provider durations for missing (i, j) pairs through the MATRIX_BREAKER circuit breaker.
+    Origins missing the same destinations are fetched together as one rectangle, so legs
+    already cached are not requested again; origins missing every leg share one full-width
+    rectangle. Rectangles that fail, or that would start after deadline (a time.monotonic()
+    value), are left to the estimates.
+    """
+    missing_by_origin = defaultdict(list)
+    for i, j in missing_pairs:
+        missing_by_origin[i].append(j)
+    rectangles = defaultdict(list)
+    for i, destination_ids in missing_by_origin.items():
+        if len(destination_ids) == sum(1 for point in points if point != points[i]):
+            destination_ids = range(len(points))
+        rectangles[tuple(destination_ids)].append(i)
+
+    fetched = {}
+    for destination_ids, origin_ids in rectangles.items():
+        remaining = deadline - time.monotonic() if deadline is not None else None
+        if remaining is not None and remaining <= 0:
+            logger.warning("Travel matrix deadline reached; using haversine estimates for the remaining legs")
+            break
+        try:
+            legs = call_with_circuit_breaker(
+                MATRIX_BREAKER, fetch_route_matrix,
+                [points[i] for i in origin_ids], [points[j] for j in destination_ids], departure_ts,
+                timeout_sec=remaining
+            )
+        except Exception as e:
+            logger.warning(f"Travel matrix provider failed, using haversine estimates: {str(e)}")
+            continue
+        fetched.update({(origin_ids[o], destination_ids[d]): leg for (o, d), leg in legs.items()})
+    observe_legs((points[i], points[j], departure_ts, duration) for (i, j), (duration, _) in fetched.items())
+    return fetched
+
+def haversine_travel_matrix(points, departure_ts: Optional[float] = None) -> np.ndarray:
+    """Vectorized haversine_travel_sec between every pair of (lat, lng) points; 0 between identical points"""
+    return estimate_travel_matrix(points, departure_ts)
+
+def active_provider(provider: Optional[str] = None) -> str:
+    """The travel matrix provider that will actually be used for a request"""
+    provider = provider or settings.TRAVEL_MATRIX_PROVIDER
+    if provider == "google" and not settings.GOOGLE_MAPS_API_KEY:
+        return "haversine"
+    if provider == "osm" and not settings.OSM_EXTRACT_PATH:
+        return "haversine"
+    return provider
+
+def _road_network_matrix(points, matrix):
+    """Fill matrix with road network travel times where the network can route; estimates stay elsewhere"""
+    try:
+        routed = get_road_network().travel_matrix(points)
+    except Exception as e:
+        logger.warning(f"Road network unavailable, using haversine estimates: {str(e)}")
+        return matrix
+    reachable = np.isfinite(routed)
+    matrix[reachable] = np.rint(routed[reachable]).astype(np.int64)
+    logger.debug(f"Travel matrix {len(points)}x{len(points)}: {int(reachable.sum())} legs from the road network")
+    return matrix
+
+def get_travel_matrix(points: List[Dict[str, float]], departure_ts: Optional[float] = None, provider: Optional[str] = None,
+                      deadline: Optional[float] = None) -> np.ndarray:
+    """
+    Travel seconds between every pair of points ({"lat", "lng"} dicts) for a departure time,
+    as an (n, n) integer array. Legs are looked up in the persistent leg cache by quantized
+    coordinates and departure-hour bucket; missing legs are fetched in bulk from the matrix
+    provider and stored. With the "osm" provider legs come from the offline road network
+    (free-flow times, not cached). Without a GOOGLE_MAPS_API_KEY (or OSM_EXTRACT_PATH) the
+    haversine stand-in is used; legs a provider cannot time fall back to the haversine
+    estimate, which is not cached. Google is not asked for matrices of more than
+    TRAVEL_MATRIX_MAX_FETCH_POINTS points, nor while its circuit breaker is open, nor past
+    deadline (a time.monotonic() value, e.g. the request's planning deadline).
+    The haversine estimate is calibrated from fetched legs (see travel_model).
+    """
+    provider = active_provider(provider)
+    if provider not in ("google", "osm", "haversine"):
+        raise ValueError(f"Unknown travel matrix provider: {provider}")
+
+    quantized = [quantize_point(p["lat"], p["lng"]) for p in points]
+    matrix = haversine_travel_matrix(quantized, departure_ts)
+    if provider == "haversine":
+        return matrix
+    if provider == "osm":
+        return _road_network_matrix(quantized, matrix)
+
+    n = len(quantized)
+    if n > settings.TRAVEL_MATRIX_MAX_FETCH_POINTS:
+        logger.info(f"Travel matrix {n}x{n} is above TRAVEL_MATRIX_MAX_FETCH_POINTS; using haversine estimates")
+        return matrix
+    pairs = [(i, j) for i in range(n) for j in range(n) if quantized[i] != quantized[j]]
+    if not pairs:
+        return matrix
+    bucket = hour_bucket(departure_ts)
+    keys = {(i, j): leg_key(quantized[i], quantized[j], bucket) for i, j in pairs}
+    cached = travel_leg_cache.get_many(list(keys.values()))
+    missing = [pair for pair in pairs if keys[pair] not in cached]
+    fetched = _fetch_missing(quantized, missing, departure_ts, deadline) if missing else {}
+    travel_leg_cache.set_many({keys[pair]: leg for pair, leg in fetched.items() if pair in keys})
+    logger.debug(f"Travel matrix {n}x{n}: {len(pairs) - len(missing)} cached legs, {len(fetched)} fetched")
+
+    for (i, j), key in keys.items():
+        if key in cached:
+            matrix[i, j] = cached[key]
+        elif (i, j) in fetched:
+            matrix[i, j] = fetched[(i, j)][0]
+    return matrix
+
+def travel_time(origin: Dict[str, float], destination: Dict[str, float], departure_ts: Optional[float] = None) -> int:
+    """Travel seconds for a single leg (see get_travel_matrix)"""
+    return int(get_travel_matrix([origin, destination], departure_ts)[0, 1])
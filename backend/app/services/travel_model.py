@@ -0,0 +1,237 @@
+import math
+import queue
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.db.models import TravelModelStats
+from app.db.session import SessionLocal, init_db
+from app.services.distance import haversine_km, haversine_km_matrix
+
+logger = get_logger(__name__)
+
+# Uncalibrated model (the greedy optimizer's original estimate): 40 km/h, at least 5 minutes per leg
+DEFAULT_SPEED_KMH = 40.0
+MIN_LEG_SEC = 5 * 60
+# Observed legs outside these effective speeds (e.g. ferries, geocoding errors) are ignored
+MIN_OBSERVED_SPEED_KMH = 2.0
+MAX_OBSERVED_SPEED_KMH = 130.0
+MIN_OBSERVED_KM = 0.05
+# Keys for the all-regions and all-day fallback tables
+ALL_CELLS = "*"
+ALL_DAY = -1
+# Batches of observed legs waiting for the background recorder; more are dropped
+OBSERVATION_QUEUE_SIZE = 1000
+
+Leg = Tuple[Tuple[float, float], Tuple[float, float], Optional[float], float]
+
+def region_cell(lat: float, lng: float) -> str:
+    """Grid cell of TRAVEL_MODEL_CELL_DEGREES on each side containing a point"""
+    size = settings.TRAVEL_MODEL_CELL_DEGREES
+    return f"{math.floor(lat / size)}:{math.floor(lng / size)}"
+
+def time_bucket(departure_ts: Optional[float]) -> int:
+    """Time-of-day bucket (UTC) of TRAVEL_MODEL_BUCKET_HOURS; ALL_DAY without a departure time"""
+    if departure_ts is None:
+        return ALL_DAY
+    return int(departure_ts // 3600) % 24 // settings.TRAVEL_MODEL_BUCKET_HOURS
+
+def fit_leg_time(count, sum_km, sum_sec, sum_km_sq, sum_km_sec) -> Optional[Tuple[float, float]]:
+    """
+    Least-squares fit of seconds = intercept + seconds_per_km * km from running sums.
+    Falls back to a line through the origin when the intercept would be negative or the
+    distances are all alike. Returns None below TRAVEL_MODEL_MIN_OBSERVATIONS legs.
+    """
+    if count < settings.TRAVEL_MODEL_MIN_OBSERVATIONS or sum_km_sq <= 0:
+        return None
+    spread = count * sum_km_sq - sum_km * sum_km
+    intercept, pace = 0.0, sum_km_sec / sum_km_sq
+    if spread > 1e-9 * count * sum_km_sq:
+        slope = (count * sum_km_sec - sum_km * sum_sec) / spread
+        offset = (sum_sec - slope * sum_km) / count
+        if slope > 0 and offset >= 0:
+            intercept, pace = offset, slope
+    pace = min(max(pace, 3600 / MAX_OBSERVED_SPEED_KMH), 3600 / MIN_OBSERVED_SPEED_KMH)
+    return intercept, pace
+
+class TravelTimeModel:
+    """
+    Travel-time estimate from straight-line distance, calibrated against leg durations
+    returned by Google. Running sums per (region cell, time-of-day bucket) are kept in the
+    app database and fitted into small lookup tables of (intercept sec, sec per km). A leg
+    uses the most specific table with enough observations: its origin cell and bucket, the
+    cell all day, all regions in the bucket, all regions all day, then the flat default.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        self._stats: Optional[Dict[Tuple[str, int], np.ndarray]] = None
+        self._tables: Dict[Tuple[str, int], Tuple[float, float]] = {}
+
+    def _load(self):
+        if self._stats is not None:
+            return
+        with self._lock:
+            if self._stats is not None:
+                return
+            session = self.session_factory()
+            try:
+                init_db(bind=session.get_bind())
+                rows = session.query(TravelModelStats).all()
+                stats = {
+                    (row.cell, row.bucket): np.array([row.count, row.sum_km, row.sum_sec, row.sum_km_sq, row.sum_km_sec])
+                    for row in rows
+                }
+            finally:
+                session.close()
+            self._tables = {}
+            for key, sums in stats.items():
+                fit = fit_leg_time(*sums)
+                if fit is not None:
+                    self._tables[key] = fit
+            self._stats = stats
+
+    def observe(self, legs: Iterable[Leg]) -> int:
+        """
+        Record observed legs as ((lat, lng) origin, (lat, lng) destination, departure ts or
+        None, duration sec) and refit the affected tables. Returns the number of legs used.
+        """
+        self._load()
+        batch: Dict[Tuple[str, int], np.ndarray] = defaultdict(lambda: np.zeros(5))
+        used = 0
+        for origin, destination, departure_ts, duration_sec in legs:
+            distance_km = haversine_km(origin[0], origin[1], destination[0], destination[1])
+            if distance_km < MIN_OBSERVED_KM or duration_sec <= 0:
+                continue
+            speed_kmh = distance_km / duration_sec * 3600
+            if not MIN_OBSERVED_SPEED_KMH <= speed_kmh <= MAX_OBSERVED_SPEED_KMH:
+                continue
+            sums = np.array([1.0, distance_km, duration_sec, distance_km ** 2, distance_km * duration_sec])
+            cell, bucket = region_cell(*origin), time_bucket(departure_ts)
+            for key in {(cell, bucket), (cell, ALL_DAY), (ALL_CELLS, bucket), (ALL_CELLS, ALL_DAY)}:
+                batch[key] += sums
+            used += 1
+        if not batch:
+            return 0
+
+        with self._lock:
+            session = self.session_factory()
+            try:
+                for (cell, bucket), sums in batch.items():
+                    row = session.get(TravelModelStats, (cell, bucket))
+                    if row is None:
+                        row = TravelModelStats(cell=cell, bucket=bucket, count=0, sum_km=0.0, sum_sec=0.0, sum_km_sq=0.0, sum_km_sec=0.0)
+                        session.add(row)
+                    row.count += int(sums[0])
+                    row.sum_km += float(sums[1])
+                    row.sum_sec += float(sums[2])
+                    row.sum_km_sq += float(sums[3])
+                    row.sum_km_sec += float(sums[4])
+                session.commit()
+            finally:
+                session.close()
+            for key, sums in batch.items():
+                self._stats[key] = self._stats.get(key, np.zeros(5)) + sums
+                fit = fit_leg_time(*self._stats[key])
+                if fit is not None:
+                    self._tables[key] = fit
+        logger.debug(f"Travel model observed {used} legs")
+        return used
+
+    def coefficients(self, cell: str, bucket: int) -> Optional[Tuple[float, float]]:
+        """(intercept sec, sec per km) for legs leaving cell in bucket, or None for the default model"""
+        self._load()
+        for key in ((cell, bucket), (cell, ALL_DAY), (ALL_CELLS, bucket), (ALL_CELLS, ALL_DAY)):
+            if key in self._tables:
+                return self._tables[key]
+        return None
+
+    def estimate_matrix(self, points, departure_ts: Optional[float] = None) -> np.ndarray:
+        """Estimated travel seconds between every pair of (lat, lng) points; 0 between identical points"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        distance_km = haversine_km_matrix(points)
+        intercept = np.zeros(len(points))
+        pace = np.full(len(points), 3600 / DEFAULT_SPEED_KMH)
+        floor = np.full(len(points), float(MIN_LEG_SEC))
+        if settings.TRAVEL_MODEL_ENABLED:
+            bucket = time_bucket(departure_ts)
+            by_cell: Dict[str, Optional[Tuple[float, float]]] = {}
+            for i, (lat, lng) in enumerate(points.tolist()):
+                cell = region_cell(lat, lng)
+                if cell not in by_cell:
+                    by_cell[cell] = self.coefficients(cell, bucket)
+                if by_cell[cell] is not None:
+                    intercept[i], pace[i] = by_cell[cell]
+                    floor[i] = 0.0
+        seconds = intercept[:, np.newaxis] + pace[:, np.newaxis] * distance_km
+        matrix = np.maximum(seconds, floor[:, np.newaxis]).astype(np.int64)
+        same_point = np.all(points[:, np.newaxis, :] == points[np.newaxis, :, :], axis=2)
+        matrix[same_point] = 0
+        return matrix
+
+    def clear(self):
+        """Forget every observation"""
+        with self._lock:
+            session = self.session_factory()
+            try:
+                init_db(bind=session.get_bind())
+                session.query(TravelModelStats).delete()
+                session.commit()
+            finally:
+                session.close()
+            self._stats, self._tables = {}, {}
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        self._load()
+        with self._lock:
+            overall = self._tables.get((ALL_CELLS, ALL_DAY))
+            return {
+                "observed_legs": int(self._stats.get((ALL_CELLS, ALL_DAY), np.zeros(5))[0]),
+                "fitted_tables": len(self._tables),
+                "overall_speed_kmh": round(3600 / overall[1], 1) if overall else None,
+                "overall_intercept_sec": round(overall[0], 1) if overall else None,
+            }
+
+travel_time_model = TravelTimeModel()
+
+_observations: "queue.Queue[list]" = queue.Queue(maxsize=OBSERVATION_QUEUE_SIZE)
+_recorder: Optional[threading.Thread] = None
+_recorder_lock = threading.Lock()
+
+def _record_observations():
+    while True:
+        legs = _observations.get()
+        try:
+            travel_time_model.observe(legs)
+        except Exception as e:
+            logger.warning(f"Could not record observed legs: {str(e)}")
+        finally:
+            _observations.task_done()
+
+def observe_legs(legs: Iterable[Leg]):
+    """
+    Queue observed provider legs for the travel model. They are recorded on a background
+    thread, so callers (the event loop included) never wait on the database; failures are
+    logged, never raised
+    """
+    global _recorder
+    if not settings.TRAVEL_MODEL_ENABLED:
+        return
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = threading.Thread(target=_record_observations, name="travel-model-recorder", daemon=True)
+            _recorder.start()
+    try:
+        _observations.put_nowait(list(legs))
+    except queue.Full:
+        logger.warning("Travel model observation queue is full; dropping observed legs")
+
+def flush_observations():
+    """Wait until every queued observation has been recorded"""
+    _observations.join()
+
+def estimate_travel_matrix(points, departure_ts: Optional[float] = None) -> np.ndarray:
+    return travel_time_model.estimate_matrix(points, departure_ts)
@@ -0,0 +1,275 @@
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+import numpy as np
+from app.core.config import settings
+from app.core.logging import get_logger
+from app.services.distance import haversine_km_matrix
+from app.services.spatial_index import SpatialIndex
+from app.services.time_windows import VIOLATION_PENALTY_SEC
+from app.services.travel_matrix import get_travel_matrix
+from app.schemas.route import RouteOptimizationParams
+
+logger = get_logger(__name__)
+
+# Longest segment moved by Or-opt; length 1 is the relocate move
+OR_OPT_MAX_SEGMENT = 3
+
+# The solver core works on plain arrays so it can run outside this process.
+# Node 0 is the start, nodes 1..n are stops and node n + 1 is the end; travel is an
+# (n + 2, n + 2) matrix of seconds; ready/due/service are per-node epoch seconds / seconds.
+# An optional distance matrix of the same shape (straight-line km) breaks ties between legs
+# that travel times cannot tell apart, e.g. short legs at the estimate's minimum leg time.
+
+def route_cost(order, travel, ready, due, service, start_ts):
+    """
+    Cost of visiting stops in order, waiting for windows that have not opened yet:
+    seconds until the end is reached, plus every second of lateness and
+    VIOLATION_PENALTY_SEC per late stop (or late return). Returns (cost, late stop count).
+    """
+    end = len(travel) - 1
+    current, previous, late, lateness = start_ts, 0, 0, 0
+    for node in order:
+        current += travel[previous][node]
+        if current < ready[node]:
+            current = ready[node]
+        if current > due[node]:
+            late += 1
+            lateness += current - due[node]
+        current += service[node]
+        previous = node
+    current += travel[previous][end]
+    if current > due[end]:
+        late += 1
+        lateness += current - due[end]
+    return current - start_ts + lateness + VIOLATION_PENALTY_SEC * late, late
+
+def cheapest_insertion(travel, ready, due, service, start_ts, route=None, distance=None):
+    """
+    Build a route by repeatedly inserting the unrouted stop whose cheapest time-window-feasible
+    position adds the least travel. When no stop fits anywhere without making a visit late,
+    the cheapest insertion regardless of windows is taken. A partial route can be given; the
+    stops missing from it are inserted. Equal travel is decided by the added distance.
+    More than LOCAL_SOLVER_INSERTION_MAX_STOPS missing stops are appended in nearest-neighbour
+    order instead, leaving the time windows to the local search.
+    """
+    travel = np.asarray(travel, dtype=np.float64)
+    ready = np.asarray(ready, dtype=np.float64)
+    due = np.asarray(due, dtype=np.float64)
+    service = np.asarray(service, dtype=np.float64)
+    distance = np.zeros_like(travel) if distance is None else np.asarray(distance, dtype=np.float64)
+    end = len(travel) - 1
+    route: List[int] = list(route or [])
+    routed = set(route)
+    unrouted = [stop for stop in range(1, end) if stop not in routed]
+    if len(unrouted) > settings.LOCAL_SOLVER_INSERTION_MAX_STOPS:
+        return route + nearest_neighbor_order(travel, unrouted, route[-1] if route else 0, distance)
+
+    while unrouted:
+        nodes = np.array(route, dtype=np.int64)
+        prev_nodes = np.concatenate(([0], nodes))
+        next_nodes = np.concatenate((nodes, [end]))
+
+        # Service start at each routed stop, and the latest start that keeps later stops on time
+        begin = np.empty(len(route))
+        current = start_ts
+        previous = 0
+        for k, node in enumerate(route):
+            current = max(current + travel[previous, node], ready[node])
+            begin[k] = current
+            current += service[node]
+            previous = node
+        latest = np.empty(len(route) + 1)
+        latest[-1] = due[end]
+        for k in range(len(route) - 1, -1, -1):
+            node = route[k]
+            latest[k] = min(due[node], latest[k + 1] - service[node] - travel[node, next_nodes[k + 1]])
+        prev_departure = np.concatenate(([start_ts], begin + service[nodes]))
+        next_ready = ready[next_nodes]
+        base_travel = travel[prev_nodes, next_nodes]
+        base_distance = distance[prev_nodes, next_nodes]
+
+        best = None  # (feasible, delta, detour, due, stop, position)
+        for stop in unrouted:
+            begin_stop = np.maximum(prev_departure + travel[prev_nodes, stop], ready[stop])
+            begin_next = np.maximum(begin_stop + service[stop] + travel[stop, next_nodes], next_ready)
+            feasible = (begin_stop <= due[stop]) & (begin_next <= latest)
+            delta = travel[prev_nodes, stop] + travel[stop, next_nodes] - base_travel
+            detour = distance[prev_nodes, stop] + distance[stop, next_nodes] - base_distance
+            late = 0 if feasible.any() else 1
+            allowed = feasible if not late else np.ones_like(feasible)
+            position = int(np.lexsort((detour, np.where(allowed, delta, np.inf)))[0])
+            candidate = (late, delta[position], detour[position], due[stop], stop, position)
+            if best is None or candidate < best:
+                best = candidate
+
+        _, _, _, _, stop, position = best
+        route.insert(position, stop)
+        unrouted.remove(stop)
+    return route
+
+def nearest_neighbor_order(travel, stops, start=0, distance=None):
+    """Stops in nearest-neighbour order by travel from start; equal travel is decided by distance"""
+    travel = np.asarray(travel, dtype=np.float64)
+    distance = np.zeros_like(travel) if distance is None else np.asarray(distance, dtype=np.float64)
+    remaining = list(stops)
+    order = []
+    current = start
+    while remaining:
+        pick = int(np.lexsort((distance[current, remaining], travel[current, remaining]))[0])
+        current = remaining.pop(pick)
+        order.append(current)
+    return order
+
+def _neighbor_lists(travel, count, distance=None):
+    """For each stop, the `count` stops closest in either direction; equal travel is decided by distance"""
+    end = len(travel) - 1
+    stops = np.asarray(travel, dtype=np.float64)[1:end, 1:end]
+    closeness = stops + stops.T
+    np.fill_diagonal(closeness, np.inf)
+    if distance is None:
+        order = np.argsort(closeness, axis=1, kind="stable")[:, :count] + 1
+    else:
+        km = np.asarray(distance, dtype=np.float64)[1:end, 1:end]
+        order = np.lexsort((km + km.T, closeness), axis=1)[:, :count] + 1
+    return {stop: [int(v) for v in order[stop - 1]] for stop in range(1, end)}
+
+def spatial_neighbor_lists(locations, count):
+    """_neighbor_lists by geographic distance from a spatial index, without sorting an n x n matrix"""
+    index = SpatialIndex([(loc["lat"], loc["lng"]) for loc in locations], ids=range(1, len(locations) + 1))
+    return {
+        stop: [neighbor for neighbor, _ in index.knn(loc["lat"], loc["lng"], count + 1) if neighbor != stop][:count]
+        for stop, loc in enumerate(locations, start=1)
+    }
+
+def candidate_neighbors(params: RouteOptimizationParams, travel):
+    """Neighbour lists for the local search: from a spatial index for large tours, else by travel time"""
+    if len(params.locations) >= settings.SPATIAL_INDEX_MIN_STOPS:
+        return spatial_neighbor_lists(params.locations, settings.LOCAL_SOLVER_NEIGHBORS)
+    return _neighbor_lists(travel, settings.LOCAL_SOLVER_NEIGHBORS, distance=node_distances(params))
+
+def improve_route(route, travel, ready, due, service, start_ts, max_iterations=None, time_limit_sec=None, neighbors=None):
+    """
+    Local search over 2-opt, Or-opt and relocate moves restricted to each stop's nearest
+    neighbours (by travel time unless neighbor lists are given), taking every improving move
+    until none is left, max_iterations moves were made or time_limit_sec has passed.
+    """
+    max_iterations = max_iterations if max_iterations is not None else settings.LOCAL_SOLVER_MAX_ITERATIONS
+    time_limit_sec = time_limit_sec if time_limit_sec is not None else settings.LOCAL_SOLVER_TIME_LIMIT_SEC
+    neighbors = neighbors or _neighbor_lists(travel, settings.LOCAL_SOLVER_NEIGHBORS)
+    travel = travel if isinstance(travel, list) else np.asarray(travel).tolist()
+    ready, due, service = list(ready), list(due), list(service)
+    deadline = time.monotonic() + time_limit_sec
+
+    def cost(order):
+        return route_cost(order, travel, ready, due, service, start_ts)[0]
+
+    route = list(route)
+    best = cost(route)
+    iterations = 0
+
+    def candidates():
+        position = {stop: i for i, stop in enumerate(route)}
+        # 2-opt: reverse the stretch that makes a stop and its neighbour adjacent
+        for i, stop in enumerate(route):
+            for neighbor in neighbors[stop]:
+                j = position[neighbor]
+                if j > i + 1:
+                    yield route[:i + 1] + route[i + 1:j + 1][::-1] + route[j + 1:]
+                elif j < i - 1:
+                    yield route[:j] + route[j:i][::-1] + route[i:]
+        # Or-opt / relocate: move a short segment next to a neighbour of its first stop
+        for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+            for i in range(len(route) - length + 1):
+                segment = route[i:i + length]
+                rest = route[:i] + route[i + length:]
+                for neighbor in neighbors[segment[0]]:
+                    if neighbor in segment:
+                        continue
+                    j = rest.index(neighbor)
+                    yield rest[:j] + segment + rest[j:]
+                    yield rest[:j + 1] + segment + rest[j + 1:]
+
+    improved = True
+    while improved and iterations < max_iterations:
+        improved = False
+        for candidate in candidates():
+            if time.monotonic() > deadline:
+                return route
+            candidate_cost = cost(candidate)
+            if candidate_cost < best:
+                route, best = candidate, candidate_cost
+                iterations += 1
+                improved = True
+                break
+    return route
+
+def solve(travel, ready, due, service, start_ts, max_iterations=None, time_limit_sec=None, initial_route=None, neighbors=None, distance=None):
+    """Cheapest insertion (unless an initial route is given) followed by local search; returns the stop order"""
+    route = initial_route or cheapest_insertion(travel, ready, due, service, start_ts, distance=distance)
+    return improve_route(route, travel, ready, due, service, start_ts,
+                         max_iterations=max_iterations, time_limit_sec=time_limit_sec, neighbors=neighbors)
+
+def build_problem(params: RouteOptimizationParams, deadline: Optional[float] = None):
+    """
+    Arrays for the solver core from optimization params: (travel, ready, due, service, start_ts).
+    deadline (a time.monotonic() value) bounds any provider calls for the travel matrix.
+    """
+    start_ts = int(params.global_start_time.timestamp())
+    end_ts = int(params.global_end_time.timestamp())
+    end_location = params.destination_location or params.start_location
+    points = [params.start_location] + params.locations + [end_location]
+    travel = get_travel_matrix(points, departure_ts=start_ts, deadline=deadline)
+
+    ready = [start_ts] + [max(loc["start_ts"], start_ts) for loc in params.locations] + [start_ts]
+    due = [end_ts] + [min(loc["end_ts"], end_ts) for loc in params.locations] + [end_ts]
+    service = [0] + [loc["visit_duration_sec"] for loc in params.locations] + [0]
+    return travel, ready, due, service, start_ts
+
+def node_distances(params: RouteOptimizationParams) -> np.ndarray:
+    """Straight-line km between the solver nodes of build_problem (start, stops, end)"""
+    end_location = params.destination_location or params.start_location
+    points = [params.start_location] + params.locations + [end_location]
+    return haversine_km_matrix([(p["lat"], p["lng"]) for p in points])
+
+def schedule_route(order, params: RouteOptimizationParams, travel, ready, due, service, start_ts):
+    """Route plan entries for a stop order; arrival_time is when the visit starts after any wait"""
+    route_plan = []
+    current, previous = start_ts, 0
+    for i, node in enumerate(order):
+        current = max(current + int(travel[previous][node]), ready[node])
+        location = params.locations[node - 1]
+        route_plan.append({
+            "address": location["house_data"].address,
+            "arrival_time": datetime.fromtimestamp(current, timezone.utc),
+            "departure_time": datetime.fromtimestamp(current + service[node], timezone.utc),
+            "original_order": location["original_index"],
+            "optimized_order": i,
+            "time_window_violation": current > due[node],
+        })
+        current += service[node]
+        previous = node
+    return route_plan
+
+def optimize_route(params: RouteOptimizationParams, time_limit_sec: Optional[float] = None, deadline: Optional[float] = None):
+    """
+    Optimize route locally with time windows: cheapest feasible insertion followed by
+    2-opt / Or-opt / relocate local search. Returns optimized route plan
+    """
+    try:
+        if not params.locations:
+            return []
+        started = time.perf_counter()
+        travel, ready, due, service, start_ts = build_problem(params, deadline)
+        neighbors = candidate_neighbors(params, travel)
+        order = solve(travel, ready, due, service, start_ts, time_limit_sec=time_limit_sec,
+                      neighbors=neighbors, distance=node_distances(params))
+        route_plan = schedule_route(order, params, travel, ready, due, service, start_ts)
+
+        late = sum(1 for stop in route_plan if stop["time_window_violation"])
+        logger.info(f"Local VRPTW solver planned {len(order)} stops in {(time.perf_counter() - started) * 1000:.0f}ms ({late} late)")
+        return route_plan
+
+    except Exception as e:
+        logger.error(f"Local VRPTW solver failed: {str(e)}")
+        raise
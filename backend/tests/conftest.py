@@ -0,0 +1,69 @@
+"""
+Shared fixtures: tour builders used across test modules, and an empty travel model per
+test (it learns from every Google leg it sees) in a temporary database instead of the app database
+"""
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.schemas.route import HouseVisit, RouteOptimizationParams
+from app.services import travel_model
+
+START = datetime(2030, 6, 1, 9, 0, tzinfo=timezone.utc)
+
+def _location(i, house, lat, lng):
+    return {
+        "lat": lat,
+        "lng": lng,
+        "start_ts": int(house.start_time.timestamp()),
+        "end_ts": int(house.end_time.timestamp()),
+        "visit_duration_sec": house.duration_minutes * 60,
+        "original_index": i,
+        "house_data": house,
+    }
+
+def build_params(count=3):
+    locations = []
+    for i in range(count):
+        house = HouseVisit(address=f"{i + 1} Test St", start_time=START, end_time=START + timedelta(hours=8), duration_minutes=20)
+        locations.append(_location(i, house, 37.77 + 0.01 * i, -122.42 + 0.01 * i))
+    return RouteOptimizationParams(
+        locations=locations,
+        start_location={"lat": 37.76, "lng": -122.43},
+        global_start_time=START,
+        global_end_time=START + timedelta(hours=9),
+    )
+
+def build_random_params(count, seed=7, window_hours=2):
+    rng = random.Random(seed)
+    locations = []
+    for i in range(count):
+        opens = START + timedelta(minutes=rng.randrange(0, 6 * 60, 15))
+        house = HouseVisit(address=f"{i + 1} Test St", start_time=opens, end_time=opens + timedelta(hours=window_hours), duration_minutes=15)
+        locations.append(_location(i, house, 37.70 + rng.random() * 0.15, -122.50 + rng.random() * 0.15))
+    return RouteOptimizationParams(
+        locations=locations,
+        start_location={"lat": 37.77, "lng": -122.42},
+        global_start_time=START,
+        global_end_time=START + timedelta(hours=12),
+    )
+
+@pytest.fixture
+def make_params():
+    """Builder for small tours: count stops on a diagonal, all open 9:00-17:00"""
+    return build_params
+
+@pytest.fixture
+def make_random_params():
+    """Builder for seeded random tours across San Francisco with staggered windows"""
+    return build_random_params
+
+@pytest.fixture(autouse=True)
+def isolated_travel_model(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'travel_model.db'}", connect_args={"check_same_thread": False})
+    model = travel_model.TravelTimeModel(session_factory=sessionmaker(bind=engine))
+    monkeypatch.setattr(travel_model, "travel_time_model", model)
+    return model
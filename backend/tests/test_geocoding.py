@@ -0,0 +1,125 @@
+"""
+Tests for the persistent geocode cache, the offline gazetteer and the concurrent geocoding stage
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.services import geocoding
+from app.services.geocode_cache import GeocodeCache, normalize_address
+from app.services.local_geocoder import LocalGeocoder
+
+def make_cache(tmp_path, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'geocode.db'}")
+    return GeocodeCache(session_factory=sessionmaker(bind=engine), **kwargs)
+
+def test_normalize_address_variants_share_key():
+    key = normalize_address("123 Main St, San Francisco, CA")
+    assert normalize_address("  123  MAIN st,San Francisco , ca ") == key
+    assert normalize_address("123 Main St Apt 4B, San Francisco, CA") == key
+    assert normalize_address("123 Main St #12, San Francisco, CA") == key
+    assert normalize_address("123 Main St, Suite 200, San Francisco, CA") == key
+
+def test_normalize_address_keeps_street_names_starting_like_units():
+    keys = {
+        normalize_address(address) for address in (
+            "123 Steiner St, San Francisco, CA",
+            "123 Stevenson St, San Francisco, CA",
+            "123 Aptos St, San Francisco, CA",
+            "123 Unity Ave, San Francisco, CA",
+            "123 St, San Francisco, CA",
+        )
+    }
+    assert len(keys) == 5
+    assert normalize_address("12 Aptos St") == "12 aptos st"
+    assert normalize_address("50 Unity Ave, Oakland") == "50 unity ave oakland"
+    assert normalize_address("123 Steiner St Ste. 4, San Francisco") == "123 steiner st san francisco"
+
+def test_cache_hit_miss_counters(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get("123 Main St") is None
+    cache.set("123 Main St", 37.79, -122.39)
+    assert cache.get("123 MAIN ST") == (37.79, -122.39)
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+def test_cache_ttl_expiry(tmp_path):
+    cache = make_cache(tmp_path, ttl_seconds=-1)
+    cache.set("123 Main St", 37.79, -122.39)
+    assert cache.get("123 Main St") is None
+
+def test_cache_size_bounded_eviction(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.set("1 A St", 1.0, 1.0)
+    cache.set("2 B St", 2.0, 2.0)
+    cache.set("3 C St", 3.0, 3.0)
+    cached = [cache.get(a) for a in ("1 A St", "2 B St", "3 C St")]
+    assert sum(1 for c in cached if c is not None) == 2
+    assert cache.stats()["evictions"] == 1
+
+def test_geocode_addresses_keeps_order_and_dedupes(monkeypatch):
+    calls = []
+
+    def fake_geocode(address):
+        calls.append(address)
+        return float(len(address)), 0.0
+
+    monkeypatch.setattr(geocoding, "geocode_address", fake_geocode)
+    result = geocoding.geocode_addresses(["bb", "a", "bb", "ccc"])
+    assert result == [(2.0, 0.0), (1.0, 0.0), (2.0, 0.0), (3.0, 0.0)]
+    assert sorted(calls) == ["a", "bb", "ccc"]
+
+def test_geocode_addresses_reports_every_failure(monkeypatch):
+    def fake_geocode(address):
+        if address.startswith("bad"):
+            raise Exception("Geocoding failed: ZERO_RESULTS")
+        return 1.0, 1.0
+
+    monkeypatch.setattr(geocoding, "geocode_address", fake_geocode)
+    with pytest.raises(geocoding.GeocodingError) as exc_info:
+        geocoding.geocode_addresses(["good", "bad 1", "bad 2"])
+    assert set(exc_info.value.failures) == {"bad 1", "bad 2"}
+
+def write_gazetteer(tmp_path):
+    path = tmp_path / "gazetteer.csv"
+    path.write_text(
+        "address,lat,lng\n"
+        "\"123 Main St, San Francisco, CA 94105\",37.7901,-122.3960\n"
+        "\"456 Oak Ave, San Francisco, CA 94102\",37.7750,-122.4210\n"
+        "\"456 Oak Ave, Oakland, CA 94612\",37.8040,-122.2710\n"
+    )
+    return path
+
+def test_local_geocoder_lookups(tmp_path):
+    local = LocalGeocoder.from_file(write_gazetteer(tmp_path))
+    assert len(local) == 3
+    assert local.lookup("123 MAIN ST, San Francisco, CA 94105") == (37.7901, -122.3960)
+    # Token match tolerates a missing ZIP code
+    assert local.lookup("123 Main St Apt 2, San Francisco, CA") == (37.7901, -122.3960)
+    # Ambiguous without a city
+    assert local.lookup("456 Oak Ave") is None
+    assert local.lookup("789 Pine St, San Francisco, CA") is None
+    assert [m[0] for m in local.search_prefix("456 oak ave")] == [
+        "456 oak ave oakland ca 94612",
+        "456 oak ave san francisco ca 94102",
+    ]
+
+def test_geocode_address_prefers_local_gazetteer(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_GEOCODER_PATH", str(write_gazetteer(tmp_path)))
+    monkeypatch.setattr(settings, "GEOCODE_CACHE_ENABLED", False)
+
+    def no_network(address):
+        raise AssertionError("Google geocoder should not be called")
+
+    monkeypatch.setattr(geocoding, "fetch_geocode", no_network)
+    assert geocoding.geocode_address("456 Oak Ave, Oakland, CA") == (37.8040, -122.2710)
+
+def test_token_lookup_is_ambiguous_when_longer_entries_also_match(tmp_path):
+    path = tmp_path / "streets.csv"
+    path.write_text("address,lat,lng\nSt Main,37.0,-122.0\n1 Main St,37.1,-122.1\n2 Main St,37.2,-122.2\n")
+    local = LocalGeocoder.from_file(path)
+    # "main st" is not a key, and three entries contain both of its tokens
+    assert local.lookup("Main St") is None
+    assert local.lookup("1 Main St") == (37.1, -122.1)
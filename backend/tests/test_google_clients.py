@@ -0,0 +1,317 @@
+"""
+Tests for the Google API client plumbing (no network needed)
+"""
+import io
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import requests
+
+from app.core.config import settings
+from app.services.google import credentials, route_optimization_api, transport
+
+class FakeCredentials:
+    def __init__(self, lifetime_sec):
+        self.lifetime_sec = lifetime_sec
+        self.token = None
+        self.expiry = None
+        self.refreshes = 0
+
+    def refresh(self, request):
+        time.sleep(0.05)
+        self.refreshes += 1
+        self.token = f"token-{self.refreshes}"
+        self.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(seconds=self.lifetime_sec)
+
+def make_manager(monkeypatch, lifetime_sec=3600):
+    fake = FakeCredentials(lifetime_sec)
+    loads = []
+
+    def key_loader():
+        loads.append(1)
+        return {"type": "service_account"}
+
+    monkeypatch.setattr(credentials.service_account.Credentials, "from_service_account_info",
+                        lambda info, scopes: fake)
+    manager = credentials.CredentialsManager(key_loader=key_loader, refresh_margin_sec=300, background_refresh=False)
+    return manager, fake, loads
+
+def test_token_is_reused_and_refreshed_once_under_concurrency(monkeypatch):
+    manager, fake, loads = make_manager(monkeypatch)
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(manager.get_token())) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert tokens == ["token-1"] * 10
+    assert fake.refreshes == 1
+    assert len(loads) == 1
+    assert manager.get_token() == "token-1"
+
+def test_token_inside_refresh_margin_is_refreshed(monkeypatch):
+    manager, fake, _ = make_manager(monkeypatch, lifetime_sec=200)
+    assert manager.get_token() == "token-1"
+    assert manager.cached_token() is None  # expires within the 300s margin
+    assert manager.get_token() == "token-2"
+
+def test_failed_key_load_is_retried_after_backoff(monkeypatch):
+    fake = FakeCredentials(3600)
+    attempts = []
+
+    def flaky_loader():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("secret store unavailable")
+        return {"type": "service_account"}
+
+    monkeypatch.setattr(credentials.service_account.Credentials, "from_service_account_info",
+                        lambda info, scopes: fake)
+    manager = credentials.CredentialsManager(key_loader=flaky_loader, background_refresh=False)
+    assert manager.get_token() is None
+    assert manager.get_token() is None  # still backing off
+    assert len(attempts) == 1
+
+    manager._key_retry_at = 0.0
+    assert manager.get_token() == "token-1"
+    assert len(attempts) == 2
+
+def test_short_lived_token_does_not_rearm_background_refresh(monkeypatch):
+    manager, fake, _ = make_manager(monkeypatch, lifetime_sec=200)
+    manager.background_refresh = True
+    assert manager.get_token() == "token-1"
+    assert manager._timer is None
+    assert fake.refreshes == 1
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Minimal GCS + batchOptimizeTours stand-in: the operation finishes after two polls"""
+    objects = {}
+    operations = {}
+    poll_authorizations = []
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if url.path.startswith("/upload/storage/v1/b/"):
+            bucket = url.path.split("/")[5]
+            name = parse_qs(url.query)["name"][0]
+            self.objects[f"gs://{bucket}/{name}"] = json.loads(body)
+            return self._reply(200, {"name": name})
+        if url.path.endswith(":batchOptimizeTours"):
+            name = f"projects/test/operations/op-{len(self.operations)}"
+            self.operations[name] = {"polls": 0, "configs": json.loads(body)["modelConfigs"]}
+            return self._reply(200, {"name": name, "done": False})
+        self._reply(404, {})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith("/storage/v1/b/"):
+            parts = url.path.split("/")
+            uri = f"gs://{parts[4]}/{unquote(parts[6])}"
+            if uri in self.objects:
+                return self._reply(200, self.objects[uri])
+            return self._reply(404, {})
+        name = url.path[len("/v1/"):]
+        self.poll_authorizations.append(self.headers["Authorization"])
+        operation = self.operations[name]
+        operation["polls"] += 1
+        if operation["polls"] < 2:
+            return self._reply(200, {"name": name, "done": False})
+        for config in operation["configs"]:
+            model = self.objects[config["inputConfig"]["gcsSource"]["uri"]]["model"]
+            start = model["globalStartTime"]
+            # Visit shipments in reverse order so unpacking is observable
+            visits = [{"shipmentIndex": i, "startTime": start} for i in reversed(range(len(model["shipments"])))]
+            self.objects[config["outputConfig"]["gcsDestination"]["uri"]] = {"routes": [{"visits": visits}]}
+        self._reply(200, {"name": name, "done": True, "response": {}})
+
+def test_batch_optimize_routes_against_stand_in_server(monkeypatch, make_params):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    for name, value in {
+        "ROUTE_OPTIMIZATION_BASE_URL": base_url,
+        "GCS_BASE_URL": base_url,
+        "ROUTE_OPTIMIZATION_BATCH_GCS_BUCKET": "plans",
+        "ROUTE_OPTIMIZATION_BATCH_POLL_INITIAL_SEC": 0.01,
+        "GOOGLE_CLOUD_PROJECT_ID": "test",
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    try:
+        results = route_optimization_api.batch_optimize_routes([make_params(3), make_params(2)], auth_token="token")
+    finally:
+        server.shutdown()
+
+    assert [[stop["original_order"] for stop in plan] for plan in results] == [[2, 1, 0], [1, 0]]
+    assert len(StandInHandler.operations) == 1
+    assert all("parent" not in obj for uri, obj in StandInHandler.objects.items() if "input-" in uri)
+
+def test_batch_polls_use_a_fresh_token(monkeypatch, make_params):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    for name, value in {
+        "ROUTE_OPTIMIZATION_BASE_URL": base_url,
+        "GCS_BASE_URL": base_url,
+        "ROUTE_OPTIMIZATION_BATCH_GCS_BUCKET": "plans",
+        "ROUTE_OPTIMIZATION_BATCH_POLL_INITIAL_SEC": 0.01,
+        "GOOGLE_CLOUD_PROJECT_ID": "test",
+    }.items():
+        monkeypatch.setattr(settings, name, value)
+    tokens = iter(f"token-{i}" for i in range(100))
+    monkeypatch.setattr(route_optimization_api, "get_oauth_token", lambda: next(tokens))
+    StandInHandler.poll_authorizations.clear()
+    try:
+        results = route_optimization_api.batch_optimize_routes([make_params(2)])
+    finally:
+        server.shutdown()
+
+    assert [[stop["original_order"] for stop in plan] for plan in results] == [[1, 0]]
+    assert len(StandInHandler.poll_authorizations) == 2
+    assert len(set(StandInHandler.poll_authorizations)) == 2
+
+def test_payload_injects_local_route_and_shortens_solve_timeout(monkeypatch, make_params):
+    monkeypatch.setattr(settings, "ROUTE_OPTIMIZATION_WARM_START_FACTOR", 0.25)
+    params = make_params(10)
+    cold = route_optimization_api.build_payload(params)
+    warm = route_optimization_api.build_payload(params, initial_route=route_optimization_api.warm_start_route(params))
+
+    assert "injectedFirstSolutionRoutes" not in cold
+    visits = warm["injectedFirstSolutionRoutes"][0]["visits"]
+    assert sorted(v["shipmentIndex"] for v in visits) == list(range(10))
+    assert cold["timeout"] == "15s"
+    assert int(warm["timeout"][:-1]) < 15
+
+def test_solve_timeout_scales_with_size_warm_start_and_budget():
+    solve = route_optimization_api.solve_timeout_seconds
+    assert solve() == 60
+    assert solve(stop_count=5) < solve(stop_count=40)
+    assert solve(stop_count=40, warm_start_violations=0) < solve(stop_count=40, warm_start_violations=20) < solve(stop_count=40)
+    assert solve(timeout_sec=10, stop_count=200) == 8
+
+def test_partial_warm_start_is_ignored(make_params):
+    params = make_params(3)
+    partial = route_optimization_api.warm_start_route(params)[:2]
+    payload = route_optimization_api.build_payload(params, initial_route=partial)
+    assert "injectedFirstSolutionRoutes" not in payload
+
+def test_warm_start_with_window_violations_is_not_injected(monkeypatch, make_params):
+    monkeypatch.setattr(settings, "ROUTE_OPTIMIZATION_WARM_START_FACTOR", 0.25)
+    params = make_params(10)
+    route = route_optimization_api.warm_start_route(params)
+    feasible = route_optimization_api.build_payload(params, initial_route=route)
+    for i in range(5):
+        route[i] = {**route[i], "time_window_violation": True}
+    payload = route_optimization_api.build_payload(params, initial_route=route)
+    assert "injectedFirstSolutionRoutes" not in payload
+    # Half the stops miss their windows: the solver gets more time than for a feasible start, less than cold
+    timeout = lambda p: int(p["timeout"][:-1])
+    assert timeout(feasible) < timeout(payload) < timeout(route_optimization_api.build_payload(params))
+
+def test_routes_api_splits_large_tours_into_capped_segments(monkeypatch, make_params):
+    from app.services.google import routes_api
+
+    payloads = []
+
+    def fake_call_api(payload, timeout_sec=None):
+        payloads.append(payload)
+        count = len(payload["intermediates"])
+        # Reverse each segment so stitching must follow the API's order
+        return {"routes": [{
+            "optimizedIntermediateWaypointIndex": list(reversed(range(count))),
+            "legs": [{"duration": "300s"} for _ in range(count + 1)],
+        }]}
+
+    monkeypatch.setattr(settings, "ROUTES_API_MAX_INTERMEDIATES", 10)
+    monkeypatch.setattr(routes_api, "call_api", fake_call_api)
+    params = make_params(40)
+    plan = routes_api.optimize_route(params)
+
+    assert len(payloads) == 4
+    assert all(len(p["intermediates"]) <= 10 for p in payloads)
+    assert sorted(stop["original_order"] for stop in plan) == list(range(40))
+    assert [stop["optimized_order"] for stop in plan] == list(range(40))
+    # Each segment starts where the previous one ended
+    for previous, current in zip(payloads, payloads[1:]):
+        assert current["origin"] == previous["destination"]
+    # Without a destination the tour is a round trip back to the start
+    assert payloads[-1]["destination"] == payloads[0]["origin"]
+
+def test_boundary_repair_undoes_crossing_at_seam(make_params):
+    from app.services.google import routes_api
+
+    params = make_params(8)
+    params.destination_location = {"lat": 37.9, "lng": -122.29}
+    locations = params.locations
+    # Stops lie on a line towards the destination; swapping the two stops around the seam adds a detour
+    order = [0, 1, 2, 4, 3, 5, 6, 7]
+    stops = []
+    previous = params.start_location
+    for i in order:
+        distance_km = routes_api.haversine_km(previous["lat"], previous["lng"], locations[i]["lat"], locations[i]["lng"])
+        stops.append((locations[i], int(distance_km / 40 * 3600)))
+        previous = locations[i]
+    repaired = routes_api.repair_boundaries(stops, seams=[4], params=params)
+    assert [location["original_index"] for location, _ in repaired] == list(range(8))
+
+class ScriptedSession:
+    """Stands in for the shared requests session, answering with a fixed list of status codes"""
+
+    def __init__(self, status_codes):
+        self.status_codes = list(status_codes)
+        self.calls = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls += 1
+        status = self.status_codes.pop(0)
+        if status is None:
+            raise requests.exceptions.ConnectionError(f"Max retries exceeded with url: {url}?address=x&key=secret")
+        response = requests.Response()
+        response.status_code = status
+        response.raw = io.BytesIO(b"")
+        return response
+
+def scripted_transport(monkeypatch, status_codes):
+    session = ScriptedSession(status_codes)
+    monkeypatch.setattr(transport, "get_session", lambda: session)
+    monkeypatch.setattr(transport, "backoff_delay", lambda attempt, retry_after=None: 0.0)
+    return session
+
+def test_transport_retries_429_and_5xx(monkeypatch):
+    session = scripted_transport(monkeypatch, [429, 503, 200])
+    assert transport.get("https://example.test/api", max_retries=3).status_code == 200
+    assert session.calls == 3
+
+def test_transport_returns_last_response_when_retries_run_out(monkeypatch):
+    session = scripted_transport(monkeypatch, [500, 502, 504])
+    assert transport.get("https://example.test/api", max_retries=2).status_code == 504
+    assert session.calls == 3
+
+def test_transport_does_not_retry_client_errors(monkeypatch):
+    session = scripted_transport(monkeypatch, [400, 200])
+    assert transport.get("https://example.test/api", max_retries=3).status_code == 400
+    assert session.calls == 1
+
+def test_transport_retry_logs_do_not_leak_query_strings(monkeypatch, caplog):
+    session = scripted_transport(monkeypatch, [None, 503, 200])
+    with caplog.at_level("WARNING"):
+        transport.get("https://example.test/geocode?address=x&key=secret", max_retries=3)
+    assert session.calls == 3
+    assert "retrying" in caplog.text
+    assert "secret" not in caplog.text
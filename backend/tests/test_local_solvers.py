@@ -0,0 +1,163 @@
+"""
+Tests for the local time-window-aware solver (no network needed)
+"""
+import random
+import time
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+from app.services import vrptw_optimizer
+from app.services.travel_matrix import haversine_travel_matrix
+
+def test_solver_respects_windows_that_greedy_breaks(make_random_params):
+    # Geographically the far stop is last, but its window closes first
+    params = make_random_params(3)
+    start = params.global_start_time
+    for i, loc in enumerate(params.locations):
+        loc["lat"], loc["lng"] = 37.77 + 0.02 * (i + 1), -122.42
+        loc["start_ts"] = int(start.timestamp())
+        loc["end_ts"] = int((start + timedelta(hours=8)).timestamp())
+    params.locations[2]["end_ts"] = int((start + timedelta(minutes=20)).timestamp())
+
+    plan = vrptw_optimizer.optimize_route(params)
+    assert plan[0]["original_order"] == 2
+    assert not any(stop["time_window_violation"] for stop in plan)
+
+def test_solver_waits_for_windows_to_open(make_random_params):
+    params = make_random_params(2)
+    opens = params.global_start_time + timedelta(hours=3)
+    params.locations[0]["start_ts"] = int(opens.timestamp())
+    params.locations[0]["end_ts"] = int((opens + timedelta(hours=1)).timestamp())
+    plan = vrptw_optimizer.optimize_route(params)
+    stop = next(s for s in plan if s["original_order"] == 0)
+    assert stop["arrival_time"] == opens
+    assert not stop["time_window_violation"]
+
+def test_local_search_improves_insertion_and_visits_every_stop(make_random_params):
+    params = make_random_params(30)
+    travel, ready, due, service, start_ts = vrptw_optimizer.build_problem(params)
+    inserted = vrptw_optimizer.cheapest_insertion(travel, ready, due, service, start_ts)
+    improved = vrptw_optimizer.improve_route(inserted, travel, ready, due, service, start_ts, time_limit_sec=1.0)
+
+    assert sorted(improved) == list(range(1, 31))
+    cost = lambda order: vrptw_optimizer.route_cost(order, np.asarray(travel).tolist(), ready, due, service, start_ts)[0]
+    assert cost(improved) <= cost(inserted)
+
+def test_solver_honors_time_cap(make_random_params):
+    params = make_random_params(120, window_hours=12)
+    started = time.perf_counter()
+    plan = vrptw_optimizer.optimize_route(params, time_limit_sec=0.05)
+    assert len(plan) == 120
+    # Insertion plus a capped local search stays well under a second
+    assert time.perf_counter() - started < 1.0
+
+def test_route_cost_counts_late_stops_and_waiting():
+    travel = haversine_travel_matrix([(0.0, 0.0)] * 3).tolist()
+    ready, due, service = [0, 100, 0], [1000, 200, 1000], [0, 10, 0]
+    cost, late = vrptw_optimizer.route_cost([1], travel, ready, due, service, start_ts=0)
+    assert (cost, late) == (110, 0)
+    cost, late = vrptw_optimizer.route_cost([1], travel, [0, 0, 0], [1000, -5, 1000], service, start_ts=0)
+    assert late == 1
+
+def brute_force_best(travel, ready, due, service, start_ts):
+    import itertools
+    best = None
+    travel_list = np.asarray(travel).tolist()
+    for order in itertools.permutations(range(1, len(travel) - 1)):
+        cost, late = vrptw_optimizer.route_cost(list(order), travel_list, ready, due, service, start_ts)
+        if late == 0 and (best is None or cost < best):
+            best = cost
+    return best
+
+def test_held_karp_matches_brute_force(make_random_params):
+    from app.services.exact_optimizer import held_karp
+
+    for seed in range(5):
+        params = make_random_params(7, seed=seed, window_hours=3)
+        params.destination_location = {"lat": 37.80, "lng": -122.45}
+        problem = vrptw_optimizer.build_problem(params)
+        order = held_karp(*problem)
+        expected = brute_force_best(*problem)
+        if expected is None:
+            assert order is None
+            continue
+        travel, ready, due, service, start_ts = problem
+        assert vrptw_optimizer.route_cost(order, np.asarray(travel).tolist(), ready, due, service, start_ts) == (expected, 0)
+
+def test_exact_solver_is_fast_and_bounded_by_threshold(monkeypatch, make_random_params):
+    import pytest
+    from app.core.config import settings
+    from app.services import exact_optimizer
+
+    params = make_random_params(12, window_hours=12)
+    started = time.perf_counter()
+    plan = exact_optimizer.optimize_route(params)
+    assert len(plan) == 12 and not any(stop["time_window_violation"] for stop in plan)
+    assert time.perf_counter() - started < 1.0
+
+    monkeypatch.setattr(settings, "EXACT_SOLVER_MAX_STOPS", 11)
+    with pytest.raises(Exception, match="EXACT_SOLVER_MAX_STOPS"):
+        exact_optimizer.optimize_route(params)
+
+def test_parallel_search_is_opt_in(monkeypatch, make_random_params):
+    from app.core.config import settings
+    from app.services import parallel_search
+
+    monkeypatch.setattr(settings, "LOCAL_SOLVER_PARALLEL", False)
+    with pytest.raises(Exception, match="disabled"):
+        parallel_search.optimize_route(make_random_params(30))
+    monkeypatch.setattr(settings, "LOCAL_SOLVER_PARALLEL", True)
+    with pytest.raises(Exception, match="LOCAL_SOLVER_PARALLEL_MIN_STOPS"):
+        parallel_search.optimize_route(make_random_params(settings.LOCAL_SOLVER_PARALLEL_MIN_STOPS - 1))
+
+def test_parallel_search_workers_read_shared_matrix_and_never_do_worse(make_random_params):
+    from concurrent.futures import wait
+    from app.services.parallel_search import LocalSearchPool, perturb
+
+    rng = random.Random(1)
+    assert sorted(perturb(list(range(1, 21)), rng)) == list(range(1, 21))
+
+    params = make_random_params(25, window_hours=4)
+    travel, ready, due, service, start_ts = vrptw_optimizer.build_problem(params)
+    route = vrptw_optimizer.cheapest_insertion(travel, ready, due, service, start_ts)
+    neighbors = vrptw_optimizer.candidate_neighbors(params, travel)
+    initial_cost = vrptw_optimizer.route_cost(route, travel, ready, due, service, start_ts)[0]
+
+    pool = LocalSearchPool(max_workers=2)
+    try:
+        wait(pool.start())
+        cost, late, order = pool.search(travel, ready, due, service, start_ts, route, neighbors, time_limit_sec=0.5)
+    finally:
+        pool.shutdown(wait=True)
+    assert sorted(order) == list(range(1, 26))
+    assert cost <= initial_cost
+    assert (cost, late) == vrptw_optimizer.route_cost(order, travel, ready, due, service, start_ts)
+
+def test_neighbors_and_insertion_break_minimum_leg_ties_by_distance(make_params):
+    # Every leg is under the estimate's minimum leg time, so travel times alone all tie
+    params = make_params(4)
+    for i, loc in enumerate(params.locations):
+        loc["lat"], loc["lng"] = 37.77, -122.42 + 0.001 * (3 - i)
+    travel, ready, due, service, start_ts = vrptw_optimizer.build_problem(params)
+    assert len(set(np.asarray(travel)[1:5, 1:5][~np.eye(4, dtype=bool)].tolist())) == 1
+
+    neighbors = vrptw_optimizer.candidate_neighbors(params, travel)
+    assert neighbors[4][:2] == [3, 2]
+    route = vrptw_optimizer.cheapest_insertion(travel, ready, due, service, start_ts,
+                                               distance=vrptw_optimizer.node_distances(params))
+    assert route in ([1, 2, 3, 4], [4, 3, 2, 1])
+
+def test_large_tours_are_seeded_nearest_neighbour_instead_of_by_insertion(monkeypatch, make_random_params):
+    from app.core.config import settings
+
+    params = make_random_params(40, window_hours=12)
+    travel, ready, due, service, start_ts = vrptw_optimizer.build_problem(params)
+    monkeypatch.setattr(settings, "LOCAL_SOLVER_INSERTION_MAX_STOPS", 30)
+    route = vrptw_optimizer.cheapest_insertion(travel, ready, due, service, start_ts)
+    assert route == vrptw_optimizer.nearest_neighbor_order(travel, range(1, 41))
+    # A repair that inserts only a few stops still uses cheapest insertion
+    repaired = vrptw_optimizer.cheapest_insertion(travel, ready, due, service, start_ts, route=route[:35])
+    assert sorted(repaired) == list(range(1, 41))
+    assert [stop for stop in repaired if stop in route[:35]] == route[:35]
@@ -0,0 +1,128 @@
+"""
+Tests for background plan jobs (no network needed)
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import PlanJob
+from app.schemas.route import HouseVisit, RoutePlanRequest, RoutePlanResponse
+from app.services.plan_jobs import CANCELLED, FAILED, SUCCEEDED, PlanJobManager
+
+def make_request():
+    start = datetime(2030, 6, 1, 9, 0, tzinfo=timezone.utc)
+    return RoutePlanRequest(
+        start_address="100 Market St",
+        houses=[HouseVisit(address="1 Test St", start_time=start, end_time=start + timedelta(hours=2))],
+        global_start_time=start,
+        global_end_time=start + timedelta(hours=9),
+    )
+
+def make_manager(tmp_path, runner, **kwargs):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    return PlanJobManager(session_factory=sessionmaker(bind=engine), runner=runner, **kwargs)
+
+def wait_for_status(manager, job_id, statuses, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job.status in statuses:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not reach {statuses}")
+
+def test_job_runs_and_persists_result(tmp_path):
+    manager = make_manager(tmp_path, lambda request: RoutePlanResponse(route=[], optimization_method="Stub"))
+    job = manager.submit(make_request())
+    finished = wait_for_status(manager, job.job_id, {SUCCEEDED})
+    assert finished.result.optimization_method == "Stub"
+    manager.shutdown(wait=True)
+
+def test_job_failure_is_reported(tmp_path):
+    def failing(request):
+        raise Exception("All route optimization methods failed")
+
+    manager = make_manager(tmp_path, failing)
+    job = manager.submit(make_request())
+    finished = wait_for_status(manager, job.job_id, {FAILED})
+    assert "All route optimization methods failed" in finished.error
+    manager.shutdown(wait=True)
+
+def test_cancel_running_job_discards_result(tmp_path):
+    release = threading.Event()
+
+    def blocking(request):
+        release.wait(timeout=2)
+        return RoutePlanResponse(route=[], optimization_method="Stub")
+
+    manager = make_manager(tmp_path, blocking, max_workers=1)
+    job = manager.submit(make_request())
+    queued = manager.submit(make_request())
+    assert manager.cancel(queued.job_id).status == CANCELLED
+    assert manager.cancel(job.job_id).status == CANCELLED
+    release.set()
+    manager.shutdown(wait=True)
+    assert manager.get(job.job_id).status == CANCELLED
+    assert manager.get(job.job_id).result is None
+    assert manager.get(queued.job_id).status == CANCELLED
+
+def test_resume_leaves_jobs_leased_by_live_workers(tmp_path):
+    release = threading.Event()
+    runs = []
+
+    def blocking(request):
+        runs.append(1)
+        release.wait(timeout=2)
+        return RoutePlanResponse(route=[], optimization_method="Stub")
+
+    first = make_manager(tmp_path, blocking, max_workers=1)
+    running = first.submit(make_request())
+    wait_for_status(first, running.job_id, {"running"})
+    queued = first.submit(make_request())
+
+    # A sibling process starting up sees one running (leased) and one queued job
+    second = make_manager(tmp_path, blocking, max_workers=2)
+    second.resume_pending()
+    release.set()
+    wait_for_status(second, running.job_id, {SUCCEEDED})
+    wait_for_status(second, queued.job_id, {SUCCEEDED})
+    first.shutdown(wait=True)
+    second.shutdown(wait=True)
+    assert len(runs) == 2
+
+def test_resume_takes_over_expired_leases_but_not_cancelled_jobs(tmp_path):
+    manager = make_manager(tmp_path, lambda request: RoutePlanResponse(route=[], optimization_method="Stub"))
+    manager._ensure_ready()
+    manager.shutdown(wait=True)
+    session = manager.session_factory()
+    now = int(time.time())
+    for job_id, status, cancelled, lease in (("stale", "running", False, now - 10), ("cancelled", "cancelled", True, None)):
+        session.add(PlanJob(id=job_id, status=status, request_json=make_request().model_dump_json(),
+                            cancel_requested=cancelled, created_at=now, updated_at=now,
+                            owner="dead-worker", lease_expires_at=lease))
+    session.commit()
+    session.close()
+
+    manager.resume_pending()
+    assert wait_for_status(manager, "stale", {SUCCEEDED}).result.optimization_method == "Stub"
+    manager._run("cancelled")
+    assert manager.get("cancelled").status == CANCELLED
+    manager.shutdown(wait=True)
+
+def test_live_manager_takes_over_jobs_whose_lease_expires(tmp_path):
+    manager = make_manager(tmp_path, lambda request: RoutePlanResponse(route=[], optimization_method="Stub"), lease_seconds=1)
+    manager._ensure_ready()
+    session = manager.session_factory()
+    now = int(time.time())
+    session.add(PlanJob(id="orphaned", status="running", request_json=make_request().model_dump_json(),
+                        cancel_requested=False, created_at=now, updated_at=now,
+                        owner="dead-worker", lease_expires_at=now - 1))
+    session.commit()
+    session.close()
+
+    # No resume_pending: the lease sweep alone picks the job up
+    assert wait_for_status(manager, "orphaned", {SUCCEEDED}).result.optimization_method == "Stub"
+    manager.shutdown(wait=True)
@@ -0,0 +1,102 @@
+"""
+Tests for stored plans and incremental plan changes (no network needed)
+"""
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.schemas.route import HouseVisit, PlanChange, RoutePlanResponse
+from app.services import plan_store as plan_store_module
+from app.services import vrptw_optimizer
+from app.services.plan_store import PlanStore, apply_plan_changes
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "GOOGLE_MAPS_API_KEY", None)
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}")
+    return PlanStore(session_factory=sessionmaker(bind=engine))
+
+@pytest.fixture
+def saved_plan(store, make_random_params):
+    """A 12-stop plan stored in store, as (params, plan_id)"""
+    params = make_random_params(12, window_hours=4)
+    response = RoutePlanResponse(route=vrptw_optimizer.optimize_route(params), optimization_method="Local VRPTW Solver")
+    return params, store.save(params, response)
+
+def test_plans_round_trip_and_expire(store, saved_plan):
+    params, plan_id = saved_plan
+    state = store.get(plan_id)
+    assert [stop["house"]["address"] for stop in state["stops"]] == [loc["house_data"].address for loc in params.locations]
+    assert sorted(state["order"]) == list(range(12))
+    assert store.get("missing") is None
+
+    store.ttl_seconds = -1
+    assert store.get(plan_id) is None
+
+def test_cached_plans_are_handed_out_under_their_own_plan_id(store, saved_plan):
+    _, plan_id = saved_plan
+    response = RoutePlanResponse(route=[], optimization_method="Local VRPTW Solver", plan_id=plan_id)
+    first, second = plan_store_module.own_plan(response, store=store), plan_store_module.own_plan(response, store=store)
+    assert len({plan_id, first.plan_id, second.plan_id}) == 3
+    assert store.get(first.plan_id) == store.get(plan_id)
+    assert response.plan_id == plan_id
+    assert store.fork("missing") is None
+
+def test_expired_plans_are_purged_at_most_once_per_interval(store, saved_plan):
+    params, plan_id = saved_plan
+    response = RoutePlanResponse(route=[], optimization_method="Local VRPTW Solver")
+    store.ttl_seconds = -1
+    store.save(params, response)
+    store.ttl_seconds = 3600
+    assert store.get(plan_id) is not None
+
+    store.purge_interval_sec = 0
+    store.ttl_seconds = -1
+    store.save(params, response)
+    store.ttl_seconds = 3600
+    assert store.get(plan_id) is None
+
+def test_remove_and_insert_repair_the_stored_route(store, saved_plan, monkeypatch):
+    params, plan_id = saved_plan
+    removed = params.locations[3]["house_data"].address
+    result = apply_plan_changes(plan_id, [PlanChange(op="remove", address=removed)], store=store)
+    assert result.optimization_method == "Incremental Repair"
+    assert len(result.route) == 11 and removed not in [stop.address for stop in result.route]
+    assert result.plan_id and result.plan_id != plan_id
+
+    geocoded = []
+    def fake_geocode(address):
+        geocoded.append(address)
+        return 37.75, -122.45
+    monkeypatch.setattr(plan_store_module, "geocode_address", fake_geocode)
+    start = params.global_start_time
+    house = HouseVisit(address="99 New St", start_time=start + timedelta(hours=1), end_time=start + timedelta(hours=3), duration_minutes=15)
+    inserted = apply_plan_changes(result.plan_id, [PlanChange(op="insert", house=house)], store=store)
+
+    # Only the new stop is geocoded; the others come from the stored plan
+    assert geocoded == ["99 New St"]
+    assert len(inserted.route) == 12
+    new_stop = next(stop for stop in inserted.route if stop.address == "99 New St")
+    assert new_stop.original_order == 11 and not new_stop.time_window_violation
+
+def test_update_window_moves_the_stop_into_its_new_window(store, saved_plan):
+    params, plan_id = saved_plan
+    address = params.locations[0]["house_data"].address
+    opens = params.global_start_time + timedelta(hours=5)
+    change = PlanChange(op="update_window", address=address, start_time=opens, end_time=opens + timedelta(minutes=30))
+    result = apply_plan_changes(plan_id, [change], store=store)
+
+    stop = next(stop for stop in result.route if stop.address == address)
+    assert opens <= stop.arrival_time <= opens + timedelta(minutes=30)
+    assert not stop.time_window_violation
+
+def test_invalid_changes_are_rejected(store, saved_plan):
+    _, plan_id = saved_plan
+    assert apply_plan_changes("missing", [], store=store) is None
+    with pytest.raises(ValueError, match="No stop"):
+        apply_plan_changes(plan_id, [PlanChange(op="remove", address="1 Nowhere Rd")], store=store)
+    with pytest.raises(ValueError, match="Unknown change op"):
+        apply_plan_changes(plan_id, [PlanChange(op="swap")], store=store)
@@ -0,0 +1,130 @@
+"""
+Tests for the offline OSM road network provider (no network needed)
+"""
+import heapq
+import random
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import road_network
+from app.services.road_network import RoadNetwork, build_graph, contract, read_osm
+from app.services.travel_matrix import get_travel_matrix
+
+SPACING = 0.002
+
+def write_grid_extract(path, size=8):
+    """A size x size street grid with some one-way streets, a primary road and a footpath"""
+    rng = random.Random(1)
+    node_id = lambda r, c: 1000 + r * size + c
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<osm version="0.6">']
+    for r in range(size):
+        for c in range(size):
+            lat, lng = 37.75 + r * SPACING + rng.uniform(-1e-4, 1e-4), -122.45 + c * SPACING + rng.uniform(-1e-4, 1e-4)
+            lines.append(f'<node id="{node_id(r, c)}" lat="{lat}" lon="{lng}"/>')
+    lines.append('<node id="1" lat="37.70" lon="-122.40"/><node id="2" lat="37.701" lon="-122.40"/>')
+    way_id = 1
+    for r in range(size):
+        tags = f'<tag k="highway" v="{"primary" if r == 0 else "residential"}"/>'
+        if r % 3 == 1:
+            tags += '<tag k="oneway" v="yes"/>'
+        lines.append(f'<way id="{way_id}">' + "".join(f'<nd ref="{node_id(r, c)}"/>' for c in range(size)) + tags + '</way>')
+        way_id += 1
+    for c in range(size):
+        tags = '<tag k="highway" v="residential"/>' + ('<tag k="oneway" v="-1"/>' if c % 3 == 2 else "")
+        lines.append(f'<way id="{way_id}">' + "".join(f'<nd ref="{node_id(r, c)}"/>' for r in range(size)) + tags + '</way>')
+        way_id += 1
+    lines.append(f'<way id="{way_id}"><nd ref="1"/><nd ref="2"/><tag k="highway" v="footway"/></way>')
+    lines.append("</osm>")
+    path.write_text("\n".join(lines))
+    return path
+
+def dijkstra(count, tails, heads, seconds, source):
+    adjacency = [[] for _ in range(count)]
+    for tail, head, weight in zip(tails.tolist(), heads.tolist(), seconds.tolist()):
+        adjacency[tail].append((head, weight))
+    distances = [float("inf")] * count
+    distances[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if distance > distances[node]:
+            continue
+        for neighbor, weight in adjacency[node]:
+            if distance + weight < distances[neighbor]:
+                distances[neighbor] = distance + weight
+                heapq.heappush(heap, (distance + weight, neighbor))
+    return distances
+
+def test_contraction_hierarchy_matches_dijkstra(tmp_path):
+    coordinates, tails, heads, seconds = build_graph(*read_osm(write_grid_extract(tmp_path / "grid.osm")))
+    # The footpath is not drivable
+    assert len(coordinates) == 64
+
+    network = RoadNetwork(coordinates, *contract(len(coordinates), tails, heads, seconds))
+    nodes = list(range(len(coordinates)))
+    matrix = network.node_matrix(nodes, nodes)
+    for source in nodes[::7]:
+        assert np.allclose(matrix[source], dijkstra(len(coordinates), tails, heads, seconds, source))
+
+    # One-way rows make some trips longer in one direction than the other
+    assert not np.allclose(matrix, matrix.T)
+
+def test_contracted_graph_is_cached_and_rebuilt_when_the_extract_changes(tmp_path, monkeypatch):
+    extract = write_grid_extract(tmp_path / "grid.osm")
+    first = RoadNetwork.from_extract(extract)
+    assert (tmp_path / "grid.osm.ch.npz").exists()
+
+    def no_contraction(*args):
+        raise AssertionError("cached graph should have been used")
+    monkeypatch.setattr(road_network, "contract", no_contraction)
+    second = RoadNetwork.from_extract(extract)
+    points = [(37.7501, -122.4499), (37.7601, -122.4401), (37.7551, -122.4351)]
+    assert np.allclose(first.travel_matrix(points), second.travel_matrix(points))
+
+    write_grid_extract(extract, size=6)
+    with pytest.raises(AssertionError, match="cached graph"):
+        RoadNetwork.from_extract(extract)
+
+def test_osm_provider_routes_on_roads_and_falls_back_off_road(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "OSM_EXTRACT_PATH", str(write_grid_extract(tmp_path / "grid.osm")))
+    monkeypatch.setattr(settings, "OSM_GRAPH_CACHE_PATH", str(tmp_path / "graph.npz"))
+    monkeypatch.setattr(road_network, "_road_network_path", None)
+
+    on_road = [{"lat": 37.7500, "lng": -122.4500}, {"lat": 37.7640, "lng": -122.4360}]
+    off_road = {"lat": 37.90, "lng": -122.20}
+    matrix = get_travel_matrix(on_road + [off_road], provider="osm")
+    estimate = get_travel_matrix(on_road + [off_road], provider="haversine")
+
+    network = road_network.get_road_network()
+    routed = network.travel_matrix([(p["lat"], p["lng"]) for p in on_road])
+    assert matrix[0, 1] == round(routed[0, 1])
+    # Grid streets are longer than the diagonal and slower than the default estimate speed
+    assert matrix[0, 1] > estimate[0, 1]
+    assert matrix[0, 2] == estimate[0, 2] and matrix[2, 1] == estimate[2, 1]
+
+def test_unwritable_graph_cache_still_returns_the_built_network(tmp_path):
+    extract = write_grid_extract(tmp_path / "grid.osm")
+    network = RoadNetwork.from_extract(extract, tmp_path / "missing-dir" / "graph.npz")
+    assert network.travel_matrix([(37.7500, -122.4500), (37.7640, -122.4360)])[0, 1] > 0
+
+def test_failed_road_network_build_is_not_repeated(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "OSM_EXTRACT_PATH", str(tmp_path / "missing.osm"))
+    monkeypatch.setattr(road_network, "_road_network_path", None)
+    builds = []
+    original = RoadNetwork.from_extract.__func__
+
+    def counting_from_extract(cls, path, cache_path=None):
+        builds.append(path)
+        return original(cls, path, cache_path)
+    monkeypatch.setattr(RoadNetwork, "from_extract", classmethod(counting_from_extract))
+
+    for _ in range(3):
+        with pytest.raises(Exception, match="unavailable"):
+            road_network.get_road_network()
+    assert len(builds) == 1
+
+    points = [{"lat": 37.7500, "lng": -122.4500}, {"lat": 37.7640, "lng": -122.4360}]
+    assert get_travel_matrix(points, provider="osm").tolist() == get_travel_matrix(points, provider="haversine").tolist()
+    assert len(builds) == 1
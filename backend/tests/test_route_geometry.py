@@ -0,0 +1,71 @@
+"""
+Tests for polyline encoding/simplification and the cached route geometry service
+"""
+import math
+
+from app.services import polyline, route_geometry
+from app.services.google import routes_api
+
+def test_polyline_round_trip():
+    encoded = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    points = polyline.decode(encoded)
+    assert points == [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+    assert polyline.encode(points) == encoded
+
+def test_simplify_drops_points_within_tolerance():
+    # A straight east-west line with a 5 m wiggle and one 200 m detour
+    points = [(37.0, -122.0 + 0.001 * i) for i in range(20)]
+    points[5] = (37.0 + 5 / 111195, points[5][1])
+    points[12] = (37.0 + 200 / 111195, points[12][1])
+
+    simplified = polyline.simplify(points, tolerance_m=20)
+    assert simplified[0] == points[0] and simplified[-1] == points[-1]
+    assert points[12] in simplified and points[5] not in simplified
+    assert len(polyline.simplify(points, tolerance_m=500)) == 2
+
+def test_tolerance_shrinks_as_zoom_increases():
+    assert math.isclose(polyline.tolerance_for_zoom(0), polyline.METERS_PER_PIXEL_ZOOM0)
+    assert polyline.tolerance_for_zoom(15, 37.0) < polyline.tolerance_for_zoom(10, 37.0)
+
+def test_route_geometry_is_fetched_once_and_simplified_per_zoom(monkeypatch):
+    fetches = []
+    points = [(37.0 + 0.0001 * (i % 2), -122.0 + 0.001 * i) for i in range(50)]
+
+    def fake_fetch(addresses):
+        fetches.append(addresses)
+        return points
+
+    monkeypatch.setattr(route_geometry, "_fetch_points", fake_fetch)
+    route_geometry.route_geometry_cache.clear()
+
+    addresses = ["100 Market St", "1 Test St", "2 Test St"]
+    detailed = route_geometry.get_route_geometry(addresses, zoom=18)
+    overview = route_geometry.get_route_geometry(addresses, zoom=10)
+    again = route_geometry.get_route_geometry(addresses, zoom=10)
+
+    assert len(fetches) == 1
+    assert detailed["original_point_count"] == 50
+    assert overview["point_count"] < detailed["point_count"]
+    assert again == overview
+
+def test_planning_field_mask_excludes_geometry_and_steps():
+    assert "steps" not in routes_api.FIELD_MASK
+    assert "polyline" not in routes_api.FIELD_MASK
+
+def test_long_route_geometry_is_fetched_in_capped_segments(monkeypatch):
+    from app.core.config import settings
+
+    segments = []
+
+    def fake_fetch(coordinates, timeout_sec=None):
+        segments.append(list(coordinates))
+        return polyline.encode(coordinates)
+
+    monkeypatch.setattr(settings, "ROUTES_API_MAX_INTERMEDIATES", 3)
+    monkeypatch.setattr(routes_api, "_fetch_segment_polyline", fake_fetch)
+    coordinates = [(37.0 + 0.001 * i, -122.0 - 0.001 * i) for i in range(12)]
+    joined = polyline.decode(routes_api.fetch_route_polyline(coordinates))
+
+    assert sorted(len(segment) - 2 for segment in segments) == [2, 3, 3]
+    assert all(segment[0] in coordinates[::4] for segment in segments)
+    assert joined == [(round(lat, 5), round(lng, 5)) for lat, lng in coordinates]
@@ -0,0 +1,400 @@
+"""
+Tests for the optimizer orchestration in app.services.routing (no network needed)
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.schemas.route import HouseVisit, RoutePlanRequest
+from app.services import circuit_breaker, routing
+from app.services.plan_cache import PlanCache, plan_cache_key
+
+@pytest.fixture(autouse=True)
+def fresh_circuit_breakers(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+
+def fake_plan(params, deadline=None):
+    return [{
+        "address": loc["house_data"].address,
+        "arrival_time": params.global_start_time,
+        "departure_time": params.global_start_time,
+        "original_order": loc["original_index"],
+        "optimized_order": i,
+        "time_window_violation": False,
+    } for i, loc in enumerate(params.locations)]
+
+def slow_provider(delay):
+    def optimize(params, timeout_sec=None):
+        time.sleep(min(delay, timeout_sec or delay))
+        if delay > (timeout_sec or delay):
+            raise Exception("timed out")
+        return fake_plan(params)
+    return optimize
+
+def test_hedged_returns_local_result_at_deadline(monkeypatch, make_params):
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [
+        ("Remote", slow_provider(5), True),
+        ("Local", fake_plan, False),
+    ])
+    started = time.monotonic()
+    response = routing.run_hedged_optimizers(make_params(), deadline_sec=0.3)
+    assert time.monotonic() - started < 1.5
+    assert response.optimization_method == "Local"
+
+def test_hedged_prefers_remote_result_within_budget(monkeypatch, make_params):
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [
+        ("Remote", slow_provider(0.05), True),
+        ("Local", fake_plan, False),
+    ])
+    response = routing.run_hedged_optimizers(make_params(), deadline_sec=2)
+    assert response.optimization_method == "Remote"
+    assert len(response.route) == 3
+
+def test_remote_methods_are_not_started_when_a_leading_local_method_succeeds(monkeypatch, make_params):
+    remote_calls = []
+
+    def remote(params, timeout_sec=None):
+        remote_calls.append("sync")
+        return fake_plan(params)
+
+    async def remote_async(params, timeout_sec=None):
+        remote_calls.append("async")
+        return fake_plan(params)
+
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [
+        ("Exact", fake_plan, False),
+        ("Remote", remote, True),
+        ("Local", fake_plan, False),
+    ])
+    monkeypatch.setattr(routing, "ASYNC_REMOTE_METHODS", {"Remote": remote_async})
+    params = make_params()
+
+    async def fake_geocode(houses, start_address, destination_address=None):
+        return params.start_location, None, params.locations
+    monkeypatch.setattr(routing, "geocode_route_stops_async", fake_geocode)
+
+    async def stream():
+        houses = [loc["house_data"] for loc in params.locations]
+        return [e async for e in routing.stream_optimized_route_async(
+            houses, "start", global_start_time=params.global_start_time, global_end_time=params.global_end_time)]
+
+    assert routing.run_hedged_optimizers(params, deadline_sec=2).optimization_method == "Exact"
+    assert asyncio.run(routing.run_hedged_optimizers_async(params, deadline_sec=2)).optimization_method == "Exact"
+    assert [(e.event, e.optimization_method) for e in asyncio.run(stream())] == [("plan", "Exact"), ("done", "Exact")]
+    assert remote_calls == []
+
+def test_deadline_starts_before_geocoding(monkeypatch, make_params):
+    budgets = []
+
+    def remote(params, timeout_sec=None):
+        budgets.append(timeout_sec)
+        return fake_plan(params)
+
+    def slow_geocode(houses, start_address, destination_address=None):
+        time.sleep(0.3)
+        params = make_params(len(houses))
+        return params.start_location, None, params.locations
+
+    monkeypatch.setattr(routing, "geocode_route_stops", slow_geocode)
+    monkeypatch.setattr(routing.plan_store, "save", lambda params, response: None)
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [
+        ("Remote", remote, True),
+        ("Local", fake_plan, False),
+    ])
+    request = make_request()
+    response = routing.plan_optimized_route(request.houses, request.start_address, None,
+                                            request.global_start_time, request.global_end_time, deadline_sec=1.0)
+    assert response.optimization_method == "Remote"
+    assert budgets[0] < 0.75
+
+    budgets.clear()
+    response = routing.plan_optimized_route(request.houses, request.start_address, None,
+                                            request.global_start_time, request.global_end_time, deadline_sec=0.2)
+    assert response.optimization_method == "Local"
+    assert budgets == []  # the budget was spent geocoding, so the remote call is skipped
+
+def test_circuit_breaker_skips_failing_provider(monkeypatch, make_params):
+    calls = []
+
+    def broken_provider(params):
+        calls.append(1)
+        raise Exception("503 Service Unavailable")
+
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [
+        ("Remote", broken_provider, True),
+        ("Local", fake_plan, False),
+    ])
+    for _ in range(5):
+        response = routing.run_sequential_optimizers(make_params())
+        assert response.optimization_method == "Local"
+    assert len(calls) == 3
+    state = circuit_breaker.circuit_breaker_states()["Remote"]
+    assert state["state"] == circuit_breaker.OPEN
+    assert state["rejected_calls"] == 2
+
+def test_circuit_breaker_half_open_probe_closes_on_success():
+    breaker = circuit_breaker.CircuitBreaker("probe", consecutive_failures=1, open_seconds=0)
+    assert breaker.allow_request()
+    breaker.record_failure(0.1, "boom")
+    assert breaker.state == circuit_breaker.OPEN
+    assert breaker.allow_request()  # open_seconds elapsed: single half-open probe
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    assert not breaker.allow_request()
+    breaker.record_success(0.1)
+    assert breaker.state == circuit_breaker.CLOSED
+
+def test_circuit_breaker_ignores_late_success_while_open():
+    breaker = circuit_breaker.CircuitBreaker("late", consecutive_failures=1, open_seconds=60)
+    breaker.record_failure(0.1, "boom")
+    breaker.record_success(0.1)  # a call admitted before the circuit opened
+    assert breaker.state == circuit_breaker.OPEN
+    assert not breaker.allow_request()
+
+def test_circuit_breaker_keeps_zero_thresholds():
+    breaker = circuit_breaker.CircuitBreaker("zero", failure_rate=0.0, min_calls=0)
+    assert breaker.failure_rate_threshold == 0.0
+    assert breaker.min_calls == 0
+
+def test_caller_budget_timeouts_do_not_open_circuit(make_params):
+    calls = []
+
+    def slow_remote(params, timeout_sec=None):
+        calls.append(timeout_sec)
+        time.sleep(timeout_sec)
+        raise Exception("Read timed out")
+
+    for _ in range(5):
+        with pytest.raises(Exception, match="timed out"):
+            routing.run_optimization_method("Remote", slow_remote, True, make_params(), timeout_sec=0.02)
+    assert len(calls) == 5
+    state = circuit_breaker.circuit_breaker_states()["Remote"]
+    assert state["state"] == circuit_breaker.CLOSED
+    assert state["recent_calls"] == 0
+
+def make_request(address="1 Test St, San Francisco, CA"):
+    start = datetime(2030, 6, 1, 9, 0, tzinfo=timezone.utc)
+    return RoutePlanRequest(
+        start_address="100 Market St",
+        houses=[HouseVisit(address=address, start_time=start, end_time=start + timedelta(hours=2))],
+        global_start_time=start,
+        global_end_time=start + timedelta(hours=9),
+    )
+
+def test_plan_cache_key_is_canonical():
+    assert plan_cache_key(make_request()) == plan_cache_key(make_request(" 1 test st,  San Francisco, CA"))
+    assert plan_cache_key(make_request()) != plan_cache_key(make_request("2 Test St, San Francisco, CA"))
+
+def test_plan_cache_key_tells_units_and_similar_streets_apart():
+    assert plan_cache_key(make_request("1 Test St Apt 4B")) != plan_cache_key(make_request("1 Test St Apt 5C"))
+    assert plan_cache_key(make_request("123 Steiner St")) != plan_cache_key(make_request("123 Stevenson St"))
+
+def test_plan_cache_coalesces_concurrent_requests():
+    cache = PlanCache(ttl_seconds=60, max_entries=10)
+    computations = []
+    release = threading.Event()
+
+    def compute():
+        computations.append(1)
+        release.wait(timeout=2)
+        return "plan"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert results == ["plan"] * 5
+    assert len(computations) == 1
+    assert cache.get_or_compute("key", compute) == "plan"
+    assert cache.stats()["hits"] == 1
+
+def test_plan_cache_shares_only_values_the_caller_did_not_compute():
+    cache = PlanCache(ttl_seconds=60, max_entries=10)
+    shared = lambda value: value + " (shared)"
+    assert cache.get_or_compute("key", lambda: "plan", share=shared) == "plan"
+    assert cache.get_or_compute("key", lambda: "other", share=shared) == "plan (shared)"
+    assert asyncio.run(cache.get_or_compute_async("key", None, share=shared)) == "plan (shared)"
+
+def test_plan_cache_lru_eviction():
+    cache = PlanCache(ttl_seconds=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+def test_plan_cache_cancelled_waiter_does_not_break_leader():
+    cache = PlanCache(ttl_seconds=60, max_entries=10)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "plan"
+
+        leader = asyncio.create_task(cache.get_or_compute_async("key", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_compute_async("key", compute))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await leader, waiter.cancelled()
+
+    assert asyncio.run(run()) == ("plan", True)
+    assert cache.get("key") == "plan"
+
+def test_async_hedged_cancels_slow_remote(monkeypatch, make_params):
+    cancelled = []
+
+    async def slow_remote(params, timeout_sec=None):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return fake_plan(params)
+
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [
+        ("Remote", None, True),
+        ("Local", fake_plan, False),
+    ])
+    monkeypatch.setattr(routing, "ASYNC_REMOTE_METHODS", {"Remote": slow_remote})
+
+    async def run():
+        response = await routing.run_hedged_optimizers_async(make_params(), deadline_sec=0.2)
+        await asyncio.sleep(0)
+        return response
+
+    response = asyncio.run(run())
+    assert response.optimization_method == "Local"
+    assert cancelled == [1]
+    assert circuit_breaker.circuit_breaker_states()["Remote"]["recent_calls"] == 0
+
+@pytest.fixture
+def temporary_plan_store(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'plans.db'}", connect_args={"check_same_thread": False})
+    monkeypatch.setattr(routing.plan_store, "session_factory", sessionmaker(bind=engine))
+    monkeypatch.setattr(routing.plan_store, "_schema_ready", False)
+    return routing.plan_store
+
+def test_batch_planning_geocodes_once_and_keeps_order(monkeypatch, temporary_plan_store):
+    from app.services import batch_planning
+
+    geocoded = []
+
+    def fake_geocode_unique(addresses):
+        unique = list(dict.fromkeys(addresses))
+        geocoded.extend(unique)
+        results = {a: (37.7 + 0.001 * i, -122.4) for i, a in enumerate(unique) if not a.startswith("bad")}
+        failures = {a: "ZERO_RESULTS" for a in unique if a.startswith("bad")}
+        return results, failures
+
+    monkeypatch.setattr(batch_planning, "geocode_unique_addresses", fake_geocode_unique)
+    monkeypatch.setattr(batch_planning, "get_oauth_token", lambda: None)
+    monkeypatch.setattr(batch_planning.plan_cache, "_entries", type(batch_planning.plan_cache._entries)())
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [("Local", fake_plan, False)])
+
+    requests = [make_request("1 Test St"), make_request("bad address"), make_request("1 Test St"), make_request("2 Test St")]
+    items = batch_planning.plan_routes_batch(requests, max_parallel=2)
+
+    assert [item.index for item in items] == [0, 1, 2, 3]
+    assert items[0].result.optimization_method == "Local"
+    assert "bad address" in items[1].error
+    assert items[2].result is not None and items[3].result is not None
+    # Every plan can be changed later, including the duplicate tour served from the cache
+    assert len({items[i].result.plan_id for i in (0, 2, 3)} - {None}) == 3
+    assert temporary_plan_store.get(items[2].result.plan_id) == temporary_plan_store.get(items[0].result.plan_id)
+    assert sorted(geocoded) == sorted(["100 Market St", "1 Test St", "bad address", "2 Test St"])
+
+def test_batch_planning_caps_client_parallelism(monkeypatch, temporary_plan_store):
+    from app.services import batch_planning
+
+    pool_sizes = []
+    real_executor = batch_planning.ThreadPoolExecutor
+
+    def recording_executor(max_workers, **kwargs):
+        pool_sizes.append(max_workers)
+        return real_executor(max_workers=max_workers, **kwargs)
+
+    monkeypatch.setattr(batch_planning, "ThreadPoolExecutor", recording_executor)
+    monkeypatch.setattr(batch_planning, "geocode_unique_addresses",
+                        lambda addresses: ({a: (37.7, -122.4) for a in addresses}, {}))
+    monkeypatch.setattr(batch_planning, "get_oauth_token", lambda: None)
+    monkeypatch.setattr(batch_planning.settings, "BATCH_PLAN_MAX_PARALLEL", 2)
+    monkeypatch.setattr(batch_planning.settings, "PLAN_CACHE_ENABLED", False)
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [("Local", fake_plan, False)])
+
+    requests = [make_request(f"{i} Test St") for i in range(6)]
+    items = batch_planning.plan_routes_batch(requests, max_parallel=10_000)
+    assert all(item.result is not None for item in items)
+    assert pool_sizes == [2]
+
+def test_batch_planning_uses_batch_operation_and_falls_back_per_tour(monkeypatch, temporary_plan_store):
+    from app.services import batch_planning
+
+    def fake_geocode_unique(addresses):
+        unique = list(dict.fromkeys(addresses))
+        return {a: (37.7 + 0.001 * i, -122.4) for i, a in enumerate(unique)}, {}
+
+    def fake_batch(params_list, auth_token=None):
+        return [fake_plan(params_list[0]), Exception("no route")]
+
+    monkeypatch.setattr(batch_planning, "geocode_unique_addresses", fake_geocode_unique)
+    monkeypatch.setattr(batch_planning, "get_oauth_token", lambda: "token")
+    monkeypatch.setattr(batch_planning, "batch_optimize_routes", fake_batch)
+    monkeypatch.setattr(batch_planning.settings, "ROUTE_OPTIMIZATION_BATCH_GCS_BUCKET", "plans")
+    monkeypatch.setattr(batch_planning.plan_cache, "_entries", type(batch_planning.plan_cache._entries)())
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [("Local", fake_plan, False)])
+
+    items = batch_planning.plan_routes_batch([make_request("1 Test St"), make_request("2 Test St")])
+
+    assert items[0].result.optimization_method == "Google Route Optimization API"
+    assert items[1].result.optimization_method == "Local"
+    assert all(temporary_plan_store.get(item.result.plan_id) for item in items)
+
+def test_stream_emits_local_first_then_improvements(monkeypatch, make_params):
+    params = make_params()
+
+    async def fake_geocode(houses, start_address, destination_address=None):
+        return params.start_location, None, params.locations
+
+    def slow_schedule(p, deadline=None):
+        plan = fake_plan(p)
+        for stop in plan:
+            stop["departure_time"] = p.global_start_time + timedelta(hours=3)
+        return plan
+
+    async def better_remote(p, timeout_sec=None):
+        await asyncio.sleep(0.05)
+        return fake_plan(p)
+
+    monkeypatch.setattr(routing, "geocode_route_stops_async", fake_geocode)
+    monkeypatch.setattr(routing, "OPTIMIZATION_METHODS", [
+        ("Remote", None, True),
+        ("Local", slow_schedule, False),
+    ])
+    monkeypatch.setattr(routing, "ASYNC_REMOTE_METHODS", {"Remote": better_remote})
+
+    async def collect():
+        houses = [loc["house_data"] for loc in params.locations]
+        return [e async for e in routing.stream_optimized_route_async(
+            houses, "start", global_start_time=params.global_start_time, global_end_time=params.global_end_time)]
+
+    events = asyncio.run(collect())
+    assert [(e.event, e.optimization_method) for e in events] == [
+        ("plan", "Local"), ("plan", "Remote"), ("done", "Remote")
+    ]
+    assert events[1].cost < events[0].cost
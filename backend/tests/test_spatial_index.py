@@ -0,0 +1,65 @@
+"""
+Tests for the spatial index (no network needed)
+"""
+import random
+
+from app.services.distance import haversine_km
+from app.services.spatial_index import SpatialIndex
+
+def random_points(count, seed=3):
+    rng = random.Random(seed)
+    return [(37.6 + rng.random() * 0.4, -122.6 + rng.random() * 0.4) for _ in range(count)]
+
+def brute_force(points, lat, lng, alive):
+    return sorted((haversine_km(lat, lng, p[0], p[1]), i) for i, p in enumerate(points) if i in alive)
+
+def test_knn_and_radius_match_brute_force():
+    points = random_points(1000)
+    index = SpatialIndex(points)
+    alive = set(range(len(points)))
+    for lat, lng in random_points(20, seed=9):
+        expected = brute_force(points, lat, lng, alive)
+        found = index.knn(lat, lng, 5)
+        assert [i for i, _ in found] == [i for _, i in expected[:5]]
+        assert abs(found[0][1] - expected[0][0]) < 1e-6
+
+        within = index.radius(lat, lng, 2.0)
+        assert [i for i, _ in within] == [i for d, i in expected if d <= 2.0]
+
+def test_removed_points_are_never_returned():
+    points = random_points(300)
+    index = SpatialIndex(points, ids=[f"stop-{i}" for i in range(300)])
+    lat, lng = points[0]
+    assert index.nearest(lat, lng) == "stop-0"
+    for i in range(0, 300, 2):
+        index.remove(f"stop-{i}")
+
+    assert len(index) == 150 and "stop-0" not in index
+    assert all(int(item.split("-")[1]) % 2 == 1 for item, _ in index.knn(lat, lng, 150))
+    assert len(index.knn(lat, lng, 500)) == 150
+
+def test_greedy_with_spatial_index_visits_nearest_stop_each_step(monkeypatch, make_params):
+    from app.core.config import settings
+    from app.services import greedy_optimizer
+
+    params = make_params(60)
+    points = random_points(60)
+    for loc, (lat, lng) in zip(params.locations, points):
+        loc["lat"], loc["lng"] = lat, lng
+    monkeypatch.setattr(settings, "GOOGLE_MAPS_API_KEY", None)
+    monkeypatch.setattr(settings, "SPATIAL_INDEX_MIN_STOPS", 10)
+
+    plan = greedy_optimizer.optimize_route(params)
+    order = [stop["original_order"] for stop in plan]
+    assert sorted(order) == list(range(60))
+
+    current = (params.start_location["lat"], params.start_location["lng"])
+    alive = set(range(60))
+    for stop in order:
+        assert stop == brute_force(points, current[0], current[1], alive)[0][1]
+        alive.remove(stop)
+        current = points[stop]
+
+    # The matrix path breaks ties at the minimum leg time by distance, so it agrees with the index
+    monkeypatch.setattr(settings, "SPATIAL_INDEX_MIN_STOPS", 1000)
+    assert [stop["original_order"] for stop in greedy_optimizer.optimize_route(params)] == order
@@ -0,0 +1,193 @@
+"""
+Tests for the travel-time matrix, its persistent leg cache and the calibrated travel model (no network needed)
+"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.services import circuit_breaker, travel_matrix, travel_model
+from app.services.distance import haversine_km_matrix
+from app.services.travel_matrix import TravelLegCache, get_travel_matrix, haversine_travel_sec
+
+POINTS = [{"lat": 37.77, "lng": -122.42}, {"lat": 37.78, "lng": -122.41}, {"lat": 37.79, "lng": -122.40}]
+
+def use_stand_in_provider(monkeypatch, tmp_path, fail=False):
+    """Route the Google provider to a local stand-in and the leg cache to a temporary database"""
+    calls = []
+
+    def fake_fetch(origins, destinations, departure_ts=None, timeout_sec=None):
+        calls.append((len(origins), len(destinations)))
+        if fail:
+            raise Exception("quota exceeded")
+        return {(o, d): (100 * (o + 1) + d, 1000) for o in range(len(origins)) for d in range(len(destinations))}
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'legs.db'}")
+    monkeypatch.setattr(travel_matrix, "travel_leg_cache", TravelLegCache(session_factory=sessionmaker(bind=engine)))
+    monkeypatch.setattr(travel_matrix, "fetch_route_matrix", fake_fetch)
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(settings, "GOOGLE_MAPS_API_KEY", "test-key")
+    return calls
+
+def test_legs_are_fetched_in_bulk_once_and_reused(monkeypatch, tmp_path):
+    calls = use_stand_in_provider(monkeypatch, tmp_path)
+    departure = 1_900_000_000
+
+    first = get_travel_matrix(POINTS, departure, provider="google")
+    # Same neighborhood an hour-bucket later in the week, with ~1 m of geocoding jitter
+    jittered = [{"lat": p["lat"] + 0.000001, "lng": p["lng"]} for p in POINTS]
+    second = get_travel_matrix(jittered, departure + 600, provider="google")
+
+    assert calls == [(3, 3)]
+    assert first.tolist() == second.tolist()
+    assert first.diagonal().tolist() == [0, 0, 0]
+    assert travel_matrix.travel_leg_cache.stats()["hits"] == 6
+
+    get_travel_matrix(POINTS, departure + 3 * 3600, provider="google")
+    assert len(calls) == 2
+
+def test_only_missing_rows_and_columns_are_fetched(monkeypatch, tmp_path):
+    calls = use_stand_in_provider(monkeypatch, tmp_path)
+    get_travel_matrix(POINTS, 1_900_000_000, provider="google")
+    matrix = get_travel_matrix(POINTS + [{"lat": 37.80, "lng": -122.39}], 1_900_000_000, provider="google")
+
+    # The new stop's row, then the cached stops' column to it; no cached leg is requested again
+    assert calls[0] == (3, 3) and sorted(calls[1:]) == [(1, 4), (3, 1)]
+    assert matrix[3, 0] == 100 and matrix[0, 3] == 100
+
+def test_provider_calls_stop_at_the_deadline(monkeypatch, tmp_path):
+    import time
+
+    calls = use_stand_in_provider(monkeypatch, tmp_path)
+    matrix = get_travel_matrix(POINTS, 1_900_000_000, provider="google", deadline=time.monotonic() - 1)
+    assert calls == []
+    assert matrix.tolist() == travel_matrix.haversine_travel_matrix(
+        [travel_matrix.quantize_point(p["lat"], p["lng"]) for p in POINTS], 1_900_000_000
+    ).tolist()
+
+def test_local_solvers_use_estimates_by_default(monkeypatch, tmp_path):
+    calls = use_stand_in_provider(monkeypatch, tmp_path)
+    monkeypatch.setattr(settings, "TRAVEL_MATRIX_PROVIDER", type(settings)().TRAVEL_MATRIX_PROVIDER)
+    get_travel_matrix(POINTS, 1_900_000_000)
+    assert calls == []
+
+def test_provider_failure_falls_back_to_haversine_without_caching(monkeypatch, tmp_path):
+    calls = use_stand_in_provider(monkeypatch, tmp_path, fail=True)
+
+    matrix = get_travel_matrix(POINTS[:2], 1_900_000_000, provider="google")
+    assert matrix[0][1] == haversine_travel_sec((37.77, -122.42), (37.78, -122.41))
+
+    get_travel_matrix(POINTS[:2], 1_900_000_000, provider="google")
+    assert len(calls) == 2
+
+def test_failing_provider_is_skipped_once_its_circuit_opens(monkeypatch, tmp_path):
+    calls = use_stand_in_provider(monkeypatch, tmp_path, fail=True)
+    monkeypatch.setattr(settings, "CIRCUIT_BREAKER_CONSECUTIVE_FAILURES", 2)
+
+    for _ in range(4):
+        matrix = get_travel_matrix(POINTS[:2], 1_900_000_000, provider="google")
+    assert len(calls) == 2
+    assert matrix[0][1] == haversine_travel_sec((37.77, -122.42), (37.78, -122.41))
+    assert circuit_breaker.circuit_breaker_states()[travel_matrix.MATRIX_BREAKER]["state"] == circuit_breaker.OPEN
+
+def test_large_matrices_use_estimates_instead_of_the_provider(monkeypatch, tmp_path):
+    calls = use_stand_in_provider(monkeypatch, tmp_path)
+    monkeypatch.setattr(settings, "TRAVEL_MATRIX_MAX_FETCH_POINTS", 2)
+
+    matrix = get_travel_matrix(POINTS, 1_900_000_000, provider="google")
+    assert calls == []
+    assert matrix.tolist() == travel_matrix.haversine_travel_matrix(
+        [travel_matrix.quantize_point(p["lat"], p["lng"]) for p in POINTS], 1_900_000_000
+    ).tolist()
+
+def test_greedy_orders_stops_by_matrix_travel_time(monkeypatch, make_params):
+    from app.services import greedy_optimizer
+
+    params = make_params(3)
+    # Stop 2 is closest in travel time even though stop 0 is closest in distance
+    matrix = [
+        [0, 900, 800, 100],
+        [900, 0, 100, 900],
+        [800, 100, 0, 900],
+        [100, 900, 100, 0],
+    ]
+    monkeypatch.setattr(greedy_optimizer, "get_travel_matrix", lambda points, departure_ts=None, deadline=None: matrix)
+    plan = greedy_optimizer.optimize_route(params)
+    assert [stop["original_order"] for stop in plan] == [2, 1, 0]
+
+def test_haversine_matrix_matches_scalar_estimate():
+    points = [(37.77 + 0.01 * i, -122.42 + 0.02 * i) for i in range(6)] + [(37.77, -122.42)]
+    matrix = travel_matrix.haversine_travel_matrix(points)
+    assert matrix.shape == (7, 7)
+    for i in range(7):
+        for j in range(7):
+            expected = 0 if points[i] == points[j] else haversine_travel_sec(points[i], points[j])
+            assert abs(int(matrix[i, j]) - expected) <= 1
+
+def observed_legs(origin, hour, intercept, pace, count=30):
+    """Legs leaving origin at the given UTC hour that take intercept + pace * km seconds"""
+    from app.services.distance import haversine_km
+
+    day = 1_900_000_000 - 1_900_000_000 % 86400
+    legs = []
+    for i in range(count):
+        destination = (origin[0] + 0.002 * (i + 1), origin[1] + 0.003 * (i % 5))
+        km = haversine_km(origin[0], origin[1], destination[0], destination[1])
+        legs.append((origin, destination, day + hour * 3600, intercept + pace * km))
+    return legs, day
+
+def test_travel_model_learns_per_cell_and_time_of_day(isolated_travel_model):
+    downtown = (37.7915, -122.4015)
+    rush_legs, day = observed_legs(downtown, 17, intercept=120, pace=240)
+    night_legs, _ = observed_legs(downtown, 3, intercept=30, pace=75)
+    isolated_travel_model.observe(rush_legs + night_legs)
+
+    points = [downtown, (37.7990, -122.3950)]
+    km = haversine_km_matrix(points)[0, 1]
+    rush = travel_matrix.haversine_travel_matrix(points, day + 17 * 3600 + 600)
+    night = travel_matrix.haversine_travel_matrix(points, day + 3 * 3600)
+    assert abs(rush[0, 1] - (120 + 240 * km)) <= 2
+    assert abs(night[0, 1] - (30 + 75 * km)) <= 2
+
+    # An unseen region falls back to the all-regions table for the same time of day
+    elsewhere = [(40.7128, -74.0060), (40.7200, -74.0000)]
+    km = haversine_km_matrix(elsewhere)[0, 1]
+    assert abs(travel_matrix.haversine_travel_matrix(elsewhere, day + 17 * 3600)[0, 1] - (120 + 240 * km)) <= 2
+
+    # Lookup tables are persisted and reloaded
+    reloaded = travel_model.TravelTimeModel(session_factory=isolated_travel_model.session_factory)
+    assert reloaded.coefficients(travel_model.region_cell(*downtown), travel_model.time_bucket(day + 17 * 3600)) == pytest.approx((120, 240))
+
+def test_travel_model_uses_flat_default_until_enough_legs(isolated_travel_model):
+    legs, day = observed_legs((37.7915, -122.4015), 17, intercept=120, pace=240, count=5)
+    assert isolated_travel_model.observe(legs + [((37.79, -122.40), (37.79, -122.40), day, 60)]) == 5
+    points = [(37.7915, -122.4015), (37.8500, -122.4015)]
+    km = haversine_km_matrix(points)[0, 1]
+    assert travel_matrix.haversine_travel_matrix(points, day)[0, 1] == int(km / travel_model.DEFAULT_SPEED_KMH * 3600)
+
+def test_routes_api_and_matrix_legs_feed_the_travel_model(monkeypatch, tmp_path, isolated_travel_model, make_params):
+    from app.services.google import routes_api
+
+    params = make_params(3)
+    raw = {"routes": [{"optimizedIntermediateWaypointIndex": [0, 1, 2], "legs": [{"duration": "300s"}] * 4}]}
+    for i, loc in enumerate(params.locations):
+        loc["lat"], loc["lng"] = 37.78 + 0.01 * i, -122.41
+    params.start_location.update({"lat": 37.77, "lng": -122.42})
+    routes_api.process_response(raw, params.locations, int(params.global_start_time.timestamp()), params.start_location)
+    travel_model.flush_observations()
+    assert isolated_travel_model.stats()["observed_legs"] == 3
+
+    use_stand_in_provider(monkeypatch, tmp_path)
+    get_travel_matrix(POINTS, 1_900_000_000, provider="google")
+    travel_model.flush_observations()
+    assert isolated_travel_model.stats()["observed_legs"] == 9
+
+def test_observed_legs_are_recorded_off_the_calling_thread(monkeypatch, isolated_travel_model):
+    import threading
+
+    recorded_on = []
+    monkeypatch.setattr(isolated_travel_model, "observe", lambda legs: recorded_on.append(threading.current_thread()))
+    legs, _ = observed_legs((37.7915, -122.4015), 17, intercept=120, pace=240, count=3)
+    travel_model.observe_legs(iter(legs))
+    travel_model.flush_observations()
+    assert recorded_on and recorded_on[0] is not threading.current_thread()